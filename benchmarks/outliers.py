@@ -0,0 +1,62 @@
+"""Time the outlier detection over synthetic datasets of increasing size.
+
+Usage::
+
+    python benchmarks/outliers.py --frames 10000 100000 --individuals 3 --bodyparts 12
+"""
+
+import argparse
+import timeit
+from typing import List, Optional
+
+import numpy as np
+
+from dlclabel import analysis, misc
+
+
+def make_dataset(n_frames: int, n_individuals: int, n_bodyparts: int, seed: int = 0):
+    config = {
+        "scorer": "bench",
+        "multianimalproject": True,
+        "individuals": [f"animal{i}" for i in range(n_individuals)],
+        "multianimalbodyparts": [f"bp{i}" for i in range(n_bodyparts)],
+        "uniquebodyparts": [],
+    }
+    header = misc.DLCHeader.from_config(config)
+    rng = np.random.default_rng(seed)
+    coords = rng.random((n_individuals, n_bodyparts, 2)) * 500
+    coords = coords + rng.normal(0, 2, (n_frames, n_individuals, n_bodyparts, 2))
+    ids, labels = np.meshgrid(
+        np.arange(n_individuals), np.arange(n_bodyparts), indexing="ij"
+    )
+    data = np.c_[np.repeat(np.arange(n_frames), ids.size), coords.reshape(-1, 2)]
+    properties = {
+        "label": np.tile(labels.ravel(), n_frames),
+        "id": np.tile(ids.ravel(), n_frames),
+    }
+    return data, properties, header
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--individuals", type=int, default=3)
+    parser.add_argument("--bodyparts", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'frames':>8}{'points':>12}{'time (s)':>10}{'suspects':>10}")
+    for n_frames in args.frames:
+        data, properties, header = make_dataset(
+            n_frames, args.individuals, args.bodyparts
+        )
+        df = analysis.find_outliers(data, properties, header)
+        time = timeit.timeit(
+            lambda: analysis.find_outliers(data, properties, header),
+            number=args.repeat,
+        )
+        print(f"{n_frames:>8}{len(data):>12}{time / args.repeat:>10.2f}{len(df):>10}")
+
+
+if __name__ == "__main__":
+    main()
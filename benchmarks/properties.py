@@ -0,0 +1,75 @@
+"""Compare the memory and speed of string and categorical keypoint properties.
+
+Labels and ids used to be passed to napari as lists of strings, which it
+stores as fixed-width unicode arrays; they are now stored as integer codes
+into the header's bodyparts and individuals.
+
+Usage::
+
+    python benchmarks/properties.py --points 1000000 2000000
+"""
+
+import argparse
+import timeit
+from typing import List, Optional
+
+import numpy as np
+
+from dlclabel import io, misc
+
+
+def make_properties(n_points: int, n_individuals: int, n_bodyparts: int):
+    config = {
+        "scorer": "bench",
+        "multianimalproject": True,
+        "individuals": [f"individual{i}" for i in range(n_individuals)],
+        "multianimalbodyparts": [f"bodypart_{i}" for i in range(n_bodyparts)],
+        "uniquebodyparts": [],
+    }
+    header = misc.DLCHeader.from_config(config)
+    ids, labels = zip(*header.form_individual_bodypart_pairs())
+    reps = -(-n_points // len(labels))
+    labels = np.tile(labels, reps)[:n_points]
+    ids = np.tile(ids, reps)[:n_points]
+    strings = {"label": np.asarray(list(labels)), "id": np.asarray(list(ids))}
+    codes = io._populate_metadata(header, labels=labels, ids=ids)["properties"]
+    return header, strings, codes
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--individuals", type=int, default=5)
+    parser.add_argument("--bodyparts", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'points':>10}{'strings (MB)':>14}{'codes (MB)':>12}"
+        f"{'mask strings (ms)':>19}{'mask codes (ms)':>17}"
+    )
+    for n_points in args.points:
+        header, strings, codes = make_properties(
+            n_points, args.individuals, args.bodyparts
+        )
+        label, id_ = header.bodyparts[-1], header.individuals[-1]
+        label_code, id_code = len(header.bodyparts) - 1, len(header.individuals) - 1
+        mb_strings = sum(strings[k].nbytes for k in ("label", "id")) / 2**20
+        mb_codes = sum(codes[k].nbytes for k in ("label", "id")) / 2**20
+        t_strings = timeit.timeit(
+            lambda: (strings["label"] == label) & (strings["id"] == id_),
+            number=args.repeat,
+        )
+        t_codes = timeit.timeit(
+            lambda: (codes["label"] == label_code) & (codes["id"] == id_code),
+            number=args.repeat,
+        )
+        print(
+            f"{n_points:>10}{mb_strings:>14.1f}{mb_codes:>12.1f}"
+            f"{t_strings / args.repeat * 1000:>19.2f}"
+            f"{t_codes / args.repeat * 1000:>17.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
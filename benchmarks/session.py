@@ -0,0 +1,283 @@
+"""Replay annotation sessions against a DLCViewer and report latencies.
+
+Interaction traces are JSON lines files, one action per line, e.g.::
+
+    {"action": "click", "coord": [120.5, 301.2]}
+    {"action": "step", "frame": 42}
+    {"action": "mode"}
+    {"action": "copy"}
+    {"action": "paste"}
+    {"action": "save"}
+
+Coordinates are (y, x) in image space; clicks are added to the current frame.
+Without a trace file, a synthetic one is generated from a seeded RNG.
+
+Usage::
+
+    python benchmarks/session.py --frames 5000 --actions 20000 --output report.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import dask.array as da
+import imageio
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from dlclabel import io, misc
+from dlclabel.gui import DLCViewer
+from dlclabel.layers import KeyPoints
+
+ACTIONS = "click", "step", "mode", "copy", "paste", "save"
+# Relative frequencies of the synthetic actions, loosely modeled on
+# recorded labeling sessions: mostly clicks and frame steps.
+_ACTION_WEIGHTS = 0.55, 0.35, 0.02, 0.03, 0.03, 0.02
+
+
+def make_synthetic_trace(
+    n_actions: int,
+    n_frames: int,
+    image_shape=(480, 640),
+    seed: int = 0,
+) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(ACTIONS, size=n_actions, p=_ACTION_WEIGHTS)
+    frame = 0
+    trace = []
+    for kind in kinds:
+        action = {"action": str(kind)}
+        if kind == "click":
+            action["coord"] = (rng.random(2) * image_shape).tolist()
+        elif kind == "step":
+            # Annotators mostly step to the next frame, sometimes jump.
+            if rng.random() < 0.9:
+                frame = (frame + 1) % n_frames
+            else:
+                frame = int(rng.integers(n_frames))
+            action["frame"] = frame
+        trace.append(action)
+    return trace
+
+
+def load_trace(filename: str) -> List[Dict]:
+    with open(filename) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def dump_trace(trace: Iterable[Dict], filename: str):
+    with open(filename, "w") as file:
+        for action in trace:
+            file.write(json.dumps(action) + "\n")
+
+
+def make_session(
+    n_frames: int,
+    n_individuals: int,
+    n_bodyparts: int,
+    root: str,
+    image_shape=(480, 640),
+    fill: float = 0.5,
+    seed: int = 0,
+):
+    """Build a viewer holding a lazy image stack and a prefilled KeyPoints layer.
+
+    A fraction ``fill`` of all frames is prelabeled, so that the session
+    starts on a large layer as when refining machine labels. Image files
+    are written under ``root`` too, as the viewer reads them, e.g., to
+    make thumbnails; they all hold the same blank frame, encoded once.
+    """
+    config = {
+        "scorer": "bench",
+        "multianimalproject": n_individuals > 1,
+        "individuals": [f"animal{i}" for i in range(n_individuals)],
+        "multianimalbodyparts": [f"bp{i}" for i in range(n_bodyparts)],
+        "uniquebodyparts": [],
+        "bodyparts": [f"bp{i}" for i in range(n_bodyparts)],
+    }
+    header = misc.DLCHeader.from_config(config)
+    folder = os.path.join("labeled-data", "bench")
+    os.makedirs(os.path.join(root, folder), exist_ok=True)
+    paths = [os.path.join(folder, f"img{i:06d}.png") for i in range(n_frames)]
+    with BytesIO() as buffer:
+        imageio.imwrite(buffer, np.zeros(image_shape, dtype=np.uint8), format="png")
+        blank = buffer.getvalue()
+    for path in paths:
+        with open(os.path.join(root, path), "wb") as file:
+            file.write(blank)
+
+    viewer = DLCViewer()
+    images = da.zeros(
+        (n_frames, *image_shape), dtype=np.uint8, chunks=(1, *image_shape)
+    )
+    viewer.add_image(
+        images,
+        name="bench",
+        metadata={"paths": paths, "root": os.path.join(root, folder)},
+    )
+
+    rng = np.random.default_rng(seed)
+    pairs = header.form_individual_bodypart_pairs()
+    frames = np.flatnonzero(rng.random(n_frames) < fill)
+    n_points = len(frames) * len(pairs)
+    data = np.empty((n_points, 3))
+    data[:, 0] = np.repeat(frames, len(pairs))
+    data[:, 1:] = rng.random((n_points, 2)) * image_shape
+    ids, labels = zip(*pairs) if pairs else ((), ())
+    metadata = io._populate_metadata(
+        header,
+        labels=np.tile(labels, len(frames)),
+        ids=np.tile(ids, len(frames)),
+        likelihood=rng.random(n_points),
+        paths=paths,
+    )
+    metadata["name"] = "CollectedData_bench"
+    metadata["metadata"]["root"] = root
+    layer = viewer.add_points(data, **metadata)
+    return viewer, layer
+
+
+def _rss() -> int:
+    """Resident set size of the process, in bytes."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Fall back to the peak RSS where procfs is unavailable;
+        # ru_maxrss is reported in kilobytes on Linux but in bytes on macOS.
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+def replay(
+    viewer: DLCViewer,
+    layer: KeyPoints,
+    trace: Iterable[Dict],
+    sample_every: int = 100,
+) -> Dict:
+    app = QApplication.instance()
+    timings = defaultdict(list)
+    memory = [(0, _rss())]
+    for n, action in enumerate(trace):
+        kind = action["action"]
+        start = time.perf_counter()
+        if kind == "click":
+            frame = viewer.dims.current_step[0]
+            layer.add([frame, *action["coord"]])
+        elif kind == "step":
+            viewer.dims.set_current_step(0, action["frame"])
+        elif kind == "mode":
+            layer.cycle_through_label_modes()
+        elif kind == "copy":
+            layer.selected_data = set(np.flatnonzero(layer.current_mask))
+            layer._copy_data()
+        elif kind == "paste":
+            layer._paste_data()
+        elif kind == "save":
+            io.write_hdf("", layer.data, layer._get_state())
+        else:
+            raise ValueError(f"Unknown action '{kind}'.")
+        # Let Qt process the resulting events and repaint, as it would
+        # between two user interactions.
+        app.processEvents()
+        timings[kind].append(time.perf_counter() - start)
+        if (n + 1) % sample_every == 0:
+            memory.append((n + 1, _rss()))
+    return {"timings": dict(timings), "memory": memory}
+
+
+def summarize(results: Dict) -> Dict:
+    report = {"latency_ms": {}, "memory": {}}
+    for kind, times in results["timings"].items():
+        times = np.asarray(times) * 1000
+        p50, p95, p99 = np.percentile(times, [50, 95, 99])
+        report["latency_ms"][kind] = {
+            "n": len(times),
+            "p50": p50,
+            "p95": p95,
+            "p99": p99,
+            "max": times.max(),
+        }
+    memory = np.asarray(results["memory"], dtype=float)
+    if len(memory) > 1:
+        # A least-squares slope is less sensitive than the end-to-end
+        # difference to one-off allocations (e.g., the first save).
+        slope = np.polyfit(memory[:, 0], memory[:, 1], 1)[0]
+        report["memory"] = {
+            "rss_start_mb": memory[0, 1] / 2**20,
+            "rss_end_mb": memory[-1, 1] / 2**20,
+            "rss_peak_mb": memory[:, 1].max() / 2**20,
+            "rss_growth_kb_per_1000_actions": slope * 1000 / 2**10,
+        }
+    return report
+
+
+def format_report(report: Dict) -> str:
+    lines = [f"{'action':<8}{'n':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for kind, stats in sorted(report["latency_ms"].items()):
+        lines.append(
+            f"{kind:<8}{stats['n']:>8}{stats['p50']:>10.2f}{stats['p95']:>10.2f}"
+            f"{stats['p99']:>10.2f}{stats['max']:>10.2f}"
+        )
+    for key, val in report["memory"].items():
+        lines.append(f"{key}: {val:.2f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--individuals", type=int, default=1)
+    parser.add_argument("--bodyparts", type=int, default=20)
+    parser.add_argument(
+        "--fill", type=float, default=0.5, help="Fraction of frames prelabeled."
+    )
+    parser.add_argument(
+        "--actions", type=int, default=2000, help="Length of the synthetic trace."
+    )
+    parser.add_argument("--trace", help="JSON lines trace to replay.")
+    parser.add_argument("--dump-trace", help="Write the replayed trace to this file.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = make_synthetic_trace(args.actions, args.frames, seed=args.seed)
+    if args.dump_trace:
+        dump_trace(trace, args.dump_trace)
+
+    with tempfile.TemporaryDirectory() as root:
+        viewer, layer = make_session(
+            args.frames,
+            args.individuals,
+            args.bodyparts,
+            root,
+            fill=args.fill,
+            seed=args.seed,
+        )
+        results = replay(viewer, layer, trace)
+        viewer.close()
+    app.processEvents()
+
+    report = summarize(results)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare the scatter-based wide-format conversion of write_hdf to stack/unstack.
+
+Usage::
+
+    python benchmarks/write_hdf.py --frames 1000 10000 --individuals 3 --bodyparts 20
+"""
+
+import argparse
+import timeit
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from dlclabel import io, misc
+
+
+def stack_unstack(
+    data: np.ndarray, properties: Dict[str, np.ndarray], header: misc.DLCHeader
+) -> pd.DataFrame:
+    """Former conversion of write_hdf, kept as a reference."""
+    temp = pd.DataFrame(data[:, -1:0:-1], columns=["x", "y"])
+    temp["bodyparts"] = np.asarray(header.bodyparts)[properties["label"]]
+    temp["individuals"] = np.asarray(header.individuals)[properties["id"]]
+    temp["inds"] = data[:, 0].astype(int)
+    temp["likelihood"] = properties["likelihood"]
+    temp["scorer"] = header.scorer
+    df = temp.set_index(["scorer", "individuals", "bodyparts", "inds"]).stack()
+    df.index = df.index.set_names("coords", level=-1)
+    df = df.unstack(["scorer", "individuals", "bodyparts", "coords"])
+    df.index.name = None
+    return df.reindex(header.columns, axis=1)
+
+
+def make_points(n_frames: int, n_individuals: int, n_bodyparts: int, seed: int = 0):
+    config = {
+        "scorer": "bench",
+        "multianimalproject": True,
+        "individuals": [f"animal{i}" for i in range(n_individuals)],
+        "multianimalbodyparts": [f"bp{i}" for i in range(n_bodyparts)],
+        "uniquebodyparts": [],
+    }
+    header = misc.DLCHeader.from_config(config)
+    ids, labels = zip(*header.form_individual_bodypart_pairs())
+    rng = np.random.default_rng(seed)
+    n_points = n_frames * len(labels)
+    data = np.empty((n_points, 3))
+    data[:, 0] = np.repeat(np.arange(n_frames), len(labels))
+    data[:, 1:] = rng.random((n_points, 2)) * 500
+    properties = io._populate_metadata(
+        header,
+        labels=np.tile(labels, n_frames),
+        ids=np.tile(ids, n_frames),
+        likelihood=rng.random(n_points),
+    )["properties"]
+    # Leave some keypoints unlabeled, as in real data.
+    keep = rng.random(n_points) > 0.1
+    return data[keep], {k: v[keep] for k, v in properties.items()}, header
+
+
+def peak_memory(func, *args) -> float:
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--individuals", type=int, default=3)
+    parser.add_argument("--bodyparts", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'frames':>8}{'stack (ms)':>12}{'scatter (ms)':>14}"
+        f"{'stack (MB)':>12}{'scatter (MB)':>14}"
+    )
+    for n_frames in args.frames:
+        points = make_points(n_frames, args.individuals, args.bodyparts)
+        pd.testing.assert_frame_equal(
+            stack_unstack(*points), io._points_to_dataframe(*points)
+        )
+        times = [
+            timeit.timeit(lambda: func(*points), number=args.repeat) / args.repeat
+            for func in (stack_unstack, io._points_to_dataframe)
+        ]
+        memory = [
+            peak_memory(func, *points)
+            for func in (stack_unstack, io._points_to_dataframe)
+        ]
+        print(
+            f"{n_frames:>8}{times[0] * 1000:>12.1f}{times[1] * 1000:>14.1f}"
+            f"{memory[0]:>12.1f}{memory[1]:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
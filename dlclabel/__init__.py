@@ -1 +1,8 @@
-from .gui import show
+def __getattr__(name):
+    # The GUI, napari and Qt are only imported once needed, so that
+    # worker processes importing e.g. dlclabel.flow stay light.
+    if name == "show":
+        from .gui import show
+
+        return show
+    raise AttributeError(f"module 'dlclabel' has no attribute '{name}'")
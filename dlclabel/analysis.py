@@ -0,0 +1,308 @@
+from itertools import combinations
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dlclabel.misc import DLCHeader, to_os_dir_sep
+from dlclabel.skeleton import bone_table
+
+
+# Labeling state of a frame
+UNLABELED, LABELED, LOW_CONFIDENCE = 0, 1, 2
+
+
+def frame_states(frames: np.ndarray, valid: np.ndarray, n_frames: int) -> np.ndarray:
+    """Return the labeling state of every frame from the frames of its points.
+
+    A frame is labeled if it holds any keypoint, and of low confidence if
+    any of them is not ``valid``, i.e., has a likelihood below pcutoff.
+    """
+    frames = frames.astype(int)
+    keep = frames < n_frames
+    frames, valid = frames[keep], np.asarray(valid, dtype=bool)[keep]
+    n_points = np.bincount(frames, minlength=n_frames)
+    n_invalid = np.bincount(frames[~valid], minlength=n_frames)
+    states = np.where(n_points > 0, LABELED, UNLABELED).astype(np.int8)
+    states[n_invalid > 0] = LOW_CONFIDENCE
+    return states
+
+
+def dense_coordinates(
+    data: np.ndarray, properties: Dict[str, np.ndarray], header: DLCHeader
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Scatter keypoints into a (frames, individuals, bodyparts, 2) array.
+
+    Missing keypoints are NaN.
+
+    Returns
+    -------
+    frames : np.ndarray
+        Sorted indices of the annotated frames.
+    coords : np.ndarray
+        Their y, x coordinates.
+    """
+    frames, rows = np.unique(data[:, 0].astype(int), return_inverse=True)
+    shape = len(frames), len(header.individuals), len(header.bodyparts), 2
+    coords = np.full(shape, np.nan)
+    coords[rows, properties["id"], properties["label"]] = data[:, 1:]
+    return frames, coords
+
+
+def _pair_distances(
+    coords: np.ndarray, ids: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    diff = coords[:, ids, ends[:, 0]] - coords[:, ids, ends[:, 1]]
+    return np.sqrt((diff**2).sum(axis=-1))
+
+
+def _jumps(
+    coords: np.ndarray, frames: np.ndarray, chunk: slice
+) -> Tuple[np.ndarray, slice]:
+    """Return the displacements per frame of the keypoints in a chunk of frames.
+
+    The chunk overlaps the previous one by a frame, so that the jump into
+    its first frame is included. Also returns the frames they were made to.
+    """
+    start = max(chunk.start - 1, 0)
+    stop = min(chunk.stop, len(frames))
+    dist = np.sqrt((np.diff(coords[start:stop], axis=0) ** 2).sum(axis=-1))
+    # Displacements across unannotated frames are spread over them
+    dist /= np.diff(frames[start:stop])[:, None, None]
+    return dist.reshape(len(dist), -1), slice(start + 1, stop)
+
+
+def _zscores(values: np.ndarray, count, total, total_sq) -> np.ndarray:
+    mean = total / np.maximum(count, 1)
+    std = np.sqrt(np.maximum(total_sq / np.maximum(count, 1) - mean**2, 0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.abs(values - mean) / std
+    # Constant or missing values cannot be outliers
+    z[~np.isfinite(z)] = 0
+    return z
+
+
+def find_outliers(
+    data: np.ndarray,
+    properties: Dict[str, np.ndarray],
+    header: DLCHeader,
+    skeleton: Optional[Sequence[Sequence[str]]] = None,
+    threshold: float = 5.0,
+    chunk_size: int = 10000,
+) -> pd.DataFrame:
+    """Rank the frames whose keypoints look mislabeled.
+
+    Two scores are computed for every frame: the z-score of the distances
+    between bodyparts of a same individual (the bones of ``skeleton`` if
+    given, all pairs of bodyparts otherwise), and the z-score of the
+    displacement of every keypoint since the previous annotated frame,
+    divided by the number of frames between them.
+    Statistics are computed over the whole dataset, one chunk of frames
+    at a time to bound memory.
+
+    ``data`` and ``properties`` are those of a KeyPoints layer, e.g.,
+    as returned by :func:`dlclabel.io.read_hdf`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The frames scoring above ``threshold``, best first, with the
+        metric, individual and bodyparts responsible for their score.
+        As every keypoint is scored, the highest of many z-scores is kept
+        per frame, hence a default threshold above the usual 3.
+    """
+    columns = ["frame", "score", "metric", "individual", "bodyparts"]
+    if not len(data):
+        return pd.DataFrame(columns=columns)
+    frames, coords = dense_coordinates(data, properties, header)
+    n_ids = len(header.individuals)
+    if skeleton is None:
+        skeleton = list(combinations(header.bodyparts, 2))
+    keys = bone_table(header, skeleton)
+    ids, ends = keys[:, 0] % n_ids, keys // n_ids
+
+    chunks = [slice(i, i + chunk_size) for i in range(0, len(frames), chunk_size)]
+    # First pass: accumulate the statistics of every pair distance
+    count = np.zeros(len(keys))
+    total = np.zeros(len(keys))
+    total_sq = np.zeros(len(keys))
+    for chunk in chunks:
+        dist = _pair_distances(coords[chunk], ids, ends)
+        valid = ~np.isnan(dist)
+        dist[~valid] = 0
+        count += valid.sum(axis=0)
+        total += dist.sum(axis=0)
+        total_sq += (dist**2).sum(axis=0)
+    # Second pass: score the frames
+    pair_scores = np.zeros(len(frames))
+    pair_culprits = np.zeros(len(frames), dtype=int)
+    for chunk in chunks:
+        dist = _pair_distances(coords[chunk], ids, ends)
+        z = _zscores(dist, count, total, total_sq)
+        if z.shape[1]:
+            pair_culprits[chunk] = z.argmax(axis=1)
+            pair_scores[chunk] = z.max(axis=1)
+
+    # Same two passes over the jumps between consecutive annotated frames
+    n_keypoints = coords.shape[1] * coords.shape[2]
+    count = np.zeros(n_keypoints)
+    total = np.zeros(n_keypoints)
+    total_sq = np.zeros(n_keypoints)
+    for chunk in chunks:
+        jumps, _ = _jumps(coords, frames, chunk)
+        valid = ~np.isnan(jumps)
+        jumps[~valid] = 0
+        count += valid.sum(axis=0)
+        total += jumps.sum(axis=0)
+        total_sq += (jumps**2).sum(axis=0)
+    jump_scores = np.zeros(len(frames))
+    jump_culprits = np.zeros(len(frames), dtype=int)
+    for chunk in chunks:
+        jumps, rows = _jumps(coords, frames, chunk)
+        z = _zscores(jumps, count, total, total_sq)
+        if z.size:
+            jump_culprits[rows] = z.argmax(axis=1)
+            jump_scores[rows] = z.max(axis=1)
+
+    is_jump = jump_scores > pair_scores
+    scores = np.maximum(pair_scores, jump_scores)
+    jump_ids, jump_bodyparts = np.divmod(jump_culprits, len(header.bodyparts))
+    bodyparts = np.asarray(header.bodyparts)
+    if len(keys):
+        pair_ids = ids[pair_culprits]
+        pair_names = np.char.add(
+            np.char.add(bodyparts[ends[pair_culprits, 0]], "-"),
+            bodyparts[ends[pair_culprits, 1]],
+        )
+    else:
+        pair_ids = np.zeros(len(frames), dtype=int)
+        pair_names = np.full(len(frames), "")
+    individuals = np.asarray(header.individuals)[np.where(is_jump, jump_ids, pair_ids)]
+    df = pd.DataFrame(
+        {
+            "frame": frames,
+            "score": scores,
+            "metric": np.where(is_jump, "jump", "distance"),
+            "individual": individuals,
+            "bodyparts": np.where(is_jump, bodyparts[jump_bodyparts], pair_names),
+        },
+        columns=columns,
+    )
+    df = df[df["score"] > threshold]
+    return df.sort_values("score", ascending=False, kind="stable").reset_index(
+        drop=True
+    )
+
+
+def _keypoint_table(header: DLCHeader, codes: Dict[Tuple[str, str], int]) -> np.ndarray:
+    """Map the (individual, bodypart) codes of a header onto shared codes.
+
+    Keypoints are looked up as id * number of bodyparts + label, and are
+    added to ``codes`` if seen for the first time.
+    """
+    table = np.empty(len(header.individuals) * len(header.bodyparts), dtype=int)
+    for i, pair in enumerate(
+        (individual, bodypart)
+        for individual in header.individuals
+        for bodypart in header.bodyparts
+    ):
+        table[i] = codes.setdefault(pair, len(codes))
+    return table
+
+
+def compare_annotations(
+    annotations: Mapping[
+        str, Tuple[np.ndarray, Dict[str, np.ndarray], DLCHeader, Sequence[str]]
+    ],
+    tolerance: float = 5.0,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Compare the keypoints labeled by several annotators.
+
+    Annotations are aligned on image path and (individual, bodypart),
+    through integer codes shared by all scorers, and compared all at once.
+
+    Parameters
+    ----------
+    annotations : Mapping
+        Maps every scorer to the data, properties, header and image paths
+        of a KeyPoints layer, e.g., as returned by :func:`dlclabel.io.read_hdf`.
+        Without paths, frames are aligned on their indices.
+    tolerance : float
+        Distance in pixels up to which two annotators agree on a keypoint.
+
+    Returns
+    -------
+    frames : pd.DataFrame
+        One row per frame, least agreed upon first, with the number of
+        keypoints labeled by any scorer, the fraction of them labeled by
+        all scorers within ``tolerance`` of one another, the largest
+        distance between annotators, and the number of keypoints every
+        scorer missed (labeled by others) or added (labeled by no other).
+    keypoints : pd.DataFrame
+        One row per keypoint labeled by any scorer in a frame, with the
+        largest distance between annotators (NaN if labeled only once)
+        and whether each scorer labeled it.
+    """
+    scorers = list(annotations)
+    codes = dict()
+    row_paths, row_keys = [], []
+    for data, properties, header, paths in annotations.values():
+        frames = data[:, 0].astype(int)
+        if len(paths):
+            paths = np.array([to_os_dir_sep(path) for path in paths], dtype=object)
+            row_paths.append(paths[frames])
+        else:
+            row_paths.append(frames.astype(str).astype(object))
+        table = _keypoint_table(header, codes)
+        keys = properties["id"].astype(int) * len(header.bodyparts)
+        row_keys.append(table[keys + properties["label"]])
+    frame_codes, frame_paths = pd.factorize(np.concatenate(row_paths))
+    bounds = np.cumsum([0] + [len(paths) for paths in row_paths])
+
+    shape = len(scorers), len(frame_paths), len(codes), 2
+    coords = np.full(shape, np.nan, dtype=np.float32)
+    for i, (data, *_) in enumerate(annotations.values()):
+        rows = frame_codes[bounds[i] : bounds[i + 1]]
+        coords[i, rows, row_keys[i]] = data[:, 1:]
+    labeled = ~np.isnan(coords[..., 0])
+    n_labeled = labeled.sum(axis=0)
+
+    # Largest distance between any two annotators; NaN pairs are ignored
+    distance = np.full(shape[1:3], np.nan, dtype=np.float32)
+    for i, j in combinations(range(len(scorers)), 2):
+        dist = np.sqrt(((coords[i] - coords[j]) ** 2).sum(axis=-1))
+        distance = np.fmax(distance, dist)
+
+    agree = (n_labeled == len(scorers)) & (distance <= tolerance)
+    any_labeled = n_labeled > 0
+    n_keypoints = any_labeled.sum(axis=1)
+    frames_df = pd.DataFrame(
+        {
+            "path": frame_paths,
+            "n_keypoints": n_keypoints,
+            "agreement": agree.sum(axis=1) / np.maximum(n_keypoints, 1),
+            "max_distance": np.fmax.reduce(distance, axis=1, initial=np.nan),
+        }
+    )
+    for i, scorer in enumerate(scorers):
+        others = np.delete(labeled, i, axis=0).any(axis=0)
+        frames_df[f"missing_{scorer}"] = (others & ~labeled[i]).sum(axis=1)
+        frames_df[f"extra_{scorer}"] = (labeled[i] & ~others).sum(axis=1)
+    frames_df = frames_df.sort_values(
+        ["agreement", "max_distance"], ascending=[True, False], kind="stable"
+    ).reset_index(drop=True)
+
+    frame_inds, key_inds = np.nonzero(any_labeled)
+    individuals, bodyparts = zip(*codes) if codes else ((), ())
+    keypoints_df = pd.DataFrame(
+        {
+            "path": frame_paths[frame_inds],
+            "individual": np.asarray(individuals, dtype=object)[key_inds],
+            "bodypart": np.asarray(bodyparts, dtype=object)[key_inds],
+            "distance": distance[frame_inds, key_inds],
+            "n_labeled": n_labeled[frame_inds, key_inds],
+        }
+    )
+    for i, scorer in enumerate(scorers):
+        keypoints_df[scorer] = labeled[i, frame_inds, key_inds]
+    return frames_df, keypoints_df
@@ -0,0 +1,200 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+import dask
+import numpy as np
+from skimage.feature import match_template
+
+
+def _to_gray(frames: np.ndarray) -> np.ndarray:
+    # Double precision avoids spurious correlation peaks in flat areas
+    frames = np.asarray(frames, dtype=float)
+    if frames.ndim == 4:
+        frames = frames[..., :3].mean(axis=-1)
+    return frames
+
+
+def track_points(
+    frames: np.ndarray,
+    points: np.ndarray,
+    confidence: np.ndarray,
+    patch_radius: int = 15,
+    search_radius: int = 30,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Track points from the first of ``frames`` through the following ones.
+
+    The patch around each point is matched by normalized cross-correlation
+    within a search window of the next frame. The confidence of a point
+    is the product of its correlation peaks along the way.
+
+    Parameters
+    ----------
+    frames : np.ndarray
+        Stack of grayscale or RGB(A) frames.
+    points : np.ndarray
+        (n, 2) array of y, x coordinates in the first frame.
+    confidence : np.ndarray
+        Initial confidence of the points.
+
+    Returns
+    -------
+    positions : np.ndarray
+        (len(frames) - 1, n, 2) array of coordinates in the following frames.
+    confidences : np.ndarray
+        (len(frames) - 1, n) array of confidences.
+    """
+    frames = _prepare(frames, patch_radius + search_radius)
+    return _track(frames, points, confidence, patch_radius, search_radius)
+
+
+def _prepare(frames: np.ndarray, pad: int) -> np.ndarray:
+    """Convert frames to grayscale and pad their edges by ``pad`` pixels."""
+    return np.pad(_to_gray(frames), [(0, 0), (pad, pad), (pad, pad)], mode="edge")
+
+
+def _track(
+    frames: np.ndarray,
+    points: np.ndarray,
+    confidence: np.ndarray,
+    patch_radius: int,
+    search_radius: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Track points through frames prepared by :func:`_prepare`."""
+    pad = patch_radius + search_radius
+    height, width = frames.shape[1:]
+    positions = np.empty((len(frames) - 1, len(points), 2))
+    confidences = np.empty((len(frames) - 1, len(points)))
+    points = np.asarray(points, dtype=float) + pad
+    confidence = np.asarray(confidence, dtype=float)
+    for t in range(1, len(frames)):
+        points = points.copy()
+        confidence = confidence.copy()
+        for j, (y, x) in enumerate(np.round(points).astype(int)):
+            # Points drifting out of the image are left where they are
+            if not (pad <= y < height - pad and pad <= x < width - pad):
+                confidence[j] = 0
+                continue
+            template = frames[t - 1, y - patch_radius : y + patch_radius + 1]
+            template = template[:, x - patch_radius : x + patch_radius + 1]
+            window = frames[t, y - pad : y + pad + 1, x - pad : x + pad + 1]
+            ncc = match_template(window, template)
+            dy, dx = np.unravel_index(np.argmax(ncc), ncc.shape)
+            points[j] += (dy - search_radius, dx - search_radius)
+            # A flat template yields an undefined correlation
+            peak = ncc[dy, dx] if template.std() > 0 else 0
+            confidence[j] *= np.clip(peak, 0, 1)
+        positions[t - 1] = points - pad
+        confidences[t - 1] = confidence
+    return positions, confidences
+
+
+def _track_range(
+    frames,
+    inbox,
+    outbox,
+    patch_radius: int,
+    search_radius: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Track points through a range of frames, in a worker process.
+
+    The frames are read and prepared first; only then does the worker wait
+    for the points and confidences to start from, which the worker of the
+    previous range puts into ``inbox`` as it is done. Its own last ones
+    are put into ``outbox`` for the next range.
+    """
+    last = None
+    try:
+        frames = _prepare(np.asarray(frames), patch_radius + search_radius)
+        start = inbox.get()
+        if start is None:
+            raise RuntimeError("Tracking through the previous frames failed.")
+        positions, confidences = _track(frames, *start, patch_radius, search_radius)
+        last = positions[-1], confidences[-1]
+        return positions, confidences
+    finally:
+        # Never leave the next range waiting, even on failure
+        outbox.put(last)
+
+
+def _take_frames(images, start: int, stop: int):
+    frames = images[start:stop]
+    if dask.is_dask_collection(frames):
+        # Only send the tasks reading these frames, not the whole stack's
+        (frames,) = dask.optimize(frames)
+    return frames
+
+
+def propagate(
+    images,
+    frame: int,
+    points: np.ndarray,
+    n_frames: int,
+    chunk_size: int = 8,
+    n_workers: Optional[int] = None,
+    patch_radius: int = 15,
+    search_radius: int = 30,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Propagate points from ``frame`` to the next ``n_frames`` frames.
+
+    Frames are split into ranges of ``chunk_size`` frames handed to the
+    workers of a process pool, which read them from the (possibly lazy)
+    image stack and prepare them in parallel. As points are tracked from
+    one frame into the next, a worker then waits for the points tracked
+    up to its first frame by the worker of the previous range. Results
+    are yielded range by range, so that tracking can be stopped after any
+    of them; the ranges not started yet are then dropped.
+
+    Yields
+    ------
+    frames : np.ndarray
+        Indices of the frames of a range.
+    positions : np.ndarray
+        (len(frames), n, 2) array of coordinates in these frames.
+    confidences : np.ndarray
+        (len(frames), n) array of tracking confidences.
+    """
+    points = np.asarray(points, dtype=float)
+    stop = min(frame + n_frames, len(images) - 1)
+    if not len(points) or stop <= frame:
+        return
+    n_workers = n_workers or multiprocessing.cpu_count()
+    ranges = deque(
+        (start, min(start + chunk_size, stop))
+        for start in range(frame, stop, chunk_size)
+    )
+    # Spawned processes do not inherit the state of the Qt application;
+    # they only import this module, which does not pull in the GUI.
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(
+        n_workers, mp_context=context
+    ) as pool:
+        inbox = manager.Queue()
+        inbox.put((points, np.ones(len(points))))
+        pending = deque()
+        try:
+            while ranges or pending:
+                # Keep every worker busy with a range, and no more
+                while ranges and len(pending) < n_workers:
+                    start, end = ranges.popleft()
+                    outbox = manager.Queue()
+                    future = pool.submit(
+                        _track_range,
+                        # A range also holds the frame its points start from
+                        _take_frames(images, start, end + 1),
+                        inbox,
+                        outbox,
+                        patch_radius,
+                        search_radius,
+                    )
+                    pending.append((start, end, future))
+                    inbox = outbox
+                start, end, future = pending.popleft()
+                positions, confidences = future.result()
+                yield np.arange(start + 1, end + 1), positions, confidences
+        finally:
+            # Ranges started after the others are cancelled first, as they
+            # may be waiting for them.
+            for _, _, future in reversed(pending):
+                future.cancel()
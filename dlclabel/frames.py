@@ -0,0 +1,603 @@
+import glob
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import imageio
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from skimage.io import imread, imsave
+from skimage.transform import resize
+from skimage.util import img_as_ubyte
+
+from dlclabel.io import SUPPORTED_IMAGES
+
+# Name of the files caching the hashes and thumbnails of the images of a folder
+HASH_CACHE = ".dlclabel_hashes.json"
+THUMBNAIL_CACHE = ".dlclabel_thumbnails.npz"
+
+
+def image_hash(image: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """Difference hash of an image, as an array of hash_size**2 bits.
+
+    Each bit tells whether the brightness increases between two
+    horizontally adjacent cells of the downsampled image.
+    """
+    if image.ndim == 3:
+        image = image[..., :3].mean(axis=-1)
+    small = resize(image, (hash_size, hash_size + 1), anti_aliasing=True)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def _read_hash(filename: str, hash_size: int) -> np.ndarray:
+    return image_hash(imread(filename, as_gray=True), hash_size)
+
+
+class HashCache:
+    """On-disk cache of image hashes, invalidated by file modification times."""
+
+    def __init__(self, filename: str, hash_size: int = 8):
+        self.filename = filename
+        self.hash_size = hash_size
+        self._entries: Dict[str, List] = dict()
+        self._dirty = False
+        if os.path.isfile(filename):
+            with open(filename) as file:
+                content = json.load(file)
+            if content.get("hash_size") == hash_size:
+                self._entries = content["files"]
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, os.path.dirname(self.filename))
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        entry = self._entries.get(self._key(path))
+        if entry is None or entry[0] != os.stat(path).st_mtime_ns:
+            return None
+        bits = np.unpackbits(np.frombuffer(bytes.fromhex(entry[1]), dtype=np.uint8))
+        return bits[: self.hash_size**2].astype(bool)
+
+    def set(self, path: str, bits: np.ndarray):
+        self._entries[self._key(path)] = [
+            os.stat(path).st_mtime_ns,
+            np.packbits(bits).tobytes().hex(),
+        ]
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        temp = f"{self.filename}.tmp"
+        with open(temp, "w") as file:
+            json.dump({"hash_size": self.hash_size, "files": self._entries}, file)
+        os.replace(temp, self.filename)
+        self._dirty = False
+
+
+def hash_images(
+    filenames: Sequence[str],
+    hash_size: int = 8,
+    n_workers: Optional[int] = None,
+    cache: Optional[HashCache] = None,
+) -> np.ndarray:
+    """Hash images on worker threads, reusing cached hashes when possible.
+
+    Returns
+    -------
+    np.ndarray
+        (len(filenames), hash_size**2) array of bits.
+    """
+    hashes = np.empty((len(filenames), hash_size**2), dtype=bool)
+    missing = []
+    for i, filename in enumerate(filenames):
+        bits = cache.get(filename) if cache is not None else None
+        if bits is None:
+            missing.append(i)
+        else:
+            hashes[i] = bits
+    with ThreadPoolExecutor(n_workers) as pool:
+        results = pool.map(
+            _read_hash, [filenames[i] for i in missing], [hash_size] * len(missing)
+        )
+        for i, bits in zip(missing, results):
+            hashes[i] = bits
+            if cache is not None:
+                cache.set(filenames[i], bits)
+    if cache is not None:
+        cache.save()
+    return hashes
+
+
+def _close_pairs(
+    bits: np.ndarray, members: np.ndarray, max_distance: int, block_size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the pairs of ``members`` whose hashes differ by few bits."""
+    rows, cols = [], []
+    step = max(1, block_size // len(members))
+    for start in range(0, len(members), step):
+        chunk = bits[members[start : start + step]]
+        others = bits[members]
+        # Hamming distances, as the number of bits set in one hash only
+        dist = chunk @ (1 - others).T + (1 - chunk) @ others.T
+        i, j = np.nonzero(dist <= max_distance)
+        upper = i + start < j
+        rows.append(members[i[upper] + start])
+        cols.append(members[j[upper]])
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def cluster_duplicates(
+    hashes: np.ndarray, max_distance: int = 4, block_size: int = 2**20
+) -> np.ndarray:
+    """Group images whose hashes differ by at most ``max_distance`` bits.
+
+    Near duplicates are chained, so that a cluster may span images farther
+    apart than ``max_distance`` through intermediate ones. Hashes are split
+    into ``max_distance + 1`` bands, at least one of which two near
+    duplicates must share; only hashes falling in the same bucket of a band
+    are compared, at most ``block_size`` distances at a time.
+
+    Returns
+    -------
+    np.ndarray
+        Index of the first image of the cluster of every image.
+    """
+    n_images, n_bits = hashes.shape
+    if not n_images:
+        return np.empty(0, dtype=int)
+    # Identical hashes are compared once
+    unique, inverse = np.unique(hashes, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    bits = unique.astype(np.float32)
+    edges = np.linspace(0, n_bits, min(max_distance + 1, n_bits) + 1).astype(int)
+    rows, cols = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+    for start, stop in zip(edges[:-1], edges[1:]):
+        _, buckets = np.unique(unique[:, start:stop], axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind="stable")
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for members in np.split(order, bounds):
+            if len(members) > 1:
+                i, j = _close_pairs(bits, members, max_distance, block_size)
+                rows.append(i)
+                cols.append(j)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = coo_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(len(unique), len(unique))
+    )
+    _, labels = connected_components(graph, directed=False)
+    labels = labels[inverse]
+    first = np.full(labels.max() + 1, n_images)
+    np.minimum.at(first, labels, np.arange(n_images))
+    return first[labels]
+
+
+def find_duplicates(
+    filenames: Sequence[str],
+    max_distance: int = 4,
+    hash_size: int = 8,
+    n_workers: Optional[int] = None,
+    use_cache: bool = True,
+) -> np.ndarray:
+    """Find the near duplicates among images.
+
+    Hashes are cached in the folder of the first image.
+
+    Returns
+    -------
+    np.ndarray
+        Index of the image each image duplicates; images that are not
+        duplicates of an earlier one map onto themselves.
+    """
+    cache = None
+    if use_cache and len(filenames):
+        folder = os.path.dirname(os.path.abspath(filenames[0]))
+        cache = HashCache(os.path.join(folder, HASH_CACHE), hash_size)
+    hashes = hash_images(filenames, hash_size, n_workers, cache)
+    return cluster_duplicates(hashes, max_distance)
+
+
+def make_thumbnail(image: np.ndarray, size: int = 64) -> np.ndarray:
+    """Downsample an image into a (size, size, 3) RGB thumbnail.
+
+    The aspect ratio is kept; the thumbnail is padded with black.
+    """
+    if image.ndim == 2:
+        image = np.stack([image] * 3, axis=-1)
+    image = image[..., :3]
+    scale = size / max(image.shape[:2])
+    shape = tuple(max(1, round(n * scale)) for n in image.shape[:2])
+    thumbnail = np.zeros((size, size, 3), dtype=np.uint8)
+    small = resize(image, shape, anti_aliasing=True)
+    thumbnail[: shape[0], : shape[1]] = img_as_ubyte(small)
+    return thumbnail
+
+
+def _read_thumbnail(filename: str, size: int) -> Optional[np.ndarray]:
+    try:
+        image = imread(filename)
+    except (OSError, ValueError):
+        # Missing or unreadable images are left without a thumbnail
+        return None
+    return make_thumbnail(image, size)
+
+
+class ThumbnailCache:
+    """On-disk cache of image thumbnails, invalidated by file modification times."""
+
+    def __init__(self, filename: str, size: int = 64):
+        self.filename = filename
+        self.size = size
+        self._entries: Dict[str, Tuple[int, np.ndarray]] = dict()
+        self._dirty = False
+        if os.path.isfile(filename):
+            with np.load(filename) as content:
+                if content["thumbnails"].shape[1:3] == (size, size):
+                    self._entries = dict(
+                        zip(
+                            content["names"].tolist(),
+                            zip(content["mtimes"].tolist(), content["thumbnails"]),
+                        )
+                    )
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, os.path.dirname(self.filename))
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        entry = self._entries.get(self._key(path))
+        if entry is None or not os.path.isfile(path):
+            return None
+        if entry[0] != os.stat(path).st_mtime_ns:
+            return None
+        return entry[1]
+
+    def set(self, path: str, thumbnail: np.ndarray):
+        self._entries[self._key(path)] = os.stat(path).st_mtime_ns, thumbnail
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        names = list(self._entries)
+        mtimes, thumbnails = zip(*self._entries.values())
+        temp = f"{self.filename}.tmp"
+        with open(temp, "wb") as file:
+            np.savez(
+                file,
+                names=np.array(names),
+                mtimes=np.array(mtimes, dtype=np.int64),
+                thumbnails=np.stack(thumbnails),
+            )
+        os.replace(temp, self.filename)
+        self._dirty = False
+
+
+def iter_thumbnails(
+    filenames: Sequence[str],
+    size: int = 64,
+    n_workers: Optional[int] = None,
+    use_cache: bool = True,
+    chunk_size: int = 64,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield the index and thumbnail of every image, as soon as it is ready.
+
+    Cached thumbnails come first; the others are made on worker threads,
+    one chunk of images at a time so that iteration can stop early.
+    Images that cannot be read are skipped. Thumbnails are cached in the
+    folder of the first image.
+    """
+    cache = None
+    if use_cache and len(filenames):
+        folder = os.path.dirname(os.path.abspath(filenames[0]))
+        cache = ThumbnailCache(os.path.join(folder, THUMBNAIL_CACHE), size)
+    missing = []
+    for i, filename in enumerate(filenames):
+        thumbnail = cache.get(filename) if cache is not None else None
+        if thumbnail is None:
+            missing.append(i)
+        else:
+            yield i, thumbnail
+    try:
+        with ThreadPoolExecutor(n_workers) as pool:
+            for start in range(0, len(missing), chunk_size):
+                inds = missing[start : start + chunk_size]
+                chunk = [filenames[i] for i in inds]
+                results = pool.map(_read_thumbnail, chunk, [size] * len(chunk))
+                for i, thumbnail in zip(inds, results):
+                    if thumbnail is None:
+                        continue
+                    if cache is not None:
+                        cache.set(filenames[i], thumbnail)
+                    yield i, thumbnail
+    finally:
+        # Keep the thumbnails made so far, even if iteration stopped early
+        if cache is not None:
+            cache.save()
+
+
+class MiniBatchKMeans:
+    """K-means fitted incrementally on batches of samples.
+
+    Every batch moves the centers towards the mean of the samples
+    assigned to them, with a step decreasing as centers accumulate
+    samples, so that memory does not grow with the number of samples.
+    Centers are seeded with k-means++ from a sample of the data, which
+    should be drawn from the whole stream, since frames of a video are
+    ordered in time.
+    """
+
+    def __init__(self, n_clusters: int, seed: Optional[int] = None):
+        self.n_clusters = n_clusters
+        self.centers: Optional[np.ndarray] = None
+        self.counts = np.zeros(n_clusters)
+        self._rng = np.random.default_rng(seed)
+
+    def init(self, samples: np.ndarray):
+        centers = [samples[self._rng.integers(len(samples))]]
+        dist = ((samples - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, self.n_clusters):
+            total = dist.sum()
+            if total > 0:
+                ind = self._rng.choice(len(samples), p=dist / total)
+            else:
+                ind = self._rng.integers(len(samples))
+            centers.append(samples[ind])
+            dist = np.minimum(dist, ((samples - samples[ind]) ** 2).sum(axis=1))
+        self.centers = np.array(centers)
+        self.counts[:] = 0
+
+    def distances(self, samples: np.ndarray) -> np.ndarray:
+        """Squared distances between samples and centers."""
+        dist = (samples**2).sum(axis=1)[:, None] - 2 * samples @ self.centers.T
+        dist += (self.centers**2).sum(axis=1)
+        return np.maximum(dist, 0)
+
+    def partial_fit(self, samples: np.ndarray):
+        if self.centers is None:
+            self.init(samples)
+        labels = self.distances(samples).argmin(axis=1)
+        counts = np.bincount(labels, minlength=self.n_clusters)
+        sums = np.zeros_like(self.centers)
+        np.add.at(sums, labels, samples)
+        self.counts += counts
+        updated = counts > 0
+        rate = counts[updated] / self.counts[updated]
+        means = sums[updated] / counts[updated, None]
+        self.centers[updated] += rate[:, None] * (means - self.centers[updated])
+
+
+def _frame_features(image: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    if image.ndim == 3:
+        image = image[..., :3].mean(axis=-1)
+    return resize(image, shape, anti_aliasing=True).astype(np.float32).ravel()
+
+
+def _read_features(filename: str, shape: Tuple[int, int]) -> np.ndarray:
+    return _frame_features(imread(filename), shape)
+
+
+def list_images(folder: str) -> List[str]:
+    """Return the sorted paths of the supported images of a folder."""
+    return sorted(
+        filename
+        for filename in glob.glob(os.path.join(folder, "*"))
+        if filename.lower().endswith(SUPPORTED_IMAGES)
+    )
+
+
+def _iter_video(filename: str) -> Iterator[np.ndarray]:
+    with imageio.get_reader(filename) as reader:
+        yield from reader
+
+
+def _iter_features(
+    source: str,
+    shape: Tuple[int, int],
+    batch_size: int,
+    n_workers: Optional[int],
+) -> Iterator[np.ndarray]:
+    """Stream the downsampled frames of a folder or video, batch by batch."""
+    with ThreadPoolExecutor(n_workers) as pool:
+
+        def downsample(func, batch):
+            return np.stack(list(pool.map(func, batch, [shape] * len(batch))))
+
+        if os.path.isdir(source):
+            filenames = list_images(source)
+            for start in range(0, len(filenames), batch_size):
+                yield downsample(_read_features, filenames[start : start + batch_size])
+            return
+        # Video frames are decoded in order, and only downsampled in parallel
+        batch = []
+        for image in _iter_video(source):
+            batch.append(image)
+            if len(batch) == batch_size:
+                yield downsample(_frame_features, batch)
+                batch = []
+        if batch:
+            yield downsample(_frame_features, batch)
+
+
+def _video_reservoir(
+    source: str,
+    size: int,
+    shape: Tuple[int, int],
+    batch_size: int,
+    n_workers: Optional[int],
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Draw ``size`` frames of a video uniformly, in a single decoding pass.
+
+    Frames are kept with reservoir sampling, so the frame count needs not
+    be known beforehand; only frames entering the reservoir are downsampled.
+
+    Returns
+    -------
+    samples : np.ndarray
+        Downsampled sampled frames.
+    inds : np.ndarray
+        Their indices in the video.
+    n_total : int
+        The number of frames of the video.
+    """
+    samples = np.empty((size, shape[0] * shape[1]), dtype=np.float32)
+    inds = np.empty(size, dtype=int)
+    # Frames waiting to be downsampled, by slot of the reservoir; a frame
+    # replaced before being downsampled is simply dropped.
+    pending = {}
+    n_total = 0
+    with ThreadPoolExecutor(n_workers) as pool:
+
+        def flush():
+            slots = list(pending)
+            images = [pending[slot][1] for slot in slots]
+            features = pool.map(_frame_features, images, [shape] * len(images))
+            for slot, feature in zip(slots, features):
+                samples[slot] = feature
+                inds[slot] = pending[slot][0]
+            pending.clear()
+
+        for i, image in enumerate(_iter_video(source)):
+            slot = i if i < size else rng.integers(i + 1)
+            if slot < size:
+                pending[slot] = i, image
+                if len(pending) == batch_size:
+                    flush()
+            n_total = i + 1
+        flush()
+    n_samples = min(size, n_total)
+    return samples[:n_samples], inds[:n_samples], n_total
+
+
+def _select_frames(
+    source: str,
+    n_frames: int = 20,
+    feature_shape: Tuple[int, int] = (32, 32),
+    batch_size: int = 256,
+    init_size: int = 1024,
+    n_workers: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, int]:
+    """Run :func:`select_frames`, also returning the number of frames."""
+    kmeans = MiniBatchKMeans(n_frames, seed)
+    rng = kmeans._rng
+    # Seed the centers from frames drawn uniformly from the whole source
+    size = max(init_size, n_frames)
+    if os.path.isdir(source):
+        filenames = list_images(source)
+        n_total = len(filenames)
+        inds = np.sort(rng.choice(n_total, min(size, n_total), replace=False))
+        with ThreadPoolExecutor(n_workers) as pool:
+            samples = pool.map(
+                _read_features,
+                [filenames[i] for i in inds],
+                [feature_shape] * len(inds),
+            )
+            samples = np.array(list(samples)).reshape(len(inds), -1)
+    else:
+        samples, inds, n_total = _video_reservoir(
+            source, size, feature_shape, batch_size, n_workers, rng
+        )
+    if n_total <= n_frames:
+        return np.arange(n_total), n_total
+    kmeans.init(samples)
+    # Fit the centers in a second, streaming pass, keeping the frame closest
+    # to every center seen so far; its features are kept along.
+    best = np.full(n_frames, np.inf)
+    best_inds = np.full(n_frames, -1)
+    best_samples = np.empty((n_frames, samples.shape[1]), dtype=np.float32)
+    start = 0
+    for batch in _iter_features(source, feature_shape, batch_size, n_workers):
+        kmeans.partial_fit(batch)
+        dist = kmeans.distances(batch)
+        labels = dist.argmin(axis=1)
+        dist = dist[np.arange(len(labels)), labels]
+        closer = dist < best[labels]
+        # Keep the closest frame of every cluster within the batch
+        order = np.lexsort((dist[closer], labels[closer]))
+        closest = np.flatnonzero(closer)[order]
+        first = np.ones(len(closest), dtype=bool)
+        first[1:] = labels[closest][1:] != labels[closest][:-1]
+        closest = closest[first]
+        best[labels[closest]] = dist[closest]
+        best_inds[labels[closest]] = start + closest
+        best_samples[labels[closest]] = batch[closest]
+        start += len(batch)
+    # Centers kept moving after their closest frames were found, so every
+    # final center takes the closest of these frames and of the seeds.
+    found = best_inds >= 0
+    candidates = np.concatenate([samples, best_samples[found]])
+    candidate_inds = np.concatenate([inds, best_inds[found]])
+    closest = kmeans.distances(candidates).argmin(axis=0)
+    return np.unique(candidate_inds[closest]), n_total
+
+
+def select_frames(
+    source: str,
+    n_frames: int = 20,
+    feature_shape: Tuple[int, int] = (32, 32),
+    batch_size: int = 256,
+    init_size: int = 1024,
+    n_workers: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """Pick visually diverse frames from an image folder or a video.
+
+    Frames are downsampled to ``feature_shape`` grayscale images and
+    clustered with mini-batch k-means into ``n_frames`` clusters, seeded
+    from ``init_size`` frames drawn uniformly; the frame closest to the
+    center of every cluster is selected. Frames are streamed one batch at
+    a time, so memory does not grow with their number: a video is decoded
+    twice, once to draw the seeds by reservoir sampling and once to fit
+    the centers, while only the seeds of a folder are read beforehand.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the selected frames.
+    """
+    inds, _ = _select_frames(
+        source, n_frames, feature_shape, batch_size, init_size, n_workers, seed
+    )
+    return inds
+
+
+def extract_frames(
+    source: str, output_folder: str, n_frames: int = 20, **kwargs
+) -> List[str]:
+    """Select frames to label and write them into a new labeled-data folder.
+
+    ``output_folder`` is typically ``<project>/labeled-data/<video name>``.
+    Images selected from a folder are copied under their original names;
+    video frames are saved as ``img<index>.png``, the index zero-padded to
+    the number of digits of the frame count, as DeepLabCut does.
+    Keyword arguments are passed on to :func:`select_frames`.
+
+    Returns
+    -------
+    List[str]
+        Paths of the written images.
+    """
+    if os.path.isdir(output_folder) and os.listdir(output_folder):
+        raise IOError(f"{output_folder} already exists and is not empty.")
+    inds, n_total = _select_frames(source, n_frames, **kwargs)
+    os.makedirs(output_folder, exist_ok=True)
+    written = []
+    if os.path.isdir(source):
+        filenames = list_images(source)
+        for ind in inds:
+            dest = os.path.join(output_folder, os.path.basename(filenames[ind]))
+            shutil.copy2(filenames[ind], dest)
+            written.append(dest)
+        return written
+    n_digits = int(np.ceil(np.log10(n_total))) if n_total else 0
+    # Only the selected frames are read back, seeking to them
+    with imageio.get_reader(source) as reader:
+        for ind in inds.tolist():
+            dest = os.path.join(output_folder, f"img{str(ind).zfill(n_digits)}.png")
+            imsave(dest, reader.get_data(ind), check_contrast=False)
+            written.append(dest)
+    return written
@@ -1,17 +1,21 @@
+import os
 import warnings
 from typing import List, Optional, Sequence, Union
 
 import napari
 import numpy as np
-from napari.layers import Image, Layer
-from PyQt5.QtWidgets import QFileDialog, QMessageBox
+from napari.layers import Image, Layer, Shapes
+from napari.qt.threading import create_worker
+from PyQt5.QtWidgets import QFileDialog, QInputDialog, QMessageBox
 
+from dlclabel import analysis, flow, frames
 from dlclabel.io import handle_path
 from dlclabel.layers import KeyPoints
-from dlclabel.misc import to_os_dir_sep
-from dlclabel.widgets import KeypointsDropdownMenu
+from dlclabel.misc import as_path_table, to_os_dir_sep
+from dlclabel.overlays import SkeletonOverlay, TrajectoryOverlay
+from dlclabel.preprocessing import Preprocessor
+from dlclabel.widgets import KeypointsDropdownMenu, LabelingProgress
 
-# TODO Add vectors for paths trajectory
 # TODO Add video reader plugin
 # TODO Refactor KeyPoints with KeyPointsData
 
@@ -57,6 +61,16 @@ class DLCViewer(napari.Viewer):
         self.class_keymap.update(super(DLCViewer, self).class_keymap)
         self.layers.events.changed.connect(self.on_change)
         self._dock_widgets = []
+        self._propagation = None
+        self._overlays = dict()
+        self._outliers = None
+        self._disagreements = None
+        self._progress = None
+        self._progress_dock = None
+        self._thumbnailer = None
+        # Maps near-duplicate frames to the frame they duplicate
+        self._duplicate_of = dict()
+        self.dims.events.current_step.connect(self._show_polygons)
 
         # Hack the QSS style sheet to add a KeyPoints layer type icon
         missing_style = """\n\nQLabel#KeyPoints {
@@ -93,6 +107,8 @@ class DLCViewer(napari.Viewer):
                 paths = layer.metadata.get("paths")
                 if paths is None:
                     return
+                # Shared by the image layer and the other layers' metadata
+                paths = layer.metadata["paths"] = as_path_table(paths)
                 # Store the metadata and pass them on to the other layers
                 with warnings.catch_warnings():
                     warnings.simplefilter(action="ignore", category=FutureWarning)
@@ -100,6 +116,10 @@ class DLCViewer(napari.Viewer):
                 for layer_ in self.layers:
                     if not isinstance(layer_, Image):
                         self._remap_frame_indices(layer_)
+                    if isinstance(layer_, KeyPoints):
+                        self._show_progress(layer_)
+                self.bind_key("Shift-D", self._find_duplicates, overwrite=True)
+                self.bind_key("Shift-E", self._toggle_enhancement, overwrite=True)
                 # Ensure the images are always underneath the other layers
                 n_layers = len(self.layers)
                 if n_layers > 1:
@@ -113,35 +133,69 @@ class DLCViewer(napari.Viewer):
                         )
                     )
                 layer.smart_reset(event=None)  # Update current keypoint upon loading data
+                self._show_progress(layer)
                 self.bind_key("Down", layer.next_keypoint, overwrite=True)
                 self.bind_key("Up", layer.prev_keypoint, overwrite=True)
+                self.bind_key("Control-Z", layer.undo, overwrite=True)
+                self.bind_key("Control-Shift-Z", layer.redo, overwrite=True)
+                self.bind_key(
+                    "Control-Shift-V", self._paste_to_frame_range, overwrite=True
+                )
+                self.bind_key("Control-I", self._interpolate_keyframes, overwrite=True)
+                self.bind_key("Control-T", self._propagate_keypoints, overwrite=True)
+                self.bind_key("Shift-T", self._toggle_trajectories, overwrite=True)
+                self.bind_key("Shift-B", self._toggle_skeleton, overwrite=True)
+                self.bind_key("Shift-O", self._next_outlier, overwrite=True)
+                self.bind_key("Shift-A", self._next_disagreement, overwrite=True)
+            elif isinstance(layer, Shapes) and "polygons" in layer.metadata:
+                # Lazily read masks come with the shapes of their first frame
+                self._show_polygons()
         elif event.type == "removed":
             layer = event.item
             if isinstance(layer, KeyPoints):
+                for overlay_class, overlay in list(self._overlays.items()):
+                    if overlay.layer is layer:
+                        self._overlays.pop(overlay_class).close()
+                if self._progress is not None and self._progress.layer is layer:
+                    self._hide_progress()
+                    # Track the labeling of the next KeyPoints layer, if any
+                    for layer_ in self.layers:
+                        if isinstance(layer_, KeyPoints) and layer_ is not layer:
+                            self._show_progress(layer_)
+                            break
                 while self._dock_widgets:
                     widget = self._dock_widgets.pop()
                     self.window.remove_dock_widget(widget)
             elif isinstance(layer, Image):
                 self._images_meta = dict()
+                self._duplicate_of = dict()
+                self._hide_progress()
 
     def _remap_frame_indices(self, layer: Layer):
         """Ensure consistency between layers' data and the corresponding images."""
         if not self._images_meta:
             return
 
-        # Make missing frame detection independent of OS directory separator:
-        # if existing "CollectedData" or "machinelabels" file contains relative
-        # image paths using a directory separator different from the OS on which
-        # this scirpt is run, then the matchin of image paths fails and missing
-        # frames are detected erroneously.
-        new_paths = [to_os_dir_sep(p) for p in self._images_meta["paths"]]
+        # Paths are matched as tables of OS-independent components, so that
+        # files written on another OS do not have all their frames missing.
+        new_paths = as_path_table(self._images_meta["paths"])
+        window = layer.metadata.get("window")
+        if window is not None:
+            # Windowed layers only hold the points of their current window;
+            # map the whole file at once and reload these points.
+            window.stash(window.current, layer.data, layer.properties)
+            window.map_paths(new_paths)
+            layer.metadata.update(self._images_meta)
+            layer.load_window(force=True)
+            return
         paths = layer.metadata.get("paths")
 
-        if paths is not None and np.any(layer.data):
-            paths_map = dict(zip(range(len(paths)), map(to_os_dir_sep, paths)))
+        if paths and np.any(layer.data):
+            # New frame index of every former frame, -1 if its image is missing
+            codes = new_paths.lookup(as_path_table(paths))
             # Discard data if there are missing frames
-            missing = [i for i, path in paths_map.items() if path not in new_paths]
-            if missing:
+            missing = np.flatnonzero(codes < 0)
+            if missing.size:
                 if isinstance(layer.data, list):
                     inds_to_remove = [
                         i
@@ -152,22 +206,325 @@ class DLCViewer(napari.Viewer):
                     inds_to_remove = np.flatnonzero(np.isin(layer.data[:, 0], missing))
                 layer.selected_data = inds_to_remove
                 layer.remove_selected()
-                for i in missing:
-                    paths_map.pop(i)
 
             # Check now whether there are new frames
-            temp = {k: new_paths.index(v) for k, v in paths_map.items()}
             data = layer.data
             if isinstance(data, list):
                 for verts in data:
-                    verts[:, 0] = np.vectorize(temp.get)(verts[:, 0])
+                    verts[:, 0] = codes[verts[:, 0].astype(int)]
             else:
-                data[:, 0] = np.vectorize(temp.get)(data[:, 0])
+                data[:, 0] = codes[data[:, 0].astype(int)]
             layer.data = data
+            if isinstance(layer, KeyPoints):
+                # Edits, e.g., the removal above, refer to former frame indices
+                layer._history.clear()
         layer.metadata.update(self._images_meta)
 
+    def _paste_to_frame_range(self, *args):
+        """Ask for a range of frames and paste the copied keypoints into it."""
+        layer = self.layers.selected[-1] if self.layers.selected else None
+        if not isinstance(layer, KeyPoints):
+            return
+        current = self.dims.current_step[0]
+        text, ok = QInputDialog.getText(
+            self.window.qt_viewer,
+            "Paste to frames",
+            "Frames (first:last, inclusive):",
+            text=f"{current}:{self.dims.nsteps[0] - 1}",
+        )
+        if not ok:
+            return
+        try:
+            first, last = map(int, text.split(":"))
+        except ValueError:
+            QMessageBox.warning(
+                self.window.qt_viewer,
+                "Invalid range",
+                f"Could not read a frame range from '{text}'.",
+                QMessageBox.Ok,
+            )
+            return
+        layer.paste_to_frames(np.arange(max(first, 0), last + 1))
+
+    def _interpolate_keyframes(self, *args):
+        layer = self.layers.selected[-1] if self.layers.selected else None
+        if not isinstance(layer, KeyPoints):
+            return
+        method, ok = QInputDialog.getItem(
+            self.window.qt_viewer,
+            "Interpolate keyframes",
+            "Method:",
+            ["linear", "spline"],
+            editable=False,
+        )
+        if ok:
+            layer.interpolate(method)
+
+    def _propagate_keypoints(self, *args):
+        """Track the keypoints of the current frame into the next frames.
+
+        Pressing the shortcut again while tracking cancels it.
+        """
+        if self._propagation is not None:
+            self._propagation.quit()
+            return
+        layer = self.layers.selected[-1] if self.layers.selected else None
+        images = [layer_ for layer_ in self.layers if isinstance(layer_, Image)]
+        if not isinstance(layer, KeyPoints) or not images:
+            return
+        rows = np.flatnonzero(layer.current_mask)
+        frame = self.dims.current_step[0]
+        if not rows.size or frame >= self.dims.nsteps[0] - 1:
+            return
+        n_frames, ok = QInputDialog.getInt(
+            self.window.qt_viewer,
+            "Propagate keypoints",
+            "Number of frames:",
+            value=10,
+            min=1,
+            max=self.dims.nsteps[0] - frame - 1,
+        )
+        if not ok:
+            return
+        properties = layer._take_properties(rows)
+
+        def add_tracked(result):
+            layer.add_tracked(properties, *result)
+            self.status = f"Propagated keypoints up to frame {result[0][-1]}"
+
+        def finished():
+            self._propagation = None
+
+        # Track on the original images, in the coordinates of the keypoints
+        original = images[0].metadata.get("original_data", images[0].data)
+        self._propagation = create_worker(
+            flow.propagate,
+            original,
+            frame,
+            layer.data[rows, 1:],
+            n_frames,
+            _connect={"yielded": add_tracked, "finished": finished},
+        )
+
+    def _toggle_overlay(self, overlay_class):
+        overlay = self._overlays.pop(overlay_class, None)
+        if overlay is not None:
+            overlay.close()
+            return
+        layer = self.layers.selected[-1] if self.layers.selected else None
+        if isinstance(layer, KeyPoints):
+            self._overlays[overlay_class] = overlay_class(self, layer)
+
+    def _toggle_trajectories(self, *args):
+        """Show or hide the tracks of the keypoints around the current frame."""
+        self._toggle_overlay(TrajectoryOverlay)
+
+    def _toggle_skeleton(self, *args):
+        """Show or hide the skeleton defined in the project's config.yaml."""
+        self._toggle_overlay(SkeletonOverlay)
+
+    def _clear_outliers(self, event=None):
+        self._outliers = None
+
+    def _next_outlier(self, *args):
+        """Jump to the next most suspect frame of the selected keypoints.
+
+        Suspect frames are ranked again after any edit.
+        """
+        layer = self.layers.selected[-1] if self.layers.selected else None
+        if not isinstance(layer, KeyPoints):
+            return
+        if self._outliers is None or self._outliers[0] is not layer:
+            df = analysis.find_outliers(
+                layer.data,
+                layer.properties,
+                layer.metadata["header"],
+                layer.metadata.get("skeleton") or None,
+            )
+            self._outliers = [layer, df, 0]
+            layer.events.data.connect(self._clear_outliers)
+            layer.events.edited.connect(self._clear_outliers)
+        _, df, n = self._outliers
+        if df.empty:
+            self.status = "No suspect frames"
+            return
+        row = df.iloc[n % len(df)]
+        self._outliers[2] = n + 1
+        self.dims.set_current_step(0, int(row["frame"]))
+        self.status = (
+            f"Suspect frame {n % len(df) + 1}/{len(df)}: {row['metric']} of "
+            f"{row['individual']} {row['bodyparts']} (z = {row['score']:.1f})"
+        )
+
+    def _clear_disagreements(self, event=None):
+        self._disagreements = None
+
+    def _next_disagreement(self, *args):
+        """Jump to the next frame the annotators of the open keypoints disagree on.
+
+        Frames are ranked from the least agreed upon, and again after any edit.
+        """
+        layers = [layer for layer in self.layers if isinstance(layer, KeyPoints)]
+        if len(layers) < 2:
+            self.status = "Open the labels of several annotators to compare them"
+            return
+        if self._disagreements is None or self._disagreements[0] != layers:
+            df, _ = analysis.compare_annotations(
+                {
+                    layer.name: (
+                        layer.data,
+                        layer.properties,
+                        layer.metadata["header"],
+                        layer.metadata.get("paths", []),
+                    )
+                    for layer in layers
+                }
+            )
+            df = df[df["agreement"] < 1]
+            paths = self._images_meta.get("paths")
+            if paths:
+                inds = {to_os_dir_sep(path): i for i, path in enumerate(paths)}
+                df = df.assign(frame=df["path"].map(inds)).dropna(subset=["frame"])
+            else:
+                df = df.assign(frame=df["path"].astype(int))
+            self._disagreements = [layers, df, 0]
+            for layer in layers:
+                layer.events.data.connect(self._clear_disagreements)
+                layer.events.edited.connect(self._clear_disagreements)
+        _, df, n = self._disagreements
+        if df.empty:
+            self.status = "The annotators agree on all frames"
+            return
+        row = df.iloc[n % len(df)]
+        self._disagreements[2] = n + 1
+        self.dims.set_current_step(0, int(row["frame"]))
+        self.status = (
+            f"Disagreement {n % len(df) + 1}/{len(df)}: "
+            f"{row['agreement']:.0%} of {row['n_keypoints']} keypoints agreed upon, "
+            f"up to {row['max_distance']:.1f} px apart"
+        )
+
+    def preprocess_images(self, **params):
+        """Show the images preprocessed, e.g., with ``clahe=True`` or ``gamma=0.5``.
+
+        Frames are processed lazily as they are shown; see
+        :class:`dlclabel.preprocessing.Preprocessor` for the parameters.
+        Without parameters, the original images are shown again.
+        """
+        images = [layer for layer in self.layers if isinstance(layer, Image)]
+        if not images:
+            return
+        layer = images[0]
+        original = layer.metadata.setdefault("original_data", layer.data)
+        offset = 0, 0
+        if params:
+            preprocessor = Preprocessor(**params)
+            layer.data = preprocessor.apply(original)
+            offset = preprocessor.offset
+        else:
+            layer.data = original
+        # Cropped images are shifted back in place, over their keypoints
+        layer.translate = (0, *offset, *([0] * (layer.ndim - 3)))
+        layer.metadata["preprocessing"] = params
+
+    def _toggle_enhancement(self, *args):
+        """Enhance the contrast of the images, or show the original images."""
+        images = [layer for layer in self.layers if isinstance(layer, Image)]
+        if images and images[0].metadata.get("preprocessing"):
+            self.preprocess_images()
+        else:
+            self.preprocess_images(clahe=True)
+
+    def _image_filenames(self) -> List[str]:
+        """Return the paths to the files of the images being labeled."""
+        images = [layer for layer in self.layers if isinstance(layer, Image)]
+        if not images or not images[0].metadata.get("paths"):
+            return []
+        root = images[0].metadata["root"]
+        paths = as_path_table(images[0].metadata["paths"])
+        return [os.path.join(root, parts[-1]) for parts in paths.parts]
+
+    def _show_progress(self, layer: KeyPoints):
+        """Show the thumbnails of the frames, colored by labeling state."""
+        filenames = self._image_filenames()
+        if self._progress is not None or not filenames:
+            return
+        self._progress = LabelingProgress(self, layer, len(filenames))
+        self._progress_dock = self.window.add_dock_widget(
+            self._progress, name="labeling progress", area="right"
+        )
+        # Thumbnails are made in the background, and cached next to the images
+        self._thumbnailer = create_worker(
+            frames.iter_thumbnails,
+            filenames,
+            _connect={
+                "yielded": self._progress.set_thumbnail,
+                "errored": self._thumbnails_failed,
+            },
+        )
+
+    def _thumbnails_failed(self, error: Exception):
+        self.status = f"Could not make thumbnails: {error}"
+
+    def _hide_progress(self):
+        if self._progress is None:
+            return
+        self._thumbnailer.quit()
+        self._progress.disconnect_events()
+        self.window.remove_dock_widget(self._progress_dock)
+        self._progress = self._progress_dock = self._thumbnailer = None
+
+    def _find_duplicates(self, *args):
+        """Look for near-duplicate images, which are then flagged and skipped."""
+        filenames = self._image_filenames()
+        if not filenames:
+            return
+        self.status = "Looking for near-duplicate frames..."
+        create_worker(
+            frames.find_duplicates,
+            filenames,
+            _connect={"returned": self._set_duplicates},
+        )
+
+    def _set_duplicates(self, duplicate_of: np.ndarray):
+        self._duplicate_of = {
+            i: ind for i, ind in enumerate(duplicate_of.tolist()) if i != ind
+        }
+        self.status = f"Found {len(self._duplicate_of)} near-duplicate frames"
+        self.dims.events.current_step.connect(self._flag_duplicate)
+
+    def _flag_duplicate(self, event=None):
+        frame = self.dims.current_step[0]
+        ind = self._duplicate_of.get(frame)
+        if ind is not None:
+            self.status = f"Frame {frame} is a near duplicate of frame {ind}"
+
+    def _show_polygons(self, event=None):
+        """Swap in the shapes of the current frame of lazily read masks."""
+        frame = self.dims.current_step[0]
+        for layer in self.layers:
+            if not isinstance(layer, Shapes):
+                continue
+            meta = layer.metadata
+            polygons = meta.get("polygons")
+            if polygons is None or meta["frame"] == frame:
+                continue
+            # Keep the edits made to the shapes of the previous frame
+            polygons.replace(meta["frame"], layer.data, layer.shape_type)
+            data, shape_types = polygons.shapes([frame])
+            layer.data = []
+            if data:
+                layer.add(data, shape_type=shape_types)
+            meta["frame"] = frame
+
     def _advance_step(self, event):
-        ind = (self.dims.current_step[0] + 1) % self.dims.nsteps[0]
+        n_frames = self.dims.nsteps[0]
+        ind = (self.dims.current_step[0] + 1) % n_frames
+        # Skip near duplicates, unless all remaining frames are
+        for _ in range(n_frames):
+            if ind not in self._duplicate_of:
+                break
+            ind = (ind + 1) % n_frames
         self.dims.set_current_step(0, ind)
 
     def add_points(
@@ -225,6 +582,7 @@ class DLCViewer(napari.Viewer):
             visible=visible,
         )
 
+        self.dims.events.current_step.connect(layer.load_window, position="last")
         self.dims.events.current_step.connect(layer.smart_reset, position="last")
         layer.events.query_next_frame.connect(self._advance_step)
 
@@ -1,7 +1,17 @@
 import glob
+import hashlib
 import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from itertools import groupby
-from typing import Any, Dict, List, Optional, Sequence, Union
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -13,9 +23,15 @@ from napari.types import LayerData
 from skimage.io import imsave
 from skimage.util import img_as_ubyte
 
-from dlclabel import misc
+from dlclabel import analysis, misc
 
 SUPPORTED_IMAGES = "jpg", "jpeg", "png"
+# Machine label files with more rows (i.e., frames) than this
+# are only read window by window around the current frame.
+WINDOWED_MIN_ROWS = 20000
+# Masks with more polygons than this are only turned into
+# shapes for the current frame.
+LAZY_MIN_SHAPES = 5000
 
 
 def handle_path(path: Union[str, Sequence[str]]) -> Union[str, Sequence[str]]:
@@ -43,9 +59,13 @@ def handle_path(path: Union[str, Sequence[str]]) -> Union[str, Sequence[str]]:
                 if file.endswith(".h5"):
                     datafile = os.path.join(path, "*.h5")
                     break
+            layers = [images]
             if datafile:
-                return [images, datafile]
-            return [images]
+                layers.append(datafile)
+            # A folder of masks saved by write_masks
+            if "vertices.csv" in files:
+                layers.append(os.path.join(path, "vertices.csv"))
+            return layers
     return paths
 
 
@@ -55,7 +75,7 @@ def _populate_metadata(
     labels: Optional[Sequence[str]] = None,
     ids: Optional[Sequence[str]] = None,
     likelihood: Optional[Sequence[float]] = None,
-    paths: Optional[List[str]] = None,
+    paths: Optional[Sequence[str]] = None,
     size: Optional[int] = 8,
     pcutoff: Optional[float] = 0.6,
     colormap: Optional[str] = "viridis",
@@ -68,16 +88,18 @@ def _populate_metadata(
         likelihood = np.ones(len(labels))
     label_colors = misc.build_color_cycle(len(header.bodyparts), colormap)
     id_colors = misc.build_color_cycle(len(header.individuals), colormap)
+    # Labels and ids are stored as their positions in the header,
+    # so colors are mapped from these integer codes too.
     face_color_cycle_maps = {
-        "label": dict(zip(header.bodyparts, label_colors)),
-        "id": dict(zip(header.individuals, id_colors)),
+        "label": dict(enumerate(label_colors)),
+        "id": dict(enumerate(id_colors)),
     }
     return {
         "name": "keypoints",
         "text": "label",
         "properties": {
-            "label": list(labels),
-            "id": list(ids),
+            "label": misc.encode_with_categories(labels, header.bodyparts),
+            "id": misc.encode_with_categories(ids, header.individuals),
             "likelihood": likelihood,
             "valid": likelihood > pcutoff,
         },
@@ -89,6 +111,7 @@ def _populate_metadata(
             "header": header,
             "face_color_cycle_maps": face_color_cycle_maps,
             "paths": paths or [],
+            "pcutoff": pcutoff,
         },
     }
 
@@ -108,6 +131,8 @@ def read_config(configname: str) -> List[LayerData]:
         colormap=config["colormap"],
     )
     metadata["name"] = f"CollectedData_{config['scorer']}"
+    metadata["metadata"]["skeleton"] = config.get("skeleton") or []
+    metadata["metadata"]["skeleton_color"] = config.get("skeleton_color", "black")
     # Set 'root' key to DLC project root directory.  We use this later to
     # construct the path to any image folder under 'labeled-data' to store
     # CollectedData files.
@@ -119,11 +144,10 @@ def read_images(path: Union[str, List[str]]) -> List[LayerData]:
     if isinstance(path, list):
         root, ext = os.path.splitext(path[0])
         path = os.path.join(os.path.dirname(root), f"*{ext}")
-    # Retrieve filepaths exactly as parsed by pims
-    filepaths = []
-    for filepath in sorted(glob.glob(path)):
-        _, *relpath = filepath.rsplit(os.sep, 3)
-        filepaths.append(os.path.join(*relpath))
+    # Retrieve filepaths exactly as parsed by pims, relative to the project
+    filepaths = misc.PathTable(
+        filepath.split(os.sep)[-3:] for filepath in sorted(glob.glob(path))
+    )
     params = {
         # Set image layer name to image folder name.
         "name": os.path.split(os.path.dirname(path))[-1],
@@ -137,44 +161,57 @@ def read_images(path: Union[str, List[str]]) -> List[LayerData]:
     return [(imread(path), params, "image")]
 
 
+def _read_points(
+    temp: pd.DataFrame,
+) -> Tuple[np.ndarray, pd.DataFrame, misc.PathTable]:
+    """Convert DLC wide-format data into Points coordinates.
+
+    Returns the (frame, y, x) coordinates, the long-format data they
+    were taken from, and the table of the image paths of the frames.
+    """
+    # Paths are split once per row, and rows stacked by their position
+    paths, frames = misc.PathTable.from_index(temp.index)
+    temp = temp.droplevel("scorer", axis=1)
+    temp.index = pd.RangeIndex(len(temp))
+    if "individuals" not in temp.columns.names:
+        # Append a fake level to the MultiIndex
+        # to make it look like a multi-animal DataFrame
+        old_idx = temp.columns.to_frame()
+        old_idx.insert(0, "individuals", "")
+        temp.columns = pd.MultiIndex.from_frame(old_idx)
+    df = temp.stack(["individuals", "bodyparts"]).reset_index()
+    nrows = df.shape[0]
+    data = np.empty((nrows, 3))
+    data[:, 0] = frames[df["level_0"].to_numpy()]
+    data[:, 1:] = df[["y", "x"]].to_numpy()
+    return data, df, paths
+
+
 def read_hdf(filename: str) -> List[LayerData]:
     layers = []
     for filename in glob.glob(filename):
+        if "machine" in os.path.basename(filename):
+            window = WindowedHDF(filename)
+            if window.nrows > WINDOWED_MIN_ROWS:
+                layers.append(_read_hdf_windowed(window))
+                continue
+            window.close()
         temp = pd.read_hdf(filename)
         header = misc.DLCHeader(temp.columns)
-        temp = temp.droplevel("scorer", axis=1)
-        if "individuals" not in temp.columns.names:
-            # Append a fake level to the MultiIndex
-            # to make it look like a multi-animal DataFrame
-            old_idx = temp.columns.to_frame()
-            old_idx.insert(0, "individuals", "")
-            temp.columns = pd.MultiIndex.from_frame(old_idx)
-        df = temp.stack(["individuals", "bodyparts"]).reset_index()
-        nrows = df.shape[0]
-        data = np.empty((nrows, 3))
-
-        # Support path-agnostic MultiIndex (DLC v2.2.0.4+)
-        if 'level_1' in df.columns and 'level_2' in df.columns:
-            image_paths = df[['level_0', 'level_1', 'level_2']].agg(os.path.sep.join, axis=1)
-        else:
-            image_paths = df["level_0"]
-
-        if np.issubdtype(image_paths.dtype, np.number):
-            image_inds = image_paths.values
-            paths2inds = []
-        else:
-            image_inds, paths2inds = misc.encode_categories(image_paths, return_map=True)
-        data[:, 0] = image_inds
-        data[:, 1:] = df[["y", "x"]].to_numpy()
+        data, df, paths = _read_points(temp)
         metadata = _populate_metadata(
             header,
             labels=df["bodyparts"],
             ids=df["individuals"],
             likelihood=df.get("likelihood"),
-            paths=list(paths2inds),
+            paths=paths,
         )
         # Name of CollectedData / machinelabels file.
         metadata["name"] = os.path.split(filename)[1].split(".")[0]
+        if "machine" not in metadata["name"]:
+            # Snapshot of the file as loaded, the base of the three-way merge
+            # with the changes other sessions may save in the meantime.
+            _save_base(metadata["metadata"], filename, os.stat(filename).st_mtime_ns)
         # We make the assumption here that CollectedData/machinelabel files are
         # always placed within their ususal location following the DLC project
         # layout, i.e., they are within an image folder under
@@ -185,22 +222,262 @@ def read_hdf(filename: str) -> List[LayerData]:
     return layers
 
 
+def _read_hdf_windowed(window: "WindowedHDF") -> LayerData:
+    data, properties = window.points(0)
+    metadata = _populate_metadata(window.header, paths=window.paths)
+    metadata["properties"] = properties
+    metadata["name"] = os.path.split(window.filename)[1].split(".")[0]
+    metadata["metadata"]["root"] = window.filename.rsplit(os.sep, 3)[0]
+    metadata["metadata"]["window"] = window
+    return data, metadata, "points"
+
+
+class WindowedHDF:
+    """Windowed access to the rows of a large DLC h5 file.
+
+    Rows are read in windows of ``window_size`` frames, of which at most
+    ``max_windows`` are held in memory; neighboring windows are read ahead
+    in a background thread. Windows edited in the viewer are kept aside
+    until they are written back, so that only those need saving.
+    """
+
+    def __init__(self, filename: str, window_size: int = 1000, max_windows: int = 5):
+        self.filename = filename
+        self.window_size = window_size
+        self.max_windows = max_windows
+        with pd.HDFStore(filename, mode="r") as store:
+            self.key = store.keys()[0]
+            storer = store.get_storer(self.key)
+            storer.infer_axes()
+            # DLC data are always stored in fixed format, as tables
+            # cannot hold a column MultiIndex.
+            self.columns = storer.read_index("axis0")
+            index = storer.read_index("axis1")
+        self.header = misc.DLCHeader(self.columns)
+        self.nrows = len(index)
+        # Frame index of every row; -1 flags rows without a matching image.
+        # Until mapped to the images, frames are the codes of their paths.
+        self.paths, self.frames = misc.PathTable.from_index(index)
+        self._path_codes = self.frames.copy()
+        # Paths of the images the frame indices currently refer to
+        self._images = self.paths
+        self.current = 0
+        self._cache = OrderedDict()
+        self._pending = dict()
+        self._loaded = dict()
+        self._edits = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def n_windows(self) -> int:
+        return -(-self.nrows // self.window_size)
+
+    def bounds(self, window: int) -> Tuple[int, int]:
+        start = window * self.window_size
+        return start, min(start + self.window_size, self.nrows)
+
+    def map_paths(self, paths: Sequence[str]):
+        """Map the rows of the file to the frame indices of the image ``paths``."""
+        if not self.paths:
+            # Rows are indexed by frame already
+            return
+        paths = misc.as_path_table(paths)
+        self.frames = paths.lookup(self.paths)[self._path_codes]
+        # Edited points refer to the former frame indices; those whose
+        # image is missing are dropped, as in unwindowed layers.
+        codes = paths.lookup(self._images)
+        for window, (data, properties) in self._edits.items():
+            frames = codes[data[:, 0].astype(int)]
+            keep = frames >= 0
+            data = data[keep]
+            data[:, 0] = frames[keep]
+            self._edits[window] = data, {k: v[keep] for k, v in properties.items()}
+        self._images = paths
+        # Points handed out so far refer to the former frame indices.
+        self._loaded.clear()
+
+    def window_of(self, frame: int) -> int:
+        """Return the window holding ``frame``, or the one closest to it."""
+        rows = np.flatnonzero(self.frames == frame)
+        if not rows.size:
+            valid = np.flatnonzero(self.frames >= 0)
+            if not valid.size:
+                return 0
+            rows = valid[[np.argmin(np.abs(self.frames[valid] - frame))]]
+        return int(rows[0]) // self.window_size
+
+    def _read(self, window: int) -> pd.DataFrame:
+        start, stop = self.bounds(window)
+        # PyTables is not safe to access from several threads at once.
+        with self._lock, pd.HDFStore(self.filename, mode="r") as store:
+            storer = store.get_storer(self.key)
+            storer.infer_axes()
+            # Read the blocks directly, as pandas slices the levels of a
+            # row MultiIndex along with its codes when given start/stop.
+            blocks = []
+            for i in range(storer.nblocks):
+                items = storer.read_index(f"block{i}_items")
+                values = storer.read_array(f"block{i}_values", start=start, stop=stop)
+                blocks.append(pd.DataFrame(values.T, columns=items))
+        df = pd.concat(blocks, axis=1).reindex(columns=self.columns)
+        df.index = pd.RangeIndex(start, stop)
+        return df
+
+    def _collect_pending(self):
+        for window, future in list(self._pending.items()):
+            if future.done():
+                self._pending.pop(window)
+                self._cache_window(window, future.result())
+
+    def _cache_window(self, window: int, df: pd.DataFrame):
+        self._cache[window] = df
+        self._cache.move_to_end(window)
+        while len(self._cache) > self.max_windows:
+            self._cache.popitem(last=False)
+
+    def get(self, window: int) -> pd.DataFrame:
+        """Return the rows of ``window`` as read from the file."""
+        self._collect_pending()
+        if window in self._cache:
+            self._cache.move_to_end(window)
+            return self._cache[window]
+        future = self._pending.pop(window, None)
+        df = future.result() if future is not None else self._read(window)
+        self._cache_window(window, df)
+        return df
+
+    def prefetch(self, windows: Iterable[int]):
+        """Read ``windows`` ahead in the background, dropping stale requests."""
+        self._collect_pending()
+        windows = [
+            window
+            for window in windows
+            if 0 <= window < self.n_windows
+            and window not in self._cache
+            and window not in self._edits
+        ]
+        for window in list(self._pending):
+            if window not in windows and self._pending[window].cancel():
+                self._pending.pop(window)
+        for window in windows:
+            if window not in self._pending:
+                self._pending[window] = self._executor.submit(self._read, window)
+
+    def points(self, window: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Return the Points coordinates and properties of ``window``."""
+        if window in self._edits:
+            data, properties = self._edits[window]
+        else:
+            data, properties = self._to_points(self.get(window))
+        self._loaded[window] = data, properties
+        return data.copy(), {k: np.array(v) for k, v in properties.items()}
+
+    def _to_points(self, df: pd.DataFrame) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        data, df, _ = _read_points(df)
+        data[:, 0] = self.frames[data[:, 0].astype(int)]
+        keep = data[:, 0] >= 0
+        likelihood = df.get("likelihood")
+        properties = _populate_metadata(
+            self.header,
+            labels=df["bodyparts"].to_numpy()[keep],
+            ids=df["individuals"].to_numpy()[keep],
+            likelihood=None if likelihood is None else likelihood.to_numpy()[keep],
+        )["properties"]
+        return data[keep], properties
+
+    def frame_states(self, n_frames: int) -> np.ndarray:
+        """Return the labeling state of every frame, one window at a time.
+
+        Edited windows are taken as edited; the others are read from the
+        file if not cached, without evicting the cached windows.
+        """
+        states = np.full(n_frames, analysis.UNLABELED, dtype=np.int8)
+        for window in range(self.n_windows):
+            if window in self._edits:
+                data, properties = self._edits[window]
+            else:
+                df = self._cache.get(window)
+                data, properties = self._to_points(
+                    df if df is not None else self._read(window)
+                )
+            window_states = analysis.frame_states(
+                data[:, 0], properties["valid"], n_frames
+            )
+            # Frames are labeled, or of low confidence, in any of their rows
+            np.maximum(states, window_states, out=states)
+        return states
+
+    def stash(self, window: int, data: np.ndarray, properties: Dict[str, np.ndarray]):
+        """Keep aside the points of ``window`` if they were edited."""
+        loaded = self._loaded.get(window)
+        if loaded is not None:
+            data_, properties_ = loaded
+            if np.array_equal(data, data_) and all(
+                np.array_equal(properties[k], v) for k, v in properties_.items()
+            ):
+                return
+        self._edits[window] = (
+            data.copy(),
+            {k: np.array(v) for k, v in properties.items()},
+        )
+
+    def edited_points(
+        self, data: np.ndarray, properties: Dict[str, np.ndarray]
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Gather the points of the edited windows and of the current one.
+
+        ``data`` and ``properties`` are the points currently displayed.
+        Points of the other windows are left out, so that saving only
+        writes the rows of these windows; the file itself is not rewritten.
+        """
+        self.stash(self.current, data, properties)
+        windows = sorted(set(self._edits) | {self.current})
+        points = [self._edits.get(window, (data, properties)) for window in windows]
+        return (
+            np.concatenate([data_ for data_, _ in points]),
+            {k: np.concatenate([props[k] for _, props in points]) for k in properties},
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _points_to_dataframe(
+    data: np.ndarray, properties: Dict[str, np.ndarray], header: misc.DLCHeader
+) -> pd.DataFrame:
+    """Scatter Points coordinates into DLC wide-format data.
+
+    Every value is written straight to its (frame row, column) position
+    in a preallocated array, which is only then wrapped in a DataFrame.
+    """
+    frames, rows = np.unique(data[:, 0].astype(int), return_inverse=True)
+    coords = "x", "y", "likelihood"
+    values = np.column_stack([data[:, 2], data[:, 1], properties["likelihood"]])
+    values = values.astype(float)
+    cols = np.full(values.shape, -1)
+    positions = header.column_positions
+    for j, coord in enumerate(coords):
+        if coord in header.coord_codes:
+            i = header.coord_codes[coord]
+            cols[:, j] = positions[properties["id"], properties["label"], i]
+    valid = ~np.isnan(values)
+    # As with DataFrame.stack, frames without any value are left out.
+    keep = np.bincount(rows, weights=valid.any(axis=1), minlength=len(frames)) > 0
+    mask = valid & (cols >= 0)
+    array = np.full((len(frames), len(header.columns)), np.nan)
+    array[np.broadcast_to(rows[:, None], cols.shape)[mask], cols[mask]] = values[mask]
+    return pd.DataFrame(array[keep], index=frames[keep], columns=header.columns)
+
+
 def write_hdf(filename: str, data: Any, metadata: Dict) -> Optional[str]:
-    temp = pd.DataFrame(data[:, -1:0:-1], columns=["x", "y"])
     properties = metadata["properties"]
     meta = metadata["metadata"]
-    temp["bodyparts"] = properties["label"]
-    temp["individuals"] = properties["id"]
-    temp["inds"] = data[:, 0].astype(int)
-    temp["likelihood"] = properties["likelihood"]
-    temp["scorer"] = meta["header"].scorer
-    df = temp.set_index(["scorer", "individuals", "bodyparts", "inds"]).stack()
-    df.index = df.index.set_names("coords", level=-1)
-    df = df.unstack(["scorer", "individuals", "bodyparts", "coords"])
-    df.index.name = None
-    if not properties["id"].size:  # 'id' array with 0 entries
-        df = df.droplevel("individuals", axis=1)
-    df = df.reindex(meta["header"].columns, axis=1)
+    window = meta.get("window")
+    if window is not None:
+        # Only write back the windows that were edited.
+        data, properties = window.edited_points(data, properties)
+    df = _points_to_dataframe(data, properties, meta["header"])
     root = meta["root"]
 
     # XXX: Can 'paths' value be empty?
@@ -209,60 +486,377 @@ def write_hdf(filename: str, data: Any, metadata: Dict) -> Optional[str]:
     img_folder = root
 
     if meta["paths"]:
-        df.index = [meta["paths"][i] for i in df.index]
+        paths = misc.as_path_table(meta["paths"])
         # Create path-agnostic MultiIndex (DLC v2.2.0.4+)
-        splits = tuple(df.index.str.split(os.path.sep))
-        # Fails if `df` is empty, i.e., no images have been annotated.
-        df.index = pd.MultiIndex.from_tuples(splits)
+        df.index = paths.to_index(df.index)
         # Take the relative path of the first image in `paths`, split off
         # the image name, and append it to the DLC project root directory
         # to get the absolute path to the image folder.
-        img_folder = os.path.join(root, os.path.split(meta['paths'][0])[0])
+        img_folder = os.path.join(root, *paths.parts[0][:-1])
 
     name = metadata["name"]
 
-    if "machine" in name:  # We are attempting to save refined model predictions
-        # XXX: df does not seem to have a 'likelihood' column => ignore error
-        df.drop("likelihood", axis=1, level="coords", inplace=True, errors='ignore')
-        header = misc.DLCHeader(df.columns)
-        gt_file = ""
-        for file in os.listdir(img_folder):
-            if file.startswith("CollectedData") and file.endswith("h5"):
-                gt_file = file
-                break
-        if gt_file:  # Refined predictions must be merged into the existing data
-            df_gt = pd.read_hdf(os.path.join(img_folder, gt_file))
-            new_scorer = df_gt.columns.get_level_values("scorer")[0]
-            header.scorer = new_scorer
-            df.columns = header.columns
-            df = pd.concat((df, df_gt))
-            df = df[~df.index.duplicated(keep="first")]
-            name = os.path.splitext(gt_file)[0]
+    # Sessions sharing the folder, e.g., on a network drive, save one at a time.
+    with FileLock(os.path.join(img_folder, "CollectedData")):
+        local = None
+        if "machine" in name:  # We are attempting to save refined model predictions
+            # XXX: df does not seem to have a 'likelihood' column => ignore error
+            df.drop("likelihood", axis=1, level="coords", inplace=True, errors='ignore')
+            header = misc.DLCHeader(df.columns)
+            gt_file = ""
+            for file in os.listdir(img_folder):
+                if file.startswith("CollectedData") and file.endswith("h5"):
+                    gt_file = file
+                    break
+            if gt_file:  # Refined predictions must be merged into the existing data
+                df_gt = pd.read_hdf(os.path.join(img_folder, gt_file))
+                new_scorer = df_gt.columns.get_level_values("scorer")[0]
+                header.scorer = new_scorer
+                df.columns = header.columns
+                df = pd.concat((df, df_gt))
+                df = df[~df.index.duplicated(keep="first")]
+                name = os.path.splitext(gt_file)[0]
+            else:
+                # Let us fetch the config.yaml file to get the scorer name...
+                config = _load_config(os.path.join(root, "config.yaml"))
+                new_scorer = config["scorer"]
+                header.scorer = new_scorer
+                df.columns = header.columns
+                name = f"CollectedData_{new_scorer}"
         else:
-            # Let us fetch the config.yaml file to get the scorer name...
-            config = _load_config(os.path.join(root, "config.yaml"))
-            new_scorer = config["scorer"]
-            header.scorer = new_scorer
-            df.columns = header.columns
-            name = f"CollectedData_{new_scorer}"
-
-    df.sort_index(inplace=True)
-
-    filename = name
-    filepath = os.path.join(img_folder, filename)
-    df.to_hdf(filepath + '.h5', key="df_with_missing")
-    # XXX: Temp for debugging: also store dataframe as CSV.
-    df.to_csv(filepath + '.csv')
-    
+            local = df
+            filepath = os.path.join(img_folder, name + ".h5")
+            # Merge in the changes saved by other sessions since loading;
+            # layers not loaded from the file, e.g., labeled from the config,
+            # merge with all of its labels, as if starting from no labels.
+            if os.path.isfile(filepath) and (
+                "base_path" not in meta
+                or os.stat(filepath).st_mtime_ns != meta["base_mtime"]
+            ):
+                base = _load_base(meta)
+                if base is None:
+                    base = local.iloc[:0]
+                df, n_conflicts = merge_annotations(
+                    base, local, pd.read_hdf(filepath)
+                )
+                if n_conflicts:
+                    warnings.warn(
+                        f"{n_conflicts} labels were also changed in {filepath} "
+                        "by another session; yours were kept."
+                    )
+
+        df.sort_index(inplace=True)
+
+        filename = name
+        filepath = os.path.join(img_folder, filename)
+        df.to_hdf(filepath + '.h5', key="df_with_missing")
+        # XXX: Temp for debugging: also store dataframe as CSV.
+        df.to_csv(filepath + '.csv')
+        if local is not None:
+            # The layer does not show the changes of other sessions, so its
+            # next edits are to be merged with respect to its own labels;
+            # the merge is then due even if no other session saves again.
+            merged = df is not local
+            mtime = None if merged else os.stat(filepath + ".h5").st_mtime_ns
+            _save_base(meta, local, mtime)
+
     return filename
 
 
+_base_dir = None
+
+
+def _file_hash(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_base(meta: Dict, base: Union[str, pd.DataFrame], mtime: Optional[int]):
+    """Keep the base of the three-way merge on disk rather than in memory.
+
+    ``base`` is either a data file, which is copied, or the labels
+    themselves. Only the path of the copy, its hash and the mtime of the
+    file it stands for are stored in the layer ``meta``.
+    """
+    global _base_dir
+    if _base_dir is None:
+        # Removed along with the copies when the session ends
+        _base_dir = tempfile.TemporaryDirectory(prefix="dlclabel-")
+    path = meta.get("base_path")
+    if path is None:
+        path = os.path.join(_base_dir.name, f"{uuid.uuid4().hex}.h5")
+    if isinstance(base, str):
+        shutil.copyfile(base, path)
+    else:
+        base.to_hdf(path, key="df_with_missing", mode="w")
+    meta.update(base_path=path, base_hash=_file_hash(path), base_mtime=mtime)
+
+
+def _load_base(meta: Dict) -> Optional[pd.DataFrame]:
+    """Read back the base of the three-way merge, None if there is none."""
+    path = meta.get("base_path")
+    if path is None:
+        return None
+    if not os.path.isfile(path) or _file_hash(path) != meta["base_hash"]:
+        warnings.warn(
+            f"The labels as loaded ({path}) were removed or modified; "
+            "labels are merged as if starting from no labels."
+        )
+        return None
+    return pd.read_hdf(path)
+
+
+def _path_index(index: pd.Index) -> pd.Index:
+    """Split image paths into a MultiIndex, whatever their directory separator."""
+    if isinstance(index, pd.MultiIndex) or pd.api.types.is_numeric_dtype(index):
+        return index
+    paths, codes = misc.PathTable.from_index(index)
+    return paths.to_index(codes)
+
+
+def merge_annotations(
+    base: pd.DataFrame, local: pd.DataFrame, remote: pd.DataFrame
+) -> Tuple[pd.DataFrame, int]:
+    """Three-way merge of DLC wide-format data.
+
+    ``local`` and ``remote`` are two versions derived from ``base``,
+    e.g., the labels of this session and those another session saved
+    since they were loaded. All three are aligned on their rows (images)
+    and columns; every value changed on one side only is taken from that
+    side, and values changed differently on both sides are conflicts,
+    resolved in favor of ``local``.
+
+    Returns
+    -------
+    merged : pd.DataFrame
+        The merged data, without the images left without any label.
+    n_conflicts : int
+        The number of conflicting values.
+    """
+    frames = [
+        df.set_axis(_path_index(df.index), axis=0) for df in (base, local, remote)
+    ]
+    base, local, remote = frames
+    index = local.index.union(remote.index).union(base.index)
+    columns = local.columns.append(remote.columns.difference(local.columns))
+    base_, local_, remote_ = (
+        df.reindex(index=index, columns=columns).to_numpy(dtype=float)
+        for df in frames
+    )
+
+    def same(a, b):
+        return (a == b) | (np.isnan(a) & np.isnan(b))
+
+    local_changed = ~same(local_, base_)
+    remote_changed = ~same(remote_, base_)
+    conflicts = local_changed & remote_changed & ~same(local_, remote_)
+    merged = np.where(remote_changed & ~local_changed, remote_, local_)
+    df = pd.DataFrame(merged, index=index, columns=columns)
+    return df.dropna(how="all"), int(conflicts.sum())
+
+
+class FileLock:
+    """Exclusive lock on a file shared by several sessions.
+
+    The lock is a ``.lock`` file next to ``filename``, created atomically,
+    which also works on network filesystems. Locks older than
+    ``stale_after`` seconds are assumed to be left over by a session
+    that crashed, and are broken.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        timeout: float = 30,
+        stale_after: float = 300,
+        poll_interval: float = 0.1,
+    ):
+        self.lockfile = f"{filename}.lock"
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._owner = f"{socket.gethostname()} {os.getpid()} {id(self)}"
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stat = os.stat(self.lockfile)
+                except FileNotFoundError:  # Released in the meantime
+                    continue
+                if time.time() - stat.st_mtime > self.stale_after:
+                    self._break(stat)
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{self.lockfile} is held by another session.")
+                time.sleep(self.poll_interval)
+            else:
+                with os.fdopen(fd, "w") as file:
+                    file.write(self._owner)
+                return
+
+    def _break(self, stale: os.stat_result):
+        """Remove the stale lock, unless another session replaced it meanwhile.
+
+        Of the sessions breaking a lock at once, only one gets to move it
+        away, as renaming is atomic; it then checks it moved the lock found
+        stale rather than one just taken, which is put back.
+        """
+        moved = f"{self.lockfile}.{uuid.uuid4().hex}"
+        try:
+            os.rename(self.lockfile, moved)
+        except FileNotFoundError:
+            return
+        stat = os.stat(moved)
+        if (stat.st_ino, stat.st_mtime_ns) != (stale.st_ino, stale.st_mtime_ns):
+            try:
+                os.link(moved, self.lockfile)
+            except FileExistsError:
+                pass
+        os.remove(moved)
+
+    def release(self):
+        # Leave alone a lock that was broken and taken over meanwhile
+        try:
+            with open(self.lockfile) as file:
+                owned = file.read() == self._owner
+        except FileNotFoundError:
+            return
+        if owned:
+            os.remove(self.lockfile)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class MaskPolygons:
+    """Polygons of a vertices.csv file written by :func:`write_masks`.
+
+    The vertices of all shapes are held in a single array, sorted by
+    frame, from which the polygons of any frames are split out at once.
+    Shapes of a frame edited in the viewer replace those read from the file.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        df = pd.read_csv(filename)
+        df = df.sort_values(["index", "vertex-index"], kind="stable")
+        axes = [col for col in df.columns if col.startswith("axis-")]
+        vertices = df[axes].to_numpy(dtype=float)
+        shape_inds = df["index"].to_numpy()
+        starts = np.flatnonzero(np.diff(shape_inds, prepend=-1) != 0)
+        lengths = np.diff(np.r_[starts, len(vertices)])
+        shape_types = df["shape-type"].to_numpy(dtype=object)[starts]
+        frames = vertices[starts, 0].astype(int)
+        # Reorder whole shapes by frame, keeping their order within a frame
+        order = np.argsort(frames, kind="stable")
+        lengths = lengths[order]
+        ends = np.cumsum(lengths)
+        offsets = starts[order] - (ends - lengths)
+        rows = np.arange(len(vertices)) + np.repeat(offsets, lengths)
+        self.vertices = vertices[rows]
+        self.bounds = np.r_[0, ends]
+        self.frames = frames[order]
+        self.shape_types = shape_types[order]
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def _shape_range(self, frame: int) -> Tuple[int, int]:
+        return (
+            np.searchsorted(self.frames, frame, side="left"),
+            np.searchsorted(self.frames, frame, side="right"),
+        )
+
+    def shapes(
+        self, frames: Optional[Sequence[int]] = None
+    ) -> Tuple[List[np.ndarray], List[str]]:
+        """Return the polygons and shape types of ``frames``, or of all frames."""
+        if frames is None:
+            ranges = [(0, len(self))]
+        else:
+            ranges = [self._shape_range(frame) for frame in sorted(frames)]
+        polygons, shape_types = [], []
+        for first, last in ranges:
+            start, stop = self.bounds[first], self.bounds[last]
+            splits = self.bounds[first + 1 : last] - start
+            polygons += np.split(self.vertices[start:stop], splits)
+            shape_types += list(self.shape_types[first:last])
+        return polygons, shape_types
+
+    def replace(self, frame: int, polygons: List[np.ndarray], shape_types: List[str]):
+        """Replace the shapes of ``frame``, e.g., after editing them in the viewer."""
+        first, last = self._shape_range(frame)
+        start, stop = self.bounds[first], self.bounds[last]
+        lengths = np.array([len(polygon) for polygon in polygons], dtype=int)
+        new = np.concatenate(polygons) if polygons else self.vertices[:0]
+        # Shapes drawn in the viewer lie in the current frame
+        new[:, 0] = frame
+        self.vertices = np.concatenate(
+            [self.vertices[:start], new, self.vertices[stop:]]
+        )
+        self.bounds = np.r_[
+            self.bounds[: first + 1],
+            start + np.cumsum(lengths),
+            self.bounds[last + 1 :] + (len(new) - (stop - start)),
+        ]
+        self.frames = np.r_[
+            self.frames[:first], np.full(len(polygons), frame), self.frames[last:]
+        ]
+        self.shape_types = np.r_[
+            self.shape_types[:first],
+            np.array(shape_types, dtype=object),
+            self.shape_types[last:],
+        ]
+
+
+def read_masks(path: str) -> List[LayerData]:
+    """Read the polygons saved by :func:`write_masks` back into a Shapes layer.
+
+    ``path`` is the vertices.csv file or the folder containing it. Large
+    files only have the shapes of the first annotated frame loaded at first;
+    the viewer swaps in those of the other frames as they are shown.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "vertices.csv")
+    polygons = MaskPolygons(path)
+    folder = os.path.dirname(os.path.abspath(path))
+    metadata = {
+        "name": os.path.basename(folder),
+        "metadata": {"root": os.path.dirname(folder)},
+    }
+    if len(polygons) > LAZY_MIN_SHAPES:
+        frame = int(polygons.frames[0])
+        data, shape_types = polygons.shapes([frame])
+        metadata["metadata"].update(polygons=polygons, frame=frame)
+    else:
+        data, shape_types = polygons.shapes()
+    metadata["shape_type"] = shape_types
+    return [(data, metadata, "shapes")]
+
+
 def write_masks(foldername: str, data: Any, metadata: Dict) -> Optional[str]:
     folder, _ = os.path.splitext(foldername)
     os.makedirs(folder, exist_ok=True)
     filename = os.path.join(folder, "{}_obj_{}.png")
-    shapes = Shapes(data, shape_type="polygon")
     meta = metadata["metadata"]
+    polygons = meta.get("polygons")
+    if polygons is not None:
+        # Only the shapes of the current frame are in the layer
+        polygons.replace(meta["frame"], data, metadata["shape_type"])
+        data, shape_types = polygons.shapes()
+        metadata = dict(metadata, shape_type=shape_types)
+    shapes = Shapes(data, shape_type="polygon")
     frame_inds = [int(array[0, 0]) for array in data]
     shape_inds = []
     for _, group in groupby(frame_inds):
@@ -1,13 +1,15 @@
 from collections import namedtuple
+from contextlib import contextmanager
 from enum import auto
-from typing import List, Sequence, Union
+from typing import Dict, List, Optional, Sequence, Union
 
 import numpy as np
 from napari.layers import Points
 from napari.utils.events import Event
 from napari.utils.status_messages import format_float
 
-from dlclabel.misc import CycleEnum
+from dlclabel import tracks
+from dlclabel.misc import CODE_DTYPE, CycleEnum, Edit, EditHistory
 
 
 class LabelMode(CycleEnum):
@@ -63,6 +65,14 @@ class KeyPoints(Points):
     ):
         if data is None:
             data = np.empty((0, 3))
+        # Labels and ids are stored as integer codes into these categories;
+        # they are only expanded into strings for display, e.g., as text.
+        header = metadata["header"]
+        self._categories = {
+            "label": np.asarray(header.bodyparts),
+            "id": np.asarray(header.individuals),
+        }
+        self._codes = {"label": header.bodypart_codes, "id": header.individual_codes}
         super(KeyPoints, self).__init__(
             data,
             properties=properties,
@@ -89,8 +99,12 @@ class KeyPoints(Points):
         )
         self.class_keymap.update(super(KeyPoints, self).class_keymap)
         self._all_keypoints = []
+        self._all_keys = None
+        self._history = EditHistory()
         self._label_mode = LabelMode.default()
         self._text.visible = False
+        if self.text.values is not None:
+            self.refresh_text()
 
         # Hack to make text annotation work when labeling from scratch
         if self.text.values is None:
@@ -106,7 +120,10 @@ class KeyPoints(Points):
             False: np.array([1, 0, 0, 1]),
         }
 
-        self.events.add(query_next_frame=Event)
+        # Emitted with the kind of edit, the rows it affected and their unique
+        # frames, as well as the frame and keypoint key of every row.
+        self.events.add(query_next_frame=Event, edited=Event)
+        self._is_editing = False
 
     @property
     def all_keypoints(self):
@@ -116,6 +133,62 @@ class KeyPoints(Points):
             self._all_keypoints = [KeyPoint(label, id_) for id_, label in all_pairs]
         return self._all_keypoints
 
+    @property
+    def _all_keypoint_keys(self) -> np.ndarray:
+        if self._all_keys is None:
+            labels, ids = zip(*self.all_keypoints)
+            self._all_keys = self._keypoint_keys(
+                self._encode("label", labels), self._encode("id", ids)
+            )
+        return self._all_keys
+
+    def _encode(self, prop: str, names: Sequence[str]) -> np.ndarray:
+        return np.asarray([self._codes[prop][name] for name in names], dtype=CODE_DTYPE)
+
+    def _decode(self, prop: str, codes: np.ndarray) -> np.ndarray:
+        """Expand codes into their names; unknown (negative) codes are blank."""
+        codes = np.asarray(codes, dtype=int)
+        names = self._categories[prop][np.maximum(codes, 0)]
+        return np.where(codes >= 0, names, "")
+
+    def _decode_properties(self, properties: Dict) -> Dict:
+        return {
+            k: self._decode(k, v) if k in self._categories else v
+            for k, v in properties.items()
+        }
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        Points.text.fset(self, text)
+        self.refresh_text()
+
+    def refresh_text(self):
+        """Refresh the text values from the names of labels and ids."""
+        self.text.refresh_text(self._decode_properties(self.properties))
+
+    def get_message(self) -> str:
+        """Name the keypoint under the cursor in the status bar."""
+        msg = super(KeyPoints, self).get_message()
+        if self._value is not None and self._value < len(self.data):
+            keypoint = self._describe(self._value)
+            name = f"{keypoint.id} {keypoint.label}" if keypoint.id else keypoint.label
+            msg += f" ({name})"
+        return msg
+
+    def _describe(self, row: int) -> KeyPoint:
+        return KeyPoint(
+            label=str(self._decode("label", self.properties["label"][row])),
+            id=str(self._decode("id", self.properties["id"][row])),
+        )
+
+    def _keypoint_keys(self, labels: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Combine label and id codes into a single integer per keypoint."""
+        return labels.astype(int) * len(self._categories["id"]) + ids
+
     @Points.bind_key("E")
     def toggle_edge_color(self):
         self.edge_width ^= 2  # Trick to toggle between 0 and 2
@@ -157,13 +230,13 @@ class KeyPoints(Points):
 
     @property
     def current_label(self) -> str:
-        return self.current_properties["label"][0]
+        return str(self._decode("label", self.current_properties["label"][0]))
 
     @current_label.setter
     def current_label(self, label: str):
         if not len(self.selected_data):
             current_properties = self.current_properties
-            current_properties["label"] = np.asarray([label])
+            current_properties["label"] = self._encode("label", [label])
             self.current_properties = current_properties
 
     @property
@@ -172,44 +245,80 @@ class KeyPoints(Points):
 
     @property
     def current_id(self) -> str:
-        return self.current_properties["id"][0]
+        return str(self._decode("id", self.current_properties["id"][0]))
 
     @current_id.setter
     def current_id(self, id_: str):
         if not len(self.selected_data):
             current_properties = self.current_properties
-            current_properties["id"] = np.asarray([id_])
+            current_properties["id"] = self._encode("id", [id_])
             self.current_properties = current_properties
 
     @property
     def annotated_keypoints(self) -> List[KeyPoint]:
         mask = self.current_mask
-        labels = self.properties["label"][mask]
-        ids = self.properties["id"][mask]
-        return [KeyPoint(label, id_) for label, id_ in zip(labels, ids)]
+        labels = self._decode("label", self.properties["label"][mask])
+        ids = self._decode("id", self.properties["id"][mask])
+        return [
+            KeyPoint(label, id_) for label, id_ in zip(labels.tolist(), ids.tolist())
+        ]
+
+    @property
+    def _annotated_keys(self) -> np.ndarray:
+        mask = self.current_mask
+        return self._keypoint_keys(
+            self.properties["label"][mask], self.properties["id"][mask]
+        )
 
     @property
     def current_keypoint(self) -> KeyPoint:
-        props = self.current_properties
-        return KeyPoint(label=props["label"][0], id=props["id"][0])
+        return KeyPoint(label=self.current_label, id=self.current_id)
 
     @current_keypoint.setter
     def current_keypoint(self, keypoint: KeyPoint):
         # Avoid changing the properties of a selected point
         if not len(self.selected_data):
             current_properties = self.current_properties
-            current_properties["label"] = np.asarray([keypoint.label])
-            current_properties["id"] = np.asarray([keypoint.id])
+            current_properties["label"] = self._encode("label", [keypoint.label])
+            current_properties["id"] = self._encode("id", [keypoint.id])
             self.current_properties = current_properties
 
+    def _find_current_keypoint(self) -> Optional[int]:
+        """Return the index of the current keypoint if annotated in this frame."""
+        props = self.properties
+        current = self.current_properties
+        matches = np.flatnonzero(
+            self.current_mask
+            & (props["label"] == current["label"][0])
+            & (props["id"] == current["id"][0])
+        )
+        return matches[0] if matches.size else None
+
     def add(self, coord):
-        if self.current_keypoint not in self.annotated_keypoints:
-            super(KeyPoints, self).add(coord)
+        ind = self._find_current_keypoint()
+        if ind is None:
+            rows = np.array([len(self.data)])
+            with self._editing("add", rows):
+                super(KeyPoints, self).add(coord)
+                # napari makes the text of new points from their codes
+                if self.text.values is not None:
+                    self.text.remove(rows)
+                    self.text.add(self._decode_properties(self.current_properties), 1)
+            self._history.push(
+                Edit(
+                    "add",
+                    rows,
+                    None,
+                    self.data[rows],
+                    self._take_properties(rows),
+                    self._take_state(rows),
+                )
+            )
         elif self._label_mode is LabelMode.QUICK:
-            ind = self.annotated_keypoints.index(self.current_keypoint)
-            data = self.data
-            data[np.flatnonzero(self.current_mask)[ind]] = coord
-            self.data = data
+            rows = np.array([ind])
+            new = np.atleast_2d(coord)
+            self._history.push(Edit("move", rows, self.data[rows], new, None))
+            self._set_coords(rows, new)
         self.selected_data = set()
         if self._label_mode is LabelMode.LOOP:
             self.events.query_next_frame()
@@ -226,15 +335,214 @@ class KeyPoints(Points):
             self.events.size()
         self.status = format_float(self.current_size)
 
+    def _replace_data(
+        self,
+        data: np.ndarray,
+        properties: Dict[str, np.ndarray],
+        state: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        """Replace all points, their properties and other per-point arrays at once.
+
+        napari only grows or shrinks the sizes and colors at the end of
+        the arrays as data change; they are thus all rebuilt from ``state``,
+        or set to those of new points if not given.
+        """
+        if state is None:
+            state = self._new_state(len(data))
+        self.selected_data = set()
+        # Listeners should only be notified once properties match the data.
+        with self.events.data.blocker(), self.block_update_properties():
+            self.data = data
+        self._size = state["size"]
+        self._edge_color = state["edge_color"]
+        self._face_color = state["face_color"]
+        self.properties = properties
+        self.selected_data = set()
+        # Colors mapped from properties are computed again
+        self.refresh_colors()
+        self.refresh()
+        self.events.data()
+
+    def _take_properties(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        return {k: v[rows] for k, v in self.properties.items()}
+
+    def _take_state(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        return {
+            "size": self._size[rows],
+            "edge_color": self._edge_color[rows],
+            "face_color": self._face_color[rows],
+        }
+
+    def _new_state(self, n_points: int) -> Dict[str, np.ndarray]:
+        """Per-point arrays of points about to be added, as napari sets them."""
+        if len(self._size):
+            size = self._size[-1].copy()
+            size[list(self._dims.displayed)] = self.current_size
+        else:
+            size = np.repeat(self.current_size, self._size.shape[1])
+        return {
+            "size": np.tile(size, (n_points, 1)),
+            "edge_color": np.tile(self._current_edge_color, (n_points, 1)),
+            "face_color": np.tile(self._current_face_color, (n_points, 1)),
+        }
+
+    @contextmanager
+    def _editing(self, kind: str, rows: np.ndarray):
+        """Apply an edit, then tell listeners which rows and frames it affected.
+
+        Listeners of the data event may skip the updates made meanwhile,
+        as ``_is_editing`` is set.
+        """
+        # Removed points are only known beforehand
+        if kind == "remove":
+            points = self._describe_rows(rows)
+        self._is_editing = True
+        try:
+            yield
+        finally:
+            self._is_editing = False
+        if kind != "remove":
+            points = self._describe_rows(rows)
+        self._emit_edited(kind, rows, *points)
+
+    def _describe_rows(self, rows: np.ndarray):
+        """Return the frames and keypoint keys of ``rows``."""
+        properties = self.properties
+        keys = self._keypoint_keys(properties["label"][rows], properties["id"][rows])
+        return self.data[rows, 0], keys
+
+    def _emit_edited(
+        self, kind: str, rows: np.ndarray, row_frames: np.ndarray, keys: np.ndarray
+    ):
+        self.events.edited(
+            kind=kind,
+            rows=rows,
+            frames=np.unique(row_frames),
+            row_frames=row_frames,
+            keys=keys,
+        )
+
+    def _set_coords(self, rows: np.ndarray, coords: np.ndarray):
+        """Move points in place, without reallocating the data."""
+        with self._editing("move", rows):
+            self.data[rows] = coords
+            self.refresh()
+
+    def _insert_rows(
+        self,
+        rows: np.ndarray,
+        coords: np.ndarray,
+        properties: Dict[str, np.ndarray],
+        state: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        """Insert points so that they end up at ``rows``.
+
+        ``state`` holds the sizes and colors of the points, e.g., as they
+        were removed; new points get the current ones.
+        """
+        positions = rows - np.arange(len(rows))
+        if state is None:
+            state = self._new_state(len(rows))
+        data = np.insert(self.data, positions, coords, axis=0)
+        properties = {
+            k: np.insert(v, positions, properties[k], axis=0)
+            for k, v in self.properties.items()
+        }
+        state = {
+            k: np.insert(v, positions, state[k], axis=0)
+            for k, v in self._take_state(slice(None)).items()
+        }
+        with self._editing("add", rows):
+            self._replace_data(data, properties, state)
+
+    def _delete_rows(self, rows: np.ndarray):
+        with self._editing("remove", rows):
+            self.selected_data = set(rows.tolist())
+            super(KeyPoints, self).remove_selected()
+
+    def remove_selected(self):
+        rows = np.array(sorted(self.selected_data), dtype=int)
+        if rows.size:
+            self._history.push(
+                Edit(
+                    "remove",
+                    rows,
+                    self.data[rows],
+                    None,
+                    self._take_properties(rows),
+                    self._take_state(rows),
+                )
+            )
+            self._delete_rows(rows)
+
+    def _move(self, index, coord):
+        rows = np.array(sorted(index), dtype=int)
+        if not rows.size:
+            return
+        # A drag starts with the first move; later moves amend the same edit.
+        if self._drag_start is None:
+            self._history.push(Edit("move", rows, self.data[rows], None, None))
+        super(KeyPoints, self)._move(index, coord)
+        self._history.amend(new=self.data[rows])
+        self._emit_edited("move", rows, *self._describe_rows(rows))
+
+    def interpolate(self, method: str = "linear"):
+        """Fill the frames between annotated keyframes of every keypoint.
+
+        Filled points get a low likelihood so they stand out for review.
+        """
+        keys = self._keypoint_keys(self.properties["label"], self.properties["id"])
+        data, source = tracks.interpolate_keyframes(self.data, keys, method)
+        if not len(data):
+            return
+        properties = self._take_properties(source)
+        properties["likelihood"] = np.full(len(data), tracks.FILLED_LIKELIHOOD)
+        properties["valid"] = np.zeros(len(data), dtype=bool)
+        self._append_points(data, properties)
+
+    def undo(self, *args):
+        edit = self._history.undo()
+        if edit is None:
+            return
+        if edit.kind == "move":
+            self._set_coords(edit.rows, edit.old)
+        elif edit.kind == "add":
+            self._delete_rows(edit.rows)
+        else:
+            self._insert_rows(edit.rows, edit.old, edit.properties, edit.state)
+
+    def redo(self, *args):
+        edit = self._history.redo()
+        if edit is None:
+            return
+        if edit.kind == "move":
+            self._set_coords(edit.rows, edit.new)
+        elif edit.kind == "add":
+            self._insert_rows(edit.rows, edit.new, edit.properties, edit.state)
+        else:
+            self._delete_rows(edit.rows)
+
+    def load_window(self, event=None, force: bool = False):
+        """Page in the points around the current frame if data are windowed."""
+        window = self.metadata.get("window")
+        if window is None:
+            return
+        ind = window.window_of(self._slice_indices[0])
+        if ind == window.current and not force:
+            return
+        if not force:
+            window.stash(window.current, self.data, self.properties)
+        window.current = ind
+        self._replace_data(*window.points(ind))
+        # Edits refer to rows of the previous window
+        self._history.clear()
+        window.prefetch([ind - 1, ind + 1])
+
     def smart_reset(self, event):
         """Set current keypoint to the first unlabeled one."""
-        unannotated = ""
-        already_annotated = self.annotated_keypoints
-        for keypoint in self.all_keypoints:
-            if keypoint not in already_annotated:
-                unannotated = keypoint
-                break
-        self.current_keypoint = unannotated if unannotated else self.all_keypoints[0]
+        annotated = np.isin(self._all_keypoint_keys, self._annotated_keys)
+        ind = 0 if annotated.all() else np.argmin(annotated)
+        self.current_keypoint = self.all_keypoints[ind]
 
     def next_keypoint(self, *args):
         ind = self.all_keypoints.index(self.current_keypoint) + 1
@@ -252,22 +560,79 @@ class KeyPoints(Points):
 
     def _paste_data(self):
         """Paste only currently unannotated data."""
+        self.paste_to_frames([self._slice_indices[0]])
+
+    def paste_to_frames(self, frames: Sequence[int]):
+        """Paste the copied points into all ``frames`` at once.
+
+        Keypoints that are already annotated in a frame are skipped there;
+        all other points are appended in a single data update, with the
+        sizes and colors they were copied with.
+        """
         properties = self._clipboard.get("properties")
-        if properties is None:
+        if properties is None or not len(frames):
             return
-        unannotated = [
-            KeyPoint(label, id_) not in self.annotated_keypoints
-            for label, id_ in zip(properties["label"], properties["id"])
-        ]
-        new_properties = {k: v[unannotated] for k, v in properties.items()}
-        new_indices = self._clipboard["indices"][:1] + tuple(
-            inds
-            for inds, keep in zip(self._clipboard["indices"][1:], unannotated)
-            if keep
+        frames = np.unique(np.asarray(frames, dtype=int))
+        copied = self._clipboard["data"]
+        keys = self._keypoint_keys(properties["label"], properties["id"])
+        inds = np.tile(np.arange(len(copied)), len(frames))
+        data = copied[inds]
+        data[:, 0] = np.repeat(frames, len(copied))
+        unannotated = ~self._is_annotated(data[:, 0], keys[inds])
+        if not unannotated.any():
+            return
+        data, inds = data[unannotated], inds[unannotated]
+        rows = self._append_points(
+            data,
+            {k: v[inds] for k, v in properties.items()},
+            {k: self._clipboard[k][inds] for k in ("size", "edge_color", "face_color")},
+        )
+        # Select the points pasted into the current frame, as napari does
+        self.selected_data = set(rows[data[:, 0] == self._slice_indices[0]].tolist())
+
+    def _is_annotated(self, frames: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """Tell whether the keypoints ``keys`` are annotated in ``frames``."""
+        # Identify every keypoint of every frame by a single integer
+        n_keys = len(self._categories["label"]) * len(self._categories["id"])
+        annotated = self.data[:, 0].astype(int) * n_keys + self._keypoint_keys(
+            self.properties["label"], self.properties["id"]
+        )
+        return np.isin(np.asarray(frames).astype(int) * n_keys + keys, annotated)
+
+    def _append_points(
+        self,
+        data: np.ndarray,
+        properties: Dict[str, np.ndarray],
+        state: Optional[Dict[str, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """Append points in a single, undoable data update."""
+        rows = np.arange(len(self.data), len(self.data) + len(data))
+        self._history.push(Edit("add", rows, None, data, properties, state))
+        self._insert_rows(rows, data, properties, state)
+        return rows
+
+    def add_tracked(
+        self,
+        properties: Dict[str, np.ndarray],
+        frames: np.ndarray,
+        positions: np.ndarray,
+        confidences: np.ndarray,
+    ):
+        """Add points tracked into ``frames``, unless already annotated there.
+
+        ``properties`` are those of the tracked points;
+        their tracking confidences are stored as likelihoods.
+        """
+        n_points = positions.shape[1]
+        data = np.c_[np.repeat(frames, n_points), positions.reshape(-1, 2)]
+        properties = {k: np.tile(v, len(frames)) for k, v in properties.items()}
+        properties["likelihood"] = confidences.ravel()
+        properties["valid"] = properties["likelihood"] > self.metadata.get(
+            "pcutoff", 0.6
         )
-        self._clipboard.pop("properties")
-        self._clipboard.pop("indices")
-        self._clipboard = {k: v[unannotated] for k, v in self._clipboard.items()}
-        self._clipboard["properties"] = new_properties
-        self._clipboard["indices"] = new_indices
-        super(KeyPoints, self)._paste_data()
+        keys = self._keypoint_keys(properties["label"], properties["id"])
+        unannotated = ~self._is_annotated(data[:, 0], keys)
+        if unannotated.any():
+            self._append_points(
+                data[unannotated], {k: v[unannotated] for k, v in properties.items()}
+            )
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from collections import deque, namedtuple
 from enum import Enum, EnumMeta
 from itertools import cycle
 import os
-from typing import Dict, List, Optional, Sequence, Tuple, Union
+import sys
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -27,14 +30,39 @@ def encode_categories(
     return inds
 
 
+# Integer type of the codes standing for bodyparts and individuals in properties.
+CODE_DTYPE = np.int16
+
+
+def encode_with_categories(values: Sequence, categories: Sequence) -> np.ndarray:
+    """Return the positions of ``values`` in ``categories`` (-1 if absent)."""
+    return pd.Categorical(values, categories=categories).codes.astype(CODE_DTYPE)
+
+
 def build_color_cycle(n_colors: int, colormap: Optional[str] = "viridis") -> np.ndarray:
     cmap = colormaps.ensure_colormap(colormap)
     return cmap.map(np.linspace(0, 1, n_colors))
 
 
 class DLCHeader:
+    """Column header of DLC data.
+
+    Its levels and lookup tables are computed once, on first access;
+    they are only invalidated when the scorer is renamed.
+    """
+
     def __init__(self, columns: pd.MultiIndex):
-        self.columns = columns
+        self._columns = columns
+        self._cache = dict()
+
+    @property
+    def columns(self) -> pd.MultiIndex:
+        return self._columns
+
+    def _cached(self, key: str, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
 
     @classmethod
     def from_config(cls, config: Dict) -> DLCHeader:
@@ -65,6 +93,9 @@ class DLCHeader:
         return cls(columns)
 
     def form_individual_bodypart_pairs(self) -> List[Tuple[str]]:
+        return list(self._cached("pairs", self._form_individual_bodypart_pairs))
+
+    def _form_individual_bodypart_pairs(self) -> Tuple[Tuple[str]]:
         to_drop = [
             name
             for name in self.columns.names
@@ -73,7 +104,7 @@ class DLCHeader:
         temp = self.columns.droplevel(to_drop).unique()
         if "individuals" not in temp.names:
             temp = pd.MultiIndex.from_product([self.individuals, temp])
-        return temp.to_list()
+        return tuple(temp.to_list())
 
     @property
     def scorer(self) -> str:
@@ -81,7 +112,8 @@ class DLCHeader:
 
     @scorer.setter
     def scorer(self, scorer: str):
-        self.columns = self.columns.set_levels([scorer], level="scorer")
+        self._columns = self._columns.set_levels([scorer], level="scorer")
+        self._cache.clear()
 
     @property
     def individuals(self) -> List[str]:
@@ -98,11 +130,60 @@ class DLCHeader:
     def coords(self) -> List[str]:
         return self._get_unique("coords")
 
+    @property
+    def individual_codes(self) -> Mapping[str, int]:
+        """Map individuals to their positions in ``individuals``."""
+        return self._cached("individual_codes", lambda: _index_map(self.individuals))
+
+    @property
+    def bodypart_codes(self) -> Mapping[str, int]:
+        """Map bodyparts to their positions in ``bodyparts``."""
+        return self._cached("bodypart_codes", lambda: _index_map(self.bodyparts))
+
+    @property
+    def coord_codes(self) -> Mapping[str, int]:
+        """Map coordinates to their positions in ``coords``."""
+        return self._cached("coord_codes", lambda: _index_map(self.coords))
+
+    @property
+    def column_positions(self) -> np.ndarray:
+        """Read-only (individuals, bodyparts, coords) array of column positions.
+
+        It is indexed with the codes of an individual, a bodypart and a
+        coordinate; missing columns are flagged with -1.
+        """
+        return self._cached("column_positions", self._build_column_positions)
+
+    def _build_column_positions(self) -> np.ndarray:
+        frame = self.columns.to_frame(index=False)
+        if "individuals" in frame:
+            ids = encode_with_categories(frame["individuals"], self.individuals)
+        else:
+            ids = np.zeros(len(frame), dtype=CODE_DTYPE)
+        bodyparts = encode_with_categories(frame["bodyparts"], self.bodyparts)
+        coords = encode_with_categories(frame["coords"], self.coords)
+        shape = len(self.individuals), len(self.bodyparts), len(self.coords)
+        positions = np.full(shape, -1, dtype=int)
+        positions[ids, bodyparts, coords] = np.arange(len(frame))
+        positions.flags.writeable = False
+        return positions
+
     def _get_unique(self, name: str) -> Optional[List]:
-        if name in self.columns.names:
-            return list(unsorted_unique(self.columns.get_level_values(name)))
+        levels = self._cached("levels", self._get_levels)
+        if name in levels:
+            return list(levels[name])
         return None
 
+    def _get_levels(self) -> Dict[str, Tuple]:
+        return {
+            name: tuple(unsorted_unique(self.columns.get_level_values(name)).tolist())
+            for name in self.columns.names
+        }
+
+
+def _index_map(items: Sequence) -> Mapping:
+    return MappingProxyType({item: i for i, item in enumerate(items)})
+
 
 class CycleEnumMeta(EnumMeta):
     def __new__(metacls, cls, bases, classdict):
@@ -133,6 +214,74 @@ class CycleEnum(Enum, metaclass=CycleEnumMeta):
         return self.value
 
 
+# A change to a set of points: ``kind`` is one of "move", "add" or "remove";
+# ``rows`` are their indices in the layer data, ``old`` and ``new`` their
+# coordinates before and after the change, and ``properties`` the properties
+# of added or removed points.
+# ``state`` holds the other per-point arrays, e.g., sizes and colors, of the rows.
+Edit = namedtuple(
+    "Edit", ["kind", "rows", "old", "new", "properties", "state"], defaults=(None,)
+)
+
+
+class EditHistory:
+    """Bounded undo/redo stacks of point edits.
+
+    Only the rows affected by an edit are stored, never the full layer data;
+    the oldest edits are forgotten beyond ``maxlen``.
+    """
+
+    def __init__(self, maxlen: int = 1000):
+        self._undo = deque(maxlen=maxlen)
+        self._redo = deque(maxlen=maxlen)
+
+    def __len__(self):
+        return len(self._undo)
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    @property
+    def nbytes(self) -> int:
+        def size(edit):
+            arrays = [edit.rows, edit.old, edit.new]
+            arrays += [*(edit.properties or {}).values(), *(edit.state or {}).values()]
+            return sum(array.nbytes for array in arrays if array is not None)
+
+        return sum(map(size, self._undo)) + sum(map(size, self._redo))
+
+    def push(self, edit: Edit):
+        self._undo.append(edit)
+        self._redo.clear()
+
+    def amend(self, **fields):
+        """Update the last edit, e.g. as a point is being dragged."""
+        self._undo[-1] = self._undo[-1]._replace(**fields)
+
+    def undo(self) -> Optional[Edit]:
+        if not self._undo:
+            return None
+        edit = self._undo.pop()
+        self._redo.append(edit)
+        return edit
+
+    def redo(self) -> Optional[Edit]:
+        if not self._redo:
+            return None
+        edit = self._redo.pop()
+        self._undo.append(edit)
+        return edit
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+
 def to_os_dir_sep(path: str) -> str:
     """
     Replace all directory separators in `path` with `os.path.sep`.
@@ -153,3 +302,92 @@ def to_os_dir_sep(path: str) -> str:
     sep = win_sep if win_sep in path else unix_sep
 
     return os.path.sep.join(path.split(sep))
+
+
+class PathTable:
+    """Image paths held once, as OS-independent tuples of path components.
+
+    Frames are referred to by their integer code, i.e., the position of
+    their path in the table. Components are interned, so that tables built
+    from the images and from data files share their strings, and matching
+    two tables compares tuples instead of normalizing every path again.
+    Items are the paths joined with the OS separator, so that a table can
+    stand in for the list of paths it replaces.
+    """
+
+    def __init__(self, parts: Iterable[Sequence[str]] = ()):
+        self.parts: List[Tuple[str, ...]] = []
+        self._codes: Dict[Tuple[str, ...], int] = dict()
+        self._strings = None
+        self._index = None
+        for path in parts:
+            self.add(path)
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> PathTable:
+        """Build a table from paths using either directory separator."""
+        return cls(to_os_dir_sep(str(path)).split(os.path.sep) for path in paths)
+
+    @classmethod
+    def from_index(cls, index: pd.Index) -> Tuple[PathTable, np.ndarray]:
+        """Build the table of the row index of DLC data.
+
+        Every distinct path is split only once. Returns the table and the
+        code of every row; numeric indices already hold frame indices,
+        which are returned with an empty table.
+        """
+        if pd.api.types.is_numeric_dtype(index) and not isinstance(
+            index, pd.MultiIndex
+        ):
+            return cls(), index.to_numpy().astype(int)
+        codes, uniques = pd.factorize(index)
+        table = cls()
+        if isinstance(index, pd.MultiIndex):
+            parts = (map(str, row) for row in uniques)
+        else:
+            parts = (to_os_dir_sep(str(path)).split(os.path.sep) for path in uniques)
+        # Paths differing only by their separators share a code
+        inverse = np.array([table.add(path) for path in parts], dtype=int)
+        return table, inverse[codes]
+
+    def add(self, parts: Sequence[str]) -> int:
+        """Return the code of a path, adding it to the table if new."""
+        parts = tuple(sys.intern(part) for part in parts)
+        code = self._codes.setdefault(parts, len(self.parts))
+        if code == len(self.parts):
+            self.parts.append(parts)
+            self._strings = self._index = None
+        return code
+
+    def lookup(self, other: PathTable) -> np.ndarray:
+        """Return the codes in this table of the paths of ``other`` (-1 if absent)."""
+        codes = [self._codes.get(parts, -1) for parts in other.parts]
+        return np.array(codes, dtype=int)
+
+    def to_index(self, codes: Sequence[int]) -> pd.MultiIndex:
+        """Return the path-agnostic row index (DLC v2.2.0.4+) of frames ``codes``."""
+        if self._index is None:
+            self._index = pd.MultiIndex.from_tuples(self.parts)
+        return self._index[np.asarray(codes, dtype=int)].remove_unused_levels()
+
+    @property
+    def strings(self) -> List[str]:
+        if self._strings is None:
+            self._strings = [os.path.join(*parts) for parts in self.parts]
+        return self._strings
+
+    def __len__(self) -> int:
+        return len(self.parts)
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def __iter__(self):
+        return iter(self.strings)
+
+
+def as_path_table(paths: Optional[Sequence[str]]) -> PathTable:
+    """Return ``paths`` as a :class:`PathTable`, building one if needed."""
+    if isinstance(paths, PathTable):
+        return paths
+    return PathTable.from_paths(paths or [])
@@ -1,3 +1,5 @@
+import os
+
 from dlclabel import io
 from napari_plugin_engine import napari_hook_implementation
 from napari.types import ReaderFunction, WriterFunction
@@ -20,6 +22,13 @@ def load_labeled_data(path: str) -> Optional[ReaderFunction]:
     return None
 
 
+@napari_hook_implementation(specname="napari_get_reader")
+def load_masks(path: str) -> Optional[ReaderFunction]:
+    if isinstance(path, str) and os.path.basename(path) == "vertices.csv":
+        return io.read_masks
+    return None
+
+
 @napari_hook_implementation(specname="napari_get_reader")
 def load_config(path: str) -> Optional[ReaderFunction]:
     if isinstance(path, str) and path.endswith("yaml"):
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+
+import napari
+import numpy as np
+
+from dlclabel.layers import KeyPoints
+from dlclabel.skeleton import bone_table, gather_bones
+from dlclabel.tracks import Trajectories
+
+
+class TrajectoryOverlay:
+    """Vectors layer drawing the keypoint tracks around the current frame.
+
+    Tracks are kept sorted in a :class:`Trajectories`, which point edits
+    update in place; moving through frames only extracts another window.
+    """
+
+    def __init__(self, viewer: napari.Viewer, layer: KeyPoints, radius: int = 10):
+        self.viewer = viewer
+        self.layer = layer
+        self.radius = radius
+        colors = layer.metadata["face_color_cycle_maps"]["label"]
+        self._colors = np.array([colors[code] for code in sorted(colors)])
+        self._n_ids = len(layer.ids)
+        self._trajectories = Trajectories(layer.data, self._keys())
+        self.vectors = viewer.add_vectors(
+            np.empty((0, 2, 2)), name=f"{layer.name} trajectories", edge_width=1
+        )
+        viewer.dims.events.current_step.connect(self.refresh)
+        layer.events.data.connect(self._on_data)
+        layer.events.edited.connect(self._on_edited)
+        self.refresh()
+
+    def _keys(self, rows=slice(None)) -> np.ndarray:
+        properties = self.layer.properties
+        return self.layer._keypoint_keys(
+            properties["label"][rows], properties["id"][rows]
+        )
+
+    def _on_data(self, event=None):
+        # Edits are handled incrementally by _on_edited
+        if self.layer._is_editing:
+            return
+        self._trajectories.reset(self.layer.data, self._keys())
+        self.refresh()
+
+    def _on_edited(self, event):
+        rows = event.rows
+        if event.kind == "move":
+            self._trajectories.move(rows, self.layer.data[rows, 1:])
+        elif event.kind == "add":
+            self._trajectories.insert(rows, self.layer.data[rows], self._keys(rows))
+        else:
+            self._trajectories.delete(rows)
+        self.refresh()
+
+    def refresh(self, event=None):
+        frame = self.viewer.dims.current_step[0]
+        segments, keys = self._trajectories.segments(frame, self.radius)
+        # Vectors are given as a start point and a projection
+        segments[:, 1] -= segments[:, 0]
+        self.vectors.data = segments
+        if len(segments):
+            self.vectors.edge_color = self._colors[keys // self._n_ids]
+
+    def close(self):
+        self.viewer.dims.events.current_step.disconnect(self.refresh)
+        self.layer.events.data.disconnect(self._on_data)
+        self.layer.events.edited.disconnect(self._on_edited)
+        if self.vectors in self.viewer.layers:
+            self.viewer.layers.remove(self.vectors)
+
+
+class SkeletonOverlay:
+    """Vectors layer drawing the skeleton of the individuals in the current frame.
+
+    Bones are gathered at once from a precomputed table of keypoint keys.
+    Segments are cached per frame; edits only invalidate the frames
+    they touched.
+    """
+
+    max_cached_frames = 512
+
+    def __init__(self, viewer: napari.Viewer, layer: KeyPoints):
+        self.viewer = viewer
+        self.layer = layer
+        header = layer.metadata["header"]
+        self._bones = bone_table(header, layer.metadata.get("skeleton", []))
+        self._n_keys = len(header.bodyparts) * len(header.individuals)
+        self._cache = OrderedDict()
+        self.vectors = viewer.add_vectors(
+            np.empty((0, 2, 2)),
+            name=f"{layer.name} skeleton",
+            edge_width=1,
+            edge_color=layer.metadata.get("skeleton_color", "black"),
+        )
+        viewer.dims.events.current_step.connect(self.refresh)
+        layer.events.data.connect(self._on_data)
+        layer.events.edited.connect(self._on_edited)
+        self.refresh()
+
+    def _segments(self, frame: int) -> np.ndarray:
+        if frame in self._cache:
+            self._cache.move_to_end(frame)
+            return self._cache[frame]
+        rows = np.flatnonzero(self.layer.data[:, 0] == frame)
+        properties = self.layer.properties
+        keys = self.layer._keypoint_keys(
+            properties["label"][rows], properties["id"][rows]
+        )
+        segments, _ = gather_bones(
+            self.layer.data[rows, 1:], keys, self._bones, self._n_keys
+        )
+        # Vectors are given as a start point and a projection
+        segments[:, 1] -= segments[:, 0]
+        self._cache[frame] = segments
+        if len(self._cache) > self.max_cached_frames:
+            self._cache.popitem(last=False)
+        return segments
+
+    def _on_data(self, event=None):
+        if self.layer._is_editing:
+            return
+        self._cache.clear()
+        self.refresh()
+
+    def _on_edited(self, event):
+        for frame in event.frames.tolist():
+            self._cache.pop(frame, None)
+        self.refresh()
+
+    def refresh(self, event=None):
+        self.vectors.data = self._segments(self.viewer.dims.current_step[0])
+
+    def close(self):
+        self.viewer.dims.events.current_step.disconnect(self.refresh)
+        self.layer.events.data.disconnect(self._on_data)
+        self.layer.events.edited.disconnect(self._on_edited)
+        if self.vectors in self.viewer.layers:
+            self.viewer.layers.remove(self.vectors)
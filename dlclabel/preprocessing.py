@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import dask.array as da
+import numpy as np
+from skimage import exposure
+from skimage.color import rgb2gray
+from skimage.util import img_as_ubyte
+
+
+def preprocess_frame(
+    image: np.ndarray,
+    clahe: bool = False,
+    clip_limit: float = 0.01,
+    equalize: bool = False,
+    gamma: Optional[float] = None,
+    grayscale: bool = False,
+    crop: Optional[Tuple[int, int, int, int]] = None,
+) -> np.ndarray:
+    """Enhance a frame to make it easier to label.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (height, width) or (height, width, channels) image.
+    clahe : bool
+        Contrast limited adaptive histogram equalization, with ``clip_limit``.
+    equalize : bool
+        Global histogram equalization, if not using CLAHE.
+    gamma : float, optional
+        Gamma correction; values below 1 brighten dark images.
+    grayscale : bool
+        Convert to grayscale; color images keep their channels,
+        all equal, so that the shape of the frame does not change.
+    crop : tuple, optional
+        First and last rows, then first and last columns, to keep.
+
+    Returns
+    -------
+    np.ndarray
+        The processed frame, as 8-bit integers.
+    """
+    if crop is not None:
+        y0, y1, x0, x1 = crop
+        image = image[y0:y1, x0:x1]
+    if grayscale and image.ndim == 3:
+        gray = img_as_ubyte(rgb2gray(image[..., :3]))
+        image = np.repeat(gray[..., None], image.shape[-1], axis=-1)
+    if clahe:
+        image = exposure.equalize_adapthist(image, clip_limit=clip_limit)
+    elif equalize:
+        image = exposure.equalize_hist(image)
+    if gamma is not None:
+        image = exposure.adjust_gamma(image, gamma)
+    return img_as_ubyte(image)
+
+
+class Preprocessor:
+    """Preprocessing of the frames of an image stack, evaluated lazily.
+
+    Frames are only processed when they are read, e.g., when napari shows
+    them, and the last ``cache_size`` frames processed are kept in memory
+    so that revisiting them is instant. Nothing is written to disk.
+    Keyword arguments are passed on to :func:`preprocess_frame`.
+    """
+
+    def __init__(self, cache_size: int = 64, **params):
+        self.cache_size = cache_size
+        self.params = params
+        self._cache = OrderedDict()
+        self._stack: Optional[da.Array] = None
+        # Dask may read several frames at once from worker threads
+        self._lock = threading.Lock()
+
+    @property
+    def offset(self) -> Tuple[int, int]:
+        """Position of the first pixel of the processed frames in the originals.
+
+        Crop bounds counted from the end of the frames are only resolved
+        once the stack is given to :meth:`apply`.
+        """
+        crop = self.params.get("crop")
+        if crop is None:
+            return 0, 0
+        return crop[0] or 0, crop[2] or 0
+
+    def frame(self, index: int) -> np.ndarray:
+        """Return the processed frame ``index`` of the stack given to :meth:`apply`."""
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+        # Only frames missing from the cache are read from the stack
+        image = np.asarray(self._stack[index].compute(scheduler="synchronous"))
+        processed = preprocess_frame(image, **self.params)
+        with self._lock:
+            self._cache[index] = processed
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return processed
+
+    def _frame_block(self, indices: np.ndarray) -> np.ndarray:
+        return self.frame(int(indices[0]))[None]
+
+    def apply(self, stack: da.Array) -> da.Array:
+        """Compose the preprocessing onto a (frames, height, width[, channels]) stack.
+
+        The stack itself, e.g., as returned by :func:`dlclabel.io.read_images`,
+        is left untouched.
+        """
+        self._stack = stack
+        self._cache.clear()
+        shape = list(stack.shape[1:])
+        crop = self.params.get("crop")
+        if crop is not None:
+            # Resolve negative and missing bounds against the frame shape
+            y0, y1, x0, x1 = crop
+            rows = range(*slice(y0, y1).indices(shape[0]))
+            cols = range(*slice(x0, x1).indices(shape[1]))
+            self.params["crop"] = rows.start, rows.stop, cols.start, cols.stop
+            shape[0], shape[1] = len(rows), len(cols)
+        # Every block is one frame, computed from its index alone
+        indices = da.arange(stack.shape[0], chunks=1)
+        return indices.map_blocks(
+            self._frame_block,
+            new_axis=list(range(1, stack.ndim)),
+            chunks=((1,) * stack.shape[0],) + tuple((n,) for n in shape),
+            dtype=np.uint8,
+        )
@@ -0,0 +1,63 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from dlclabel.misc import DLCHeader
+
+
+def bone_table(header: DLCHeader, skeleton: Sequence[Sequence[str]]) -> np.ndarray:
+    """Return the keypoint keys at both ends of every bone of every individual.
+
+    Keypoints are keyed as in :class:`dlclabel.layers.KeyPoints`, i.e.,
+    bodypart code * number of individuals + individual code. Bones whose
+    bodyparts do not both exist for an individual are left out.
+
+    Returns
+    -------
+    np.ndarray
+        (n_bones, 2) array of keypoint keys.
+    """
+    codes = header.bodypart_codes
+    ends = np.array(
+        [
+            (codes[bp1], codes[bp2])
+            for bp1, bp2 in skeleton
+            if bp1 in codes and bp2 in codes
+        ],
+        dtype=int,
+    ).reshape(-1, 2)
+    n_ids = len(header.individuals)
+    # An individual has a bodypart if its x column exists
+    has_bodypart = header.column_positions[..., header.coord_codes["x"]] >= 0
+    ids, bones = np.nonzero(has_bodypart[:, ends[:, 0]] & has_bodypart[:, ends[:, 1]])
+    return ends[bones] * n_ids + ids[:, None]
+
+
+def gather_bones(
+    coords: np.ndarray, keys: np.ndarray, bones: np.ndarray, n_keys: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Gather the segments of the bones whose both ends are annotated.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (n, 2) coordinates of the points of a frame.
+    keys : np.ndarray
+        Keypoint keys of these points.
+    bones : np.ndarray
+        Bone table, as returned by :func:`bone_table`.
+    n_keys : int
+        Number of possible keypoint keys.
+
+    Returns
+    -------
+    segments : np.ndarray
+        (m, 2, 2) array of the coordinates of the ends of the bones.
+    found : np.ndarray
+        Mask of the bones that were found.
+    """
+    slots = np.full(n_keys, -1)
+    slots[keys] = np.arange(len(keys))
+    ends = slots[bones]
+    found = np.all(ends >= 0, axis=1)
+    return coords[ends[found]], found
@@ -0,0 +1,145 @@
+from typing import Tuple
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+# Likelihood of the points filled in between keyframes;
+# below any pcutoff, so that they are flagged for review.
+FILLED_LIKELIHOOD = 0.0
+
+
+def interpolate_keyframes(
+    data: np.ndarray, keys: np.ndarray, method: str = "linear"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fill the frames between the annotated keyframes of every track.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        (n, 3) array of frame, y, x coordinates.
+    keys : np.ndarray
+        Integer identifying the track (individual, bodypart) of each point.
+    method : str
+        "linear", or "spline" to fit a cubic spline through the keyframes
+        of tracks with at least three of them.
+
+    Returns
+    -------
+    new_data : np.ndarray
+        Coordinates of the filled points, sorted by track and frame.
+    source : np.ndarray
+        Index in ``data`` of the keyframe preceding each filled point.
+    """
+    if method not in ("linear", "spline"):
+        raise ValueError(f"Unknown interpolation method '{method}'.")
+    order = np.lexsort((data[:, 0], keys))
+    frames = data[order, 0].astype(int)
+    keys = np.asarray(keys)[order]
+    same = keys[1:] == keys[:-1]
+    gaps = np.diff(frames)
+    n_fill = np.where(same, np.maximum(gaps - 1, 0), 0)
+
+    # All segments are filled at once: each new point knows the keyframe
+    # it starts from and how many frames it lies past it.
+    seg = np.repeat(np.arange(len(n_fill)), n_fill)
+    offset = np.arange(n_fill.sum()) - np.repeat(np.cumsum(n_fill) - n_fill, n_fill)
+    offset += 1
+    start = data[order[seg]]
+    end = data[order[seg + 1]]
+    new_data = start + (offset / gaps[seg])[:, None] * (end - start)
+    new_data[:, 0] = frames[seg] + offset
+
+    if method == "spline" and len(seg):
+        track_starts = np.flatnonzero(np.r_[True, ~same])
+        bounds = np.r_[track_starts, len(keys)]
+        fill_track = np.searchsorted(track_starts, seg, side="right") - 1
+        fill_bounds = np.searchsorted(fill_track, np.arange(len(bounds)))
+        for i in np.flatnonzero(np.diff(bounds) >= 3):
+            lo, hi = fill_bounds[i], fill_bounds[i + 1]
+            inds = order[bounds[i] : bounds[i + 1]]
+            # Duplicate keyframes would make the spline ill-defined
+            if lo == hi or np.any(np.diff(data[inds, 0]) <= 0):
+                continue
+            spline = CubicSpline(data[inds, 0], data[inds, 1:], axis=0)
+            new_data[lo:hi, 1:] = spline(new_data[lo:hi, 0])
+    return new_data, order[seg]
+
+
+class Trajectories:
+    """Keypoint tracks, sorted by track then frame.
+
+    Points are referred to by their row in the layer data. Moving, adding
+    or removing points updates the sorted arrays without re-sorting them,
+    and the part of the tracks around a frame is found by binary search.
+    """
+
+    # Points are sorted on track * _STRIDE + frame
+    _STRIDE = 2**32
+
+    def __init__(self, data: np.ndarray, keys: np.ndarray):
+        self.reset(data, keys)
+
+    def __len__(self):
+        return len(self._order)
+
+    def reset(self, data: np.ndarray, keys: np.ndarray):
+        sortkey = np.asarray(keys, dtype=np.int64) * self._STRIDE
+        sortkey += data[:, 0].astype(np.int64)
+        self._order = np.argsort(sortkey, kind="stable")
+        self._sortkey = sortkey[self._order]
+        self.coords = data[self._order, 1:]
+        self._update_ranks()
+
+    def _update_ranks(self):
+        self._rank = np.empty_like(self._order)
+        self._rank[self._order] = np.arange(len(self._order))
+        tracks = self._sortkey // self._STRIDE
+        self._track_keys = tracks[np.r_[True, tracks[1:] != tracks[:-1]]]
+
+    def move(self, rows: np.ndarray, coords: np.ndarray):
+        """Update the coordinates of points moved within their frame."""
+        self.coords[self._rank[rows]] = coords
+
+    def insert(self, rows: np.ndarray, data: np.ndarray, keys: np.ndarray):
+        """Insert points that ended up at ``rows`` of the layer data."""
+        positions = np.sort(rows) - np.arange(len(rows))
+        self._order += np.searchsorted(positions, self._order, side="right")
+        sortkey = np.asarray(keys, dtype=np.int64) * self._STRIDE
+        sortkey += data[:, 0].astype(np.int64)
+        new_order = np.argsort(sortkey, kind="stable")
+        sortkey = sortkey[new_order]
+        inds = np.searchsorted(self._sortkey, sortkey)
+        self._sortkey = np.insert(self._sortkey, inds, sortkey)
+        self._order = np.insert(self._order, inds, np.asarray(rows)[new_order])
+        self.coords = np.insert(self.coords, inds, data[new_order, 1:], axis=0)
+        self._update_ranks()
+
+    def delete(self, rows: np.ndarray):
+        """Remove the points at ``rows`` of the layer data."""
+        rows = np.sort(rows)
+        positions = self._rank[rows]
+        self._sortkey = np.delete(self._sortkey, positions)
+        self._order = np.delete(self._order, positions)
+        self._order -= np.searchsorted(rows, self._order)
+        self.coords = np.delete(self.coords, positions, axis=0)
+        self._update_ranks()
+
+    def segments(self, frame: int, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the track segments lying within ``radius`` frames of ``frame``.
+
+        Returns
+        -------
+        segments : np.ndarray
+            (n, 2, 2) array of the start and end (y, x) coordinates
+            of the segments between consecutive points of a track.
+        keys : np.ndarray
+            Track of each segment.
+        """
+        base = self._track_keys * self._STRIDE
+        lo = np.searchsorted(self._sortkey, base + frame - radius, side="left")
+        hi = np.searchsorted(self._sortkey, base + frame + radius, side="right")
+        n_segments = np.maximum(hi - lo - 1, 0)
+        starts = np.repeat(lo - np.cumsum(n_segments) + n_segments, n_segments)
+        starts += np.arange(n_segments.sum())
+        segments = np.stack([self.coords[starts], self.coords[starts + 1]], axis=1)
+        return segments, np.repeat(self._track_keys, n_segments)
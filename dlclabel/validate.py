@@ -0,0 +1,318 @@
+"""Check the consistency of the labeled data of a DeepLabCut project.
+
+Usage::
+
+    python -m dlclabel.validate path/to/config.yaml --output report.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from dlclabel import misc
+from dlclabel.frames import list_images
+from dlclabel.io import _load_config
+
+REPORT_COLUMNS = [
+    "folder",
+    "file",
+    "image",
+    "check",
+    "severity",
+    "individual",
+    "bodypart",
+    "message",
+]
+
+
+def image_shape(filename: str) -> Tuple[int, int]:
+    """Return the height and width of an image, reading its header only."""
+    with Image.open(filename) as image:
+        return image.height, image.width
+
+
+def _issues(check: str, severity: str, message, **columns) -> pd.DataFrame:
+    """Build report rows; scalars are broadcast to the length of arrays."""
+    columns = dict(check=check, severity=severity, message=message, **columns)
+    lengths = [len(v) for v in columns.values() if isinstance(v, (list, np.ndarray))]
+    index = pd.RangeIndex(lengths[0] if lengths else 1)
+    return pd.DataFrame(columns, index=index).reindex(columns=REPORT_COLUMNS)
+
+
+def _row_paths(index: pd.Index) -> Optional[List[str]]:
+    if isinstance(index, pd.MultiIndex):
+        return ["/".join(map(str, row)) for row in index]
+    if pd.api.types.is_numeric_dtype(index):
+        return None
+    return list(index)
+
+
+def check_header(header: misc.DLCHeader, config: Dict) -> List[pd.DataFrame]:
+    """Compare the keypoints of a data file with those of the config."""
+    issues = []
+    expected = misc.DLCHeader.from_config(config)
+    if header.scorer != expected.scorer:
+        issues.append(
+            _issues(
+                "scorer",
+                "warning",
+                f"Scorer '{header.scorer}' differs from '{expected.scorer}' "
+                "in the config.",
+            )
+        )
+    pairs = set(header.form_individual_bodypart_pairs())
+    expected_pairs = set(expected.form_individual_bodypart_pairs())
+    for check, severity, keypoints, message in (
+        ("unknown_keypoint", "error", pairs - expected_pairs, "Not in the config."),
+        ("missing_keypoint", "warning", expected_pairs - pairs, "Not in the file."),
+    ):
+        if keypoints:
+            individuals, bodyparts = zip(*sorted(keypoints))
+            issues.append(
+                _issues(
+                    check,
+                    severity,
+                    message,
+                    individual=list(individuals),
+                    bodypart=list(bodyparts),
+                )
+            )
+    return issues
+
+
+def check_paths(
+    paths: Sequence[str], folder: str, images: Sequence[str]
+) -> Tuple[List[pd.DataFrame], np.ndarray]:
+    """Match the image paths of the rows of a data file to the folder images.
+
+    Paths are matched on all their components relative to the project,
+    as when loading the folder, so rows pointing to an image of the same
+    name in another folder are missing too. Returns the issues found and
+    the index in ``images`` of the image of every row, -1 if it is missing.
+    """
+    issues = []
+    paths = np.asarray(paths, dtype=str)
+    has_win = np.char.find(paths, "\\") >= 0
+    has_unix = np.char.find(paths, "/") >= 0
+    invalid = has_win & has_unix
+    if invalid.any():
+        issues.append(
+            _issues(
+                "invalid_path",
+                "error",
+                "Path contains both Windows and UNIX separators.",
+                image=paths[invalid],
+            )
+        )
+    if (has_win & ~invalid).any() and (has_unix & ~invalid).any():
+        issues.append(
+            _issues(
+                "mixed_separators",
+                "warning",
+                f"{has_win.sum()} paths use Windows separators "
+                f"and {has_unix.sum()} UNIX separators.",
+            )
+        )
+    parts = np.char.split(np.char.replace(paths, "\\", "/"), "/")
+    dirnames = np.array([part[-2] if len(part) > 1 else "" for part in parts])
+    elsewhere = ~invalid & (dirnames != os.path.basename(folder))
+    if elsewhere.any():
+        issues.append(
+            _issues(
+                "wrong_folder",
+                "error",
+                f"Image is not in '{os.path.basename(folder)}'; "
+                "its labels are dropped when loading the folder.",
+                image=paths[elsewhere],
+            )
+        )
+    root = os.path.dirname(os.path.dirname(folder))
+    table = misc.PathTable(
+        os.path.relpath(image, root).split(os.path.sep) for image in images
+    )
+    rows = misc.PathTable()
+    codes = np.array([rows.add(part) for part in parts], dtype=int)
+    inds = np.where(invalid, -1, table.lookup(rows)[codes])
+    missing = (inds < 0) & ~invalid & ~elsewhere
+    if missing.any():
+        issues.append(
+            _issues(
+                "missing_image",
+                "error",
+                "Image not found; its labels are dropped when loading the folder.",
+                image=paths[missing],
+            )
+        )
+    return issues, inds
+
+
+def check_bounds(
+    df: pd.DataFrame, header: misc.DLCHeader, paths: Sequence[str], shapes: np.ndarray
+) -> List[pd.DataFrame]:
+    """Flag the keypoints lying outside of their image.
+
+    ``shapes`` holds the height and width of the image of every row,
+    NaN if unknown.
+    """
+    positions = header.column_positions
+    codes = header.coord_codes
+    xcols = positions[..., codes["x"]]
+    ycols = positions[..., codes["y"]]
+    ids, bodyparts = np.nonzero((xcols >= 0) & (ycols >= 0))
+    values = df.to_numpy(dtype=float)
+    x = values[:, xcols[ids, bodyparts]]
+    y = values[:, ycols[ids, bodyparts]]
+    heights, widths = shapes[:, :1], shapes[:, 1:]
+    # NaN coordinates and unknown shapes compare False
+    outside = (x < 0) | (x > widths) | (y < 0) | (y > heights)
+    rows, keypoints = np.nonzero(outside)
+    if not len(rows):
+        return []
+
+    def to_str(values):
+        return pd.Series(values).round(1).astype(str)
+
+    message = (
+        "Keypoint at ("
+        + to_str(x[rows, keypoints])
+        + ", "
+        + to_str(y[rows, keypoints])
+        + ") is outside of the "
+        + to_str(widths[rows, 0].astype(int))
+        + "x"
+        + to_str(heights[rows, 0].astype(int))
+        + " image."
+    )
+    return [
+        _issues(
+            "out_of_bounds",
+            "error",
+            message.to_numpy(),
+            image=np.asarray(paths, dtype=object)[rows],
+            individual=np.asarray(header.individuals, dtype=object)[ids[keypoints]],
+            bodypart=np.asarray(header.bodyparts, dtype=object)[bodyparts[keypoints]],
+        )
+    ]
+
+
+def validate_folder(
+    folder: str,
+    config: Dict,
+    images: Sequence[str],
+    shapes: np.ndarray,
+    lock: threading.Lock,
+) -> pd.DataFrame:
+    """Check the data files of an image folder against its images and the config."""
+    issues = []
+    if not images:
+        issues.append(_issues("no_images", "warning", "No supported images found."))
+    for filename in sorted(glob.glob(os.path.join(folder, "*.h5"))):
+        # PyTables is not safe to access from several threads at once.
+        with lock:
+            try:
+                df = pd.read_hdf(filename)
+            except Exception as err:
+                issues.append(
+                    _issues("unreadable", "error", f"{type(err).__name__}: {err}")
+                    .assign(file=os.path.basename(filename))
+                )
+                continue
+        header = misc.DLCHeader(df.columns)
+        file_issues = check_header(header, config)
+        if not os.path.basename(filename).startswith("CollectedData"):
+            # Scorers of machine labels are network names
+            file_issues = [df_ for df_ in file_issues if df_["check"][0] != "scorer"]
+        duplicated = df.index.duplicated()
+        if duplicated.any():
+            file_issues.append(
+                _issues(
+                    "duplicate_row",
+                    "error",
+                    "Image labeled in several rows; only the first is kept.",
+                    image=np.asarray(_row_paths(df.index[duplicated]), dtype=object),
+                )
+            )
+        paths = _row_paths(df.index)
+        if paths is not None:
+            path_issues, inds = check_paths(paths, folder, images)
+            file_issues += path_issues
+            row_shapes = np.full((len(df), 2), np.nan)
+            row_shapes[inds >= 0] = shapes[inds[inds >= 0]]
+            file_issues += check_bounds(df, header, paths, row_shapes)
+        for df_ in file_issues:
+            df_["file"] = os.path.basename(filename)
+        issues += file_issues
+    if not issues:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    report = pd.concat(issues, ignore_index=True)
+    report["folder"] = os.path.basename(folder)
+    return report
+
+
+def validate_project(config_path: str, n_workers: Optional[int] = None) -> pd.DataFrame:
+    """Check every image folder under the labeled-data folder of a project.
+
+    Image shapes are read from the image headers only; the folders are
+    then checked concurrently.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per issue found, with its folder, data file, image,
+        check, severity ("error" or "warning"), keypoint, and message.
+    """
+    config = _load_config(config_path)
+    root = os.path.join(os.path.dirname(config_path), "labeled-data")
+    folders = sorted(
+        path for path in glob.glob(os.path.join(root, "*")) if os.path.isdir(path)
+    )
+    lock = threading.Lock()
+    with ThreadPoolExecutor(n_workers) as pool:
+        images = [list_images(folder) for folder in folders]
+        all_images = [image for folder_images in images for image in folder_images]
+        shapes = np.array(list(pool.map(image_shape, all_images)), dtype=float)
+        shapes = np.split(
+            shapes.reshape(-1, 2), np.cumsum([len(imgs) for imgs in images])[:-1]
+        )
+        reports = pool.map(
+            validate_folder,
+            folders,
+            [config] * len(folders),
+            images,
+            shapes,
+            [lock] * len(folders),
+        )
+        reports = [report for report in reports if len(report)]
+    if not reports:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(reports, ignore_index=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config", help="Path to the project's config.yaml")
+    parser.add_argument("--output", "-o", help="JSON report file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    report = validate_project(args.config, args.workers)
+    records = report.astype(object).where(report.notna(), None).to_dict("records")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(records, file, indent=2)
+    else:
+        json.dump(records, sys.stdout, indent=2)
+        print()
+    return int((report["severity"] == "error").any())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,58 @@
 from collections import defaultdict
+import napari
+import numpy as np
+from dlclabel import analysis
 from dlclabel.layers import KeyPoints
-from PyQt5.QtWidgets import QWidget, QComboBox, QHBoxLayout
-from typing import Optional, Sequence
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSize, Qt
+from PyQt5.QtGui import (
+    QBrush,
+    QColor,
+    QIcon,
+    QImage,
+    QPixmap,
+    QStandardItem,
+    QStandardItemModel,
+)
+from PyQt5.QtWidgets import (
+    QWidget,
+    QComboBox,
+    QHBoxLayout,
+    QListView,
+    QStyledItemDelegate,
+)
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+
+class KeypointsModel(QStandardItemModel):
+    """Item model over keypoint names with constant-time row lookup.
+
+    The check state of an item tells whether the keypoint
+    is annotated in the current frame.
+    """
+
+    def __init__(self, names: Sequence[str], parent: Optional[QWidget] = None):
+        super(KeypointsModel, self).__init__(parent)
+        self.rows = dict()
+        for name in names:
+            self.rows[name] = self.rowCount()
+            item = QStandardItem(name)
+            item.setData(Qt.Unchecked, Qt.CheckStateRole)
+            self.appendRow(item)
+
+    def set_state(self, name: str, state: Qt.CheckState):
+        self.item(self.rows[name]).setData(state, Qt.CheckStateRole)
 
 
 class DropdownMenu(QComboBox):
-    def __init__(
-        self, labels: Sequence[str], parent: Optional[QWidget] = None
-    ):
+    def __init__(self, model: KeypointsModel, parent: Optional[QWidget] = None):
         super(DropdownMenu, self).__init__(parent)
-        self.addItems(labels)
+        # The styled delegate draws the check state of the items
+        self.setItemDelegate(QStyledItemDelegate(self))
+        self.setModel(model)
 
     def update_to(self, text: str):
-        index = self.findText(text)
-        if index >= 0:
+        index = self.model().rows.get(text, -1)
+        if index >= 0 and index != self.currentIndex():
             self.setCurrentIndex(index)
 
     def reset(self):
@@ -25,50 +64,260 @@ class KeypointsDropdownMenu(QWidget):
         super(KeypointsDropdownMenu, self).__init__(parent)
         self.layer = layer
         self.layer.events.current_properties.connect(self.update_menus)
+        # Fired on data changes as well as on frame changes
+        self.layer.events.set_data.connect(self._on_set_data)
+        self.layer.events.data.connect(self._on_data)
+        self.layer.events.edited.connect(self._on_edited)
 
-        # Map individuals to their respective bodyparts
+        # Map individuals to their respective bodyparts;
+        # individual/bodypart pairs are unique.
         self.id2label = defaultdict(list)
         for keypoint in layer.all_keypoints:
-            label = keypoint.label
-            id_ = keypoint.id
-            if label not in self.id2label[id_]:
-                self.id2label[id_].append(label)
+            self.id2label[keypoint.id].append(keypoint.label)
+        self._id_model = KeypointsModel(list(self.id2label), self)
+        self._label_models: Dict[str, KeypointsModel] = {
+            id_: KeypointsModel(labels, self) for id_, labels in self.id2label.items()
+        }
+        self._keypoints = dict(
+            zip(layer._all_keypoint_keys.tolist(), layer.all_keypoints)
+        )
+        self._annotated = set()
+        self._n_annotated = dict.fromkeys(self.id2label, 0)
+        self._frame = None
 
         self.menus = dict()
         if layer.ids[0]:
-            menu = create_dropdown_menu(layer, list(self.id2label), "id")
+            menu = create_dropdown_menu(layer, self._id_model, "id")
             menu.currentTextChanged.connect(self.refresh_label_menu)
             self.menus["id"] = menu
         self.menus["label"] = create_dropdown_menu(
-            layer, self.id2label[layer.ids[0]], "label"
+            layer, self._label_models[layer.ids[0]], "label"
         )
         layout = QHBoxLayout()
         for menu in self.menus.values():
             layout.addWidget(menu)
         self.setLayout(layout)
+        self.refresh_annotation_state()
 
     def update_menus(self, event):
         keypoint = self.layer.current_keypoint
         for attr, menu in self.menus.items():
-            val = getattr(keypoint, attr)
-            if menu.currentText() != val:
-                menu.update_to(val)
+            menu.update_to(getattr(keypoint, attr))
 
     def refresh_label_menu(self, text: str):
         menu = self.menus["label"]
         menu.blockSignals(True)
-        menu.clear()
-        menu.addItems(self.id2label[text])
+        menu.setModel(self._label_models[text])
+        menu.update_to(self.layer.current_label)
         menu.blockSignals(False)
 
+    def refresh_annotation_state(self, event=None):
+        """List the keypoints annotated in the current frame again."""
+        self._frame = self.layer._slice_indices[0]
+        annotated = set(self.layer._annotated_keys.tolist())
+        self._set_annotated(annotated - self._annotated, True)
+        self._set_annotated(self._annotated - annotated, False)
+
+    def _on_set_data(self, event=None):
+        # Data changes are handled by _on_data and _on_edited
+        if self.layer._slice_indices[0] != self._frame:
+            self.refresh_annotation_state()
+
+    def _on_data(self, event=None):
+        # Edits are handled incrementally by _on_edited
+        if self.layer._is_editing:
+            return
+        self.refresh_annotation_state()
 
-def create_dropdown_menu(layer, items, attr):
-    menu = DropdownMenu(items)
+    def _on_edited(self, event):
+        """Update the check state of the keypoints edited in the current frame."""
+        if event.kind == "move":
+            return
+        keys = set(event.keys[event.row_frames == self._frame].tolist())
+        if event.kind == "add":
+            self._set_annotated(keys - self._annotated, True)
+        else:
+            self._set_annotated(keys & self._annotated, False)
+
+    def _set_annotated(self, keys: Set[int], annotated: bool):
+        for key in keys:
+            keypoint = self._keypoints.get(key)
+            if keypoint is None:
+                continue
+            if annotated:
+                state = Qt.Checked
+                self._annotated.add(key)
+                self._n_annotated[keypoint.id] += 1
+            else:
+                state = Qt.Unchecked
+                self._annotated.discard(key)
+                self._n_annotated[keypoint.id] -= 1
+            self._label_models[keypoint.id].set_state(keypoint.label, state)
+            n = self._n_annotated[keypoint.id]
+            if n == len(self.id2label[keypoint.id]):
+                id_state = Qt.Checked
+            else:
+                id_state = Qt.PartiallyChecked if n else Qt.Unchecked
+            self._id_model.set_state(keypoint.id, id_state)
+
+
+def create_dropdown_menu(layer, model, attr):
+    menu = DropdownMenu(model)
 
     def item_changed(ind):
         current_item = menu.itemText(ind)
-        if current_item is not None:
+        if current_item:
             setattr(layer, f"current_{attr}", current_item)
 
     menu.currentIndexChanged.connect(item_changed)
     return menu
+
+
+class FrameStatesModel(QAbstractListModel):
+    """List model over the frames, holding their labeling state and thumbnail.
+
+    Views only ask for the data of the rows they show, so no per-frame
+    item is ever created.
+    """
+
+    colors = {
+        analysis.LABELED: QColor(46, 125, 50),
+        analysis.LOW_CONFIDENCE: QColor(239, 108, 0),
+    }
+    descriptions = {
+        analysis.UNLABELED: "unlabeled",
+        analysis.LABELED: "labeled",
+        analysis.LOW_CONFIDENCE: "low confidence",
+    }
+
+    def __init__(self, n_frames: int, parent: Optional[QWidget] = None):
+        super(FrameStatesModel, self).__init__(parent)
+        self.states = np.full(n_frames, analysis.UNLABELED, dtype=np.int8)
+        self._icons: Dict[int, QIcon] = dict()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.states)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        frame = index.row()
+        if role == Qt.DisplayRole:
+            return str(frame)
+        if role == Qt.DecorationRole:
+            return self._icons.get(frame)
+        state = int(self.states[frame])
+        if role == Qt.BackgroundRole:
+            color = self.colors.get(state)
+            return QBrush(color) if color is not None else None
+        if role == Qt.ToolTipRole:
+            return f"Frame {frame}: {self.descriptions[state]}"
+        return None
+
+    def set_states(self, frames: np.ndarray, states: np.ndarray):
+        changed = states != self.states[frames]
+        self.states[frames] = states
+        for frame in frames[changed].tolist():
+            index = self.index(frame)
+            self.dataChanged.emit(index, index, [Qt.BackgroundRole, Qt.ToolTipRole])
+
+    def set_icon(self, frame: int, icon: QIcon):
+        self._icons[frame] = icon
+        index = self.index(frame)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class LabelingProgress(QListView):
+    """Thumbnails of all frames, colored by their labeling state.
+
+    Clicking a thumbnail shows its frame. States are computed from the
+    keypoints at once, then only for the frames touched by an edit.
+    States of windowed layers are read from their file window by window,
+    then only recomputed for the frames of the window displayed.
+    """
+
+    def __init__(
+        self,
+        viewer: napari.Viewer,
+        layer: KeyPoints,
+        n_frames: int,
+        size: int = 64,
+        parent: Optional[QWidget] = None,
+    ):
+        super(LabelingProgress, self).__init__(parent)
+        self.viewer = viewer
+        self.layer = layer
+        self.n_frames = n_frames
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(size, size))
+        self.setModel(FrameStatesModel(n_frames, self))
+        self.clicked.connect(self._show_frame)
+        viewer.dims.events.current_step.connect(self._follow)
+        layer.events.data.connect(self._on_data)
+        layer.events.edited.connect(self._on_edited)
+        self.refresh()
+
+    def set_thumbnail(self, result: Tuple[int, np.ndarray]):
+        frame, thumbnail = result
+        height, width = thumbnail.shape[:2]
+        image = QImage(
+            thumbnail.tobytes(), width, height, 3 * width, QImage.Format_RGB888
+        )
+        # Copy, as the image does not own the buffer it was built on
+        self.model().set_icon(frame, QIcon(QPixmap.fromImage(image.copy())))
+
+    def refresh(self, frames: Optional[np.ndarray] = None):
+        data = self.layer.data
+        valid = self.layer.properties["valid"]
+        window = self.layer.metadata.get("window")
+        if frames is None:
+            if window is None:
+                states = analysis.frame_states(data[:, 0], valid, self.n_frames)
+                self.model().set_states(np.arange(self.n_frames), states)
+                return
+            self.model().set_states(
+                np.arange(self.n_frames), window.frame_states(self.n_frames)
+            )
+            # The points displayed may hold edits not stashed yet
+            frames = self._window_frames(window)
+        frames = np.asarray(frames, dtype=int)
+        frames = frames[(frames >= 0) & (frames < self.n_frames)]
+        rows = np.isin(data[:, 0], frames)
+        states = analysis.frame_states(data[rows, 0], valid[rows], self.n_frames)
+        self.model().set_states(frames, states[frames])
+
+    def _window_frames(self, window) -> np.ndarray:
+        """Return the frames of the window displayed, as in the file or not."""
+        start, stop = window.bounds(window.current)
+        return np.union1d(window.frames[start:stop], self.layer.data[:, 0])
+
+    def _on_data(self, event=None):
+        # Edits are handled incrementally by _on_edited
+        if self.layer._is_editing:
+            return
+        window = self.layer.metadata.get("window")
+        if window is None:
+            self.refresh()
+        else:
+            # Only the window displayed was replaced; the states of the
+            # other frames are kept, edits included.
+            self.refresh(self._window_frames(window))
+
+    def _on_edited(self, event):
+        self.refresh(event.frames)
+
+    def _show_frame(self, index: QModelIndex):
+        self.viewer.dims.set_current_step(0, index.row())
+
+    def _follow(self, event=None):
+        frame = self.viewer.dims.current_step[0]
+        if frame < self.n_frames:
+            self.setCurrentIndex(self.model().index(frame))
+
+    def disconnect_events(self):
+        self.viewer.dims.events.current_step.disconnect(self._follow)
+        self.layer.events.data.disconnect(self._on_data)
+        self.layer.events.edited.disconnect(self._on_edited)
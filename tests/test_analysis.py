@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from dlclabel import analysis, misc
+
+
+def _make_dataset(header, n_frames=500, seed=0):
+    rng = np.random.default_rng(seed)
+    n_ids, n_bodyparts = len(header.individuals), len(header.bodyparts)
+    coords = rng.random((n_ids, n_bodyparts, 2)) * 100
+    coords = coords + rng.normal(0, 1, (n_frames, n_ids, n_bodyparts, 2))
+    ids, labels = np.meshgrid(np.arange(n_ids), np.arange(n_bodyparts), indexing="ij")
+    data = np.c_[np.repeat(np.arange(n_frames), ids.size), coords.reshape(-1, 2)]
+    properties = {
+        "label": np.tile(labels.ravel(), n_frames),
+        "id": np.tile(ids.ravel(), n_frames),
+    }
+    return data, properties
+
+
+def test_find_outliers(config):
+    cfg = config.copy()
+    cfg["multianimalproject"] = True
+    header = misc.DLCHeader.from_config(cfg)
+    data, properties = _make_dataset(header)
+    # Move bodypart "b" of ind2 far off in frame 100
+    mask = (
+        (data[:, 0] == 100)
+        & (properties["label"] == header.bodyparts.index("b"))
+        & (properties["id"] == header.individuals.index("ind2"))
+    )
+    data[mask, 1:] += 80
+    df = analysis.find_outliers(data, properties, header)
+    assert set(df["frame"].iloc[:2]) == {100, 101}
+    top = df.iloc[0]
+    assert top["individual"] == "ind2"
+    assert "b" in top["bodyparts"]
+    assert df["score"].is_monotonic_decreasing
+    # Chunks only bound memory
+    pd.testing.assert_frame_equal(
+        analysis.find_outliers(data, properties, header, chunk_size=7), df
+    )
+
+
+def test_find_outliers_empty(config):
+    header = misc.DLCHeader.from_config(config)
+    df = analysis.find_outliers(np.empty((0, 3)), {}, header)
+    assert df.empty
+
+
+def test_compare_annotations(config):
+    cfg = config.copy()
+    cfg["multianimalproject"] = True
+    header = misc.DLCHeader.from_config(cfg)
+    data, properties = _make_dataset(header, n_frames=10)
+    paths = [f"labeled-data/video/img{i}.png" for i in range(10)]
+    # The second annotator's frames are stored in reverse order
+    data2 = data.copy()
+    data2[:, 0] = 9 - data2[:, 0]
+    paths2 = paths[::-1]
+    moved = (data[:, 0] == 3) & (properties["label"] == 0) & (properties["id"] == 1)
+    data2[moved, 1] += 20
+    keep = ~((data[:, 0] == 5) & (properties["label"] == 1) & (properties["id"] == 0))
+    properties2 = {k: v[keep] for k, v in properties.items()}
+    frames, keypoints = analysis.compare_annotations(
+        {
+            "alice": (data, properties, header, paths),
+            "bob": (data2[keep], properties2, header, paths2),
+        }
+    )
+    assert len(frames) == 10
+    assert frames["path"][:2].tolist() == [paths[3], paths[5]]
+    assert frames["max_distance"][0] == np.float32(20)
+    worst = frames.set_index("path").loc[paths[5]]
+    assert (worst["missing_bob"], worst["extra_alice"]) == (1, 1)
+    assert (worst["missing_alice"], worst["extra_bob"]) == (0, 0)
+    assert (frames["agreement"][2:] == 1).all()
+    assert len(keypoints) == len(data)
+    partial = keypoints[~keypoints["bob"]]
+    assert partial[["individual", "bodypart"]].values.tolist() == [["ind1", "b"]]
+    assert np.isnan(partial["distance"]).all()
+
+
+def test_frame_states():
+    frames = np.array([0, 0, 2, 3, 3, 7])
+    valid = np.array([True, True, True, True, False, True])
+    states = analysis.frame_states(frames, valid, 5)
+    np.testing.assert_array_equal(
+        states,
+        [
+            analysis.LABELED,
+            analysis.UNLABELED,
+            analysis.LABELED,
+            analysis.LOW_CONFIDENCE,
+            analysis.UNLABELED,
+        ],
+    )
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import dask.array as da
+import numpy as np
+from dlclabel import flow
+
+
+def _blob(center, shape=(100, 120)):
+    yy, xx = np.mgrid[: shape[0], : shape[1]]
+    return np.exp(-((yy - center[0]) ** 2 + (xx - center[1]) ** 2) / 20)
+
+
+def test_track_points():
+    frames = np.stack([_blob((40 + 2 * t, 50 + 3 * t)) for t in range(5)])
+    # The second point sits in a flat area and cannot be tracked
+    points = np.array([[40, 50], [5, 5]])
+    positions, confidences = flow.track_points(frames, points, np.ones(2))
+    expected = np.c_[40 + 2 * np.arange(1, 5), 50 + 3 * np.arange(1, 5)]
+    np.testing.assert_allclose(positions[:, 0], expected)
+    np.testing.assert_allclose(confidences[:, 0], 1)
+    np.testing.assert_array_equal(confidences[:, 1], 0)
+
+
+def test_propagate():
+    frames = np.stack([_blob((40 + 2 * t, 50 + 3 * t)) for t in range(8)])
+    points = np.array([[40, 50]])
+    results = list(flow.propagate(frames, 0, points, 10, chunk_size=3, n_workers=2))
+    # Frames are tracked range by range, chained from one range to the next
+    assert [inds.tolist() for inds, _, _ in results] == [[1, 2, 3], [4, 5, 6], [7]]
+    positions = np.concatenate([positions for _, positions, _ in results])
+    expected = np.c_[40 + 2 * np.arange(1, 8), 50 + 3 * np.arange(1, 8)]
+    np.testing.assert_allclose(positions[:, 0], expected)
+    confidences = np.concatenate([confidences for _, _, confidences in results])
+    np.testing.assert_allclose(confidences, 1)
+
+    # Lazy stacks are read by the workers; tracking stops with the iteration
+    images = da.from_array(frames, chunks=(1, *frames.shape[1:]))
+    tracking = flow.propagate(images, 0, points, 10, chunk_size=2, n_workers=2)
+    inds, positions, _ = next(tracking)
+    np.testing.assert_allclose(positions[:, 0], expected[:2])
+    tracking.close()
+
+
+def test_import_without_gui():
+    # Workers import dlclabel.flow, which must not pull in napari and Qt
+    code = "import sys, dlclabel.flow; print('napari' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(flow.__file__))
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=root, text=True)
+    assert output.strip() == "False"
@@ -0,0 +1,125 @@
+import os
+import imageio
+import numpy as np
+import pytest
+from dlclabel import frames
+from skimage.io import imread, imsave
+
+
+def test_cluster_duplicates():
+    rng = np.random.default_rng(0)
+    hashes = rng.random((4, 64)) > 0.5
+    hashes[2] = hashes[0]
+    hashes[2, :3] ^= True  # Three bits off
+    hashes[3] = hashes[2]
+    hashes[3, 3:6] ^= True  # Chained to the first image through the third
+    np.testing.assert_array_equal(frames.cluster_duplicates(hashes), [0, 1, 0, 0])
+    np.testing.assert_array_equal(
+        frames.cluster_duplicates(hashes, max_distance=2), [0, 1, 2, 3]
+    )
+    # Distances are computed in small blocks, within buckets only
+    hashes = rng.random((300, 64)) > 0.5
+    hashes[150:] = hashes[:150]
+    hashes[150:, 10] ^= True
+    expected = np.r_[np.arange(150), np.arange(150)]
+    np.testing.assert_array_equal(
+        frames.cluster_duplicates(hashes, block_size=64), expected
+    )
+
+
+def test_find_duplicates(tmp_path):
+    rng = np.random.default_rng(0)
+    images = [(rng.random((60, 80)) * 255).astype(np.uint8) for _ in range(2)]
+    filenames = []
+    for i, image in enumerate([images[0], images[1], images[0], images[1]]):
+        filename = str(tmp_path / f"img{i:03d}.png")
+        imsave(filename, image, check_contrast=False)
+        filenames.append(filename)
+    np.testing.assert_array_equal(frames.find_duplicates(filenames), [0, 1, 0, 1])
+    assert os.path.isfile(tmp_path / frames.HASH_CACHE)
+    # Hashes are now read from the cache
+    cache = frames.HashCache(str(tmp_path / frames.HASH_CACHE))
+    assert all(cache.get(filename) is not None for filename in filenames)
+    np.testing.assert_array_equal(frames.find_duplicates(filenames), [0, 1, 0, 1])
+
+
+def test_mini_batch_kmeans():
+    rng = np.random.default_rng(0)
+    centers = np.array([[0, 0], [10, 0], [0, 10]])
+    samples = centers[rng.integers(3, size=3000)] + rng.normal(size=(3000, 2))
+    kmeans = frames.MiniBatchKMeans(3, seed=0)
+    kmeans.init(samples[:100])
+    for batch in np.array_split(samples, 30):
+        kmeans.partial_fit(batch)
+    found = kmeans.centers[np.argsort(kmeans.centers @ [1, 2])]
+    np.testing.assert_allclose(found, centers, atol=0.5)
+
+
+def test_video_reservoir(tmp_path):
+    video = np.repeat(np.arange(0, 250, 10, dtype=np.uint8), 16 * 16)
+    imageio.mimwrite(tmp_path / "video.gif", video.reshape(-1, 16, 16))
+    rng = np.random.default_rng(0)
+    samples, inds, n_total = frames._video_reservoir(
+        str(tmp_path / "video.gif"), 10, (4, 4), 3, None, rng
+    )
+    assert n_total == 25
+    assert len(np.unique(inds)) == 10
+    np.testing.assert_allclose(samples, np.repeat(10 * inds[:, None], 16, axis=1))
+    # Videos shorter than the reservoir are kept whole
+    samples, inds, n_total = frames._video_reservoir(
+        str(tmp_path / "video.gif"), 50, (4, 4), 3, None, rng
+    )
+    assert n_total == 25 and len(samples) == 25
+    np.testing.assert_array_equal(np.sort(inds), np.arange(25))
+
+
+def test_extract_frames(tmp_path):
+    rng = np.random.default_rng(0)
+    source = tmp_path / "frames"
+    source.mkdir()
+    # Three scenes of ten noisy frames each
+    for i in range(30):
+        image = np.full((40, 50), 60 * (i // 10) + 40.0) + rng.normal(size=(40, 50))
+        filename = str(source / f"img{i:02d}.png")
+        imsave(filename, image.astype(np.uint8), check_contrast=False)
+    inds = frames.select_frames(str(source), 3, batch_size=8, init_size=10, seed=0)
+    np.testing.assert_array_equal(inds // 10, [0, 1, 2])
+
+    output = tmp_path / "labeled-data" / "frames"
+    written = frames.extract_frames(str(source), str(output), 3, seed=0)
+    assert sorted(os.listdir(output)) == [os.path.basename(f) for f in written]
+    with pytest.raises(IOError):
+        frames.extract_frames(str(source), str(output), 3)
+
+    # Video frames are named with DeepLabCut's zero-padding
+    video = [imread(filename) for filename in frames.list_images(str(source))]
+    imageio.mimwrite(tmp_path / "video.gif", video)
+    inds = frames.select_frames(str(tmp_path / "video.gif"), 3, seed=0)
+    np.testing.assert_array_equal(inds // 10, [0, 1, 2])
+    output = tmp_path / "labeled-data" / "video"
+    written = frames.extract_frames(str(tmp_path / "video.gif"), str(output), 3, seed=0)
+    names = sorted(os.listdir(output))
+    assert names == [f"img{ind:02d}.png" for ind in inds]
+    np.testing.assert_array_equal(imread(written[0])[..., 0], video[inds[0]])
+
+
+def test_iter_thumbnails(tmp_path):
+    filenames = []
+    for i in range(3):
+        filename = str(tmp_path / f"img{i}.png")
+        image = np.full((30, 60), 80 * i, dtype=np.uint8)
+        imsave(filename, image, check_contrast=False)
+        filenames.append(filename)
+    thumbnails = dict(frames.iter_thumbnails(filenames, size=16))
+    assert sorted(thumbnails) == [0, 1, 2]
+    assert thumbnails[1].shape == (16, 16, 3)
+    # The aspect ratio is kept
+    assert (thumbnails[1][:8] == 80).all() and (thumbnails[1][8:] == 0).all()
+    cache = frames.ThumbnailCache(str(tmp_path / frames.THUMBNAIL_CACHE), 16)
+    np.testing.assert_array_equal(cache.get(filenames[2]), thumbnails[2])
+
+    # Missing or unreadable images are skipped
+    os.remove(filenames[0])
+    (tmp_path / "img3.png").write_bytes(b"not an image")
+    filenames.append(str(tmp_path / "img3.png"))
+    assert sorted(dict(frames.iter_thumbnails(filenames, size=16))) == [1, 2]
@@ -0,0 +1,313 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+from dlclabel import io, misc
+
+
+def _make_points(header, n_frames=5, seed=0):
+    rng = np.random.default_rng(seed)
+    ids, labels = zip(*header.form_individual_bodypart_pairs())
+    n_points = n_frames * len(labels)
+    data = np.empty((n_points, 3))
+    data[:, 0] = np.repeat(np.arange(n_frames) * 2, len(labels))
+    data[:, 1:] = rng.random((n_points, 2)) * 100
+    properties = io._populate_metadata(
+        header,
+        labels=np.tile(labels, n_frames),
+        ids=np.tile(ids, n_frames),
+        likelihood=rng.random(n_points),
+    )["properties"]
+    keep = rng.random(n_points) > 0.3
+    return data[keep], {k: v[keep] for k, v in properties.items()}
+
+
+@pytest.mark.parametrize("is_multi", [False, True])
+def test_points_to_dataframe(is_multi, config):
+    cfg = config.copy()
+    cfg["multianimalproject"] = is_multi
+    header = misc.DLCHeader.from_config(cfg)
+    data, properties = _make_points(header)
+    df = io._points_to_dataframe(data, properties, header)
+    assert df.columns.equals(header.columns)
+    assert list(df.index) == sorted(np.unique(data[:, 0]).astype(int))
+    assert np.isfinite(df.to_numpy()).sum() == 2 * len(data)
+
+    # Reading the frame back yields the original points
+    data_, df_long, _ = io._read_points(df)
+    order = np.lexsort(data.T[::-1])
+    order_ = np.lexsort(data_.T[::-1])
+    np.testing.assert_allclose(data[order], data_[order_])
+    labels = np.asarray(header.bodyparts)[properties["label"]]
+    np.testing.assert_array_equal(
+        labels[order], df_long["bodyparts"].to_numpy()[order_]
+    )
+
+
+def _write_machine_labels(tmp_path, header, n_frames=50):
+    folder = tmp_path / "labeled-data" / "video"
+    folder.mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    values = rng.random((n_frames, len(header.columns))) * 100
+    paths = [("labeled-data", "video", f"img{i:03d}.png") for i in range(n_frames)]
+    df = pd.DataFrame(
+        values, index=pd.MultiIndex.from_tuples(paths), columns=header.columns
+    )
+    filename = str(folder / "machinelabels-iter0.h5")
+    df.to_hdf(filename, key="df_with_missing")
+    return filename, df
+
+
+def test_windowed_hdf(tmp_path, config, monkeypatch):
+    cfg = dict(config, multianimalproject=True)
+    header = misc.DLCHeader.from_config(cfg)
+    filename, df = _write_machine_labels(tmp_path, header)
+
+    monkeypatch.setattr(io, "WINDOWED_MIN_ROWS", 10)
+    [(data, metadata, _)] = io.read_hdf(filename)
+    window = metadata["metadata"]["window"]
+    assert window.nrows == 50 and len(window.paths) == 50
+    assert data.shape == (50 * 5, 3)  # A single window of 1000 frames
+    window.close()
+
+    window = io.WindowedHDF(filename, window_size=10)
+    assert window.n_windows == 5
+    window.prefetch([1])
+    expected = df.iloc[10:20].set_axis(pd.RangeIndex(10, 20))
+    pd.testing.assert_frame_equal(window.get(1), expected, check_names=False)
+    # Rows follow the images, whatever their order
+    paths = [window.paths[i] for i in range(49, -1, -1)]
+    window.map_paths(paths)
+    assert window.window_of(49) == 0
+    data, properties = window.points(0)
+    assert set(data[:, 0]) == set(range(40, 50))
+
+    # Edit window 0, switch to window 1 and back: the edit is kept
+    data[0, 1:] = -1
+    window.stash(0, data, properties)
+    window.current = 1
+    data1, properties1 = window.points(1)
+    window.stash(1, data1, properties1)
+    data0, _ = window.points(0)
+    np.testing.assert_array_equal(data0[0], data[0])
+    window.current = 0
+    edited, edited_properties = window.edited_points(data0, properties)
+    assert len(edited) == len(data0)
+
+    # Only the edited windows are saved
+    with open(tmp_path / "config.yaml", "w") as file:
+        yaml.safe_dump(cfg, file)
+    meta = io._populate_metadata(header, paths=metadata["metadata"]["paths"])
+    meta["metadata"].update(window=window, root=str(tmp_path), paths=paths)
+    meta["properties"] = properties
+    meta["name"] = "machinelabels-iter0"
+    io.write_hdf("", data0, meta)
+    saved = pd.read_hdf(tmp_path / "labeled-data" / "video" / "CollectedData_user.h5")
+    assert len(saved) == 10
+    # The first window holds the first rows of the file
+    assert saved.index[-1] == ("labeled-data", "video", "img009.png")
+    first = saved.loc[("labeled-data", "video", "img000.png")]
+    assert (first.iloc[:2] == -1).all()
+    window.close()
+
+
+def test_windowed_hdf_remap_and_save(tmp_path, config):
+    cfg = dict(config, multianimalproject=True)
+    with open(tmp_path / "config.yaml", "w") as file:
+        yaml.safe_dump(cfg, file)
+    header = misc.DLCHeader.from_config(cfg)
+    filename, df = _write_machine_labels(tmp_path, header)
+    window = io.WindowedHDF(filename, window_size=10)
+    paths = [os.path.join(*window.paths.parts[i]) for i in range(50)]
+    window.map_paths(paths)
+    data, properties = window.points(0)
+    data[data[:, 0] == 0, 1:] = -1
+    window.stash(0, data, properties)
+
+    # Edits follow their images when these are mapped again
+    window.map_paths(paths[::-1])
+    data, properties = window.points(0)
+    assert set(data[:, 0]) == set(range(40, 50))
+    assert (data[data[:, 0] == 49, 1:] == -1).all()
+
+    # Frames outside the edited windows are already labeled in one of them
+    folder = tmp_path / "labeled-data" / "video"
+    gt = df.iloc[[0, 30]].copy()
+    gt.columns = header.columns
+    gt.iloc[:, 0] = -5
+    gt.to_hdf(folder / "CollectedData_user.h5", key="df_with_missing")
+    meta = io._populate_metadata(header, paths=paths[::-1])
+    meta["metadata"].update(window=window, root=str(tmp_path))
+    meta["properties"] = properties
+    meta["name"] = "machinelabels-iter0"
+    for _ in range(2):
+        io.write_hdf("", data, meta)
+        saved = pd.read_hdf(folder / "CollectedData_user.h5")
+        # Rows of the displayed window replace theirs; unedited rows stay as
+        # they were, and rows are never written twice.
+        assert not saved.index.duplicated().any()
+        assert len(saved) == 11
+        assert (saved.loc[("labeled-data", "video", "img000.png")].iloc[:2] == -1).all()
+        pd.testing.assert_series_equal(
+            saved.loc[("labeled-data", "video", "img030.png")], gt.iloc[1]
+        )
+    # The machine labels are left untouched
+    pd.testing.assert_frame_equal(pd.read_hdf(filename), df)
+    window.close()
+
+
+def test_merge_annotations(config):
+    header = misc.DLCHeader.from_config(config)
+    index = pd.MultiIndex.from_tuples(
+        [("labeled-data", "video", f"img{i}.png") for i in range(4)]
+    )
+    base = pd.DataFrame(
+        np.arange(4 * len(header.columns), dtype=float).reshape(4, -1),
+        index=index,
+        columns=header.columns,
+    )
+    local = base.copy()
+    local.iloc[0, 0] = -1  # Edited here only
+    local.iloc[1, 0] = -2  # Edited on both sides
+    local.iloc[3] = np.nan  # Labels deleted
+    remote = base.copy()
+    remote.iloc[1, 0] = -3
+    remote.iloc[2, 1] = -4  # Edited by the other session only
+    # Image labeled by the other session, saved with Windows paths as index
+    remote.loc[("labeled-data", "video", "img9.png"), :] = 1
+    remote.index = ["\\".join(path) for path in remote.index]
+
+    merged, n_conflicts = io.merge_annotations(base, local, remote)
+    assert n_conflicts == 1
+    assert merged.shape == (4, len(header.columns))
+    assert merged.iloc[0, 0] == -1
+    assert merged.iloc[1, 0] == -2
+    assert merged.iloc[2, 1] == -4
+    assert ("labeled-data", "video", "img3.png") not in merged.index
+    assert (merged.loc[("labeled-data", "video", "img9.png")] == 1).all()
+
+
+def test_write_hdf_without_base(tmp_path, config):
+    # A layer labeled from the config does not overwrite existing labels
+    header = misc.DLCHeader.from_config(config)
+    folder = tmp_path / "labeled-data" / "video"
+    folder.mkdir(parents=True)
+    paths = [os.path.join("labeled-data", "video", f"img{i}.png") for i in range(10)]
+    data, properties = _make_points(header)
+    existing = io._points_to_dataframe(data + [1, 0, 0], properties, header)
+    existing.index = misc.PathTable.from_paths(paths).to_index(existing.index)
+    existing.to_hdf(folder / "CollectedData_user.h5", key="df_with_missing")
+
+    metadata = io._populate_metadata(header, paths=paths)
+    metadata["properties"] = properties
+    metadata["name"] = "CollectedData_user"
+    metadata["metadata"]["root"] = str(tmp_path)
+    io.write_hdf("", data, metadata)
+    df = pd.read_hdf(folder / "CollectedData_user.h5")
+    assert len(df) == len(existing) + len(np.unique(data[:, 0]))
+    assert os.path.isfile(metadata["metadata"]["base_path"])
+
+
+def test_write_hdf_merges_with_base(tmp_path, config):
+    header = misc.DLCHeader.from_config(config)
+    folder = tmp_path / "labeled-data" / "video"
+    folder.mkdir(parents=True)
+    paths = [os.path.join("labeled-data", "video", f"img{i}.png") for i in range(10)]
+    data, properties = _make_points(header)
+    df = io._points_to_dataframe(data, properties, header)
+    df.index = misc.PathTable.from_paths(paths).to_index(df.index)
+    filename = str(folder / "CollectedData_user.h5")
+    df.to_hdf(filename, key="df_with_missing")
+
+    [(data, metadata, _)] = io.read_hdf(filename)
+    # The labels as loaded are kept on disk, not in the layer
+    meta = metadata["metadata"]
+    assert not any(isinstance(v, pd.DataFrame) for v in meta.values())
+    remote = df.copy()
+    remote.iloc[1, 0] = -1  # Saved by another session in the meantime
+    os.remove(filename)
+    remote.to_hdf(filename, key="df_with_missing")
+    data[0, 1:] = -2
+    io.write_hdf("", data, metadata)
+    merged = pd.read_hdf(filename)
+    assert merged.iloc[1, 0] == -1
+    assert (merged.iloc[0, :2] == -2).all()
+    # The next merge is with respect to the labels of the layer
+    base = pd.read_hdf(meta["base_path"])
+    np.testing.assert_equal(base.iloc[1, 0], df.iloc[1, 0])
+    assert (base.iloc[0, :2] == -2).all()
+
+    # A base gone missing is warned about
+    os.remove(meta["base_path"])
+    os.utime(filename, ns=(0, 0))
+    with pytest.warns(UserWarning, match="removed or modified"):
+        io.write_hdf("", data, metadata)
+
+
+def test_file_lock(tmp_path):
+    filename = str(tmp_path / "CollectedData")
+    with io.FileLock(filename):
+        with pytest.raises(TimeoutError):
+            io.FileLock(filename, timeout=0.2).acquire()
+        # A lock left over by a crashed session is broken
+        with io.FileLock(filename, stale_after=0):
+            pass
+    assert not os.path.exists(filename + ".lock")
+
+    # A stale lock replaced by a fresh one in the meantime is not broken
+    lock = io.FileLock(filename)
+    lock.acquire()
+    stale = os.stat(lock.lockfile)
+    lock.release()
+    with io.FileLock(filename) as other:
+        other_stat = os.stat(lock.lockfile)
+        lock._break(stale)
+        assert os.path.exists(lock.lockfile)
+        assert os.stat(lock.lockfile).st_ino == other_stat.st_ino
+        lock._break(other_stat)
+        assert not os.path.exists(lock.lockfile)
+
+
+def test_read_masks(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    frames = [3, 0, 3, 1]
+    polygons = [
+        np.c_[np.full(n, frame), rng.random((n, 2)) * 100]
+        for frame, n in zip(frames, [4, 3, 5, 6])
+    ]
+    # Layout of napari's shapes csv, one row per vertex
+    rows = [
+        [i, "polygon", j, *vertex]
+        for i, polygon in enumerate(polygons)
+        for j, vertex in enumerate(polygon)
+    ]
+    columns = ["index", "shape-type", "vertex-index", "axis-0", "axis-1", "axis-2"]
+    pd.DataFrame(rows, columns=columns).to_csv(tmp_path / "vertices.csv", index=False)
+
+    # Images of the folder are loaded along with the masks
+    (tmp_path / "img0.png").write_bytes(b"")
+    assert io.handle_path(str(tmp_path)) == [
+        str(tmp_path / "*.png"),
+        str(tmp_path / "vertices.csv"),
+    ]
+
+    [(data, metadata, layer_type)] = io.read_masks(str(tmp_path))
+    assert layer_type == "shapes"
+    assert metadata["shape_type"] == ["polygon"] * 4
+    # Shapes come sorted by frame
+    for polygon, ind in zip(data, [1, 3, 0, 2]):
+        np.testing.assert_allclose(polygon, polygons[ind])
+
+    monkeypatch.setattr(io, "LAZY_MIN_SHAPES", 2)
+    [(data, metadata, _)] = io.read_masks(str(tmp_path / "vertices.csv"))
+    assert len(data) == 1 and metadata["metadata"]["frame"] == 0
+    masks = metadata["metadata"]["polygons"]
+    data, _ = masks.shapes([3])
+    np.testing.assert_allclose(data[1], polygons[2])
+    masks.replace(3, [polygons[2][:3]], ["polygon"])
+    assert len(masks) == 3
+    data, shape_types = masks.shapes()
+    assert shape_types == ["polygon"] * 3
+    np.testing.assert_allclose(data[2], polygons[2][:3])
+    np.testing.assert_allclose(data[1], polygons[3])
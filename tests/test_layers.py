@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dlclabel import io, misc, tracks
+from dlclabel.layers import KeyPoints
+
+
+def _make_layer(config, n_frames=3):
+    header = misc.DLCHeader.from_config(dict(config, multianimalproject=True))
+    ids, labels = zip(*header.form_individual_bodypart_pairs())
+    data = np.c_[
+        np.repeat(np.arange(n_frames), len(labels)),
+        np.arange(n_frames * len(labels))[:, None] * [1, 2],
+    ].astype(float)
+    metadata = io._populate_metadata(
+        header, labels=np.tile(labels, n_frames), ids=np.tile(ids, n_frames)
+    )
+    metadata.pop("name")
+    return KeyPoints(data, **metadata)
+
+
+def _snapshot(layer):
+    return (
+        layer.data.copy(),
+        {k: v.copy() for k, v in layer.properties.items()},
+        layer.size.copy(),
+        layer.face_color.copy(),
+    )
+
+
+def _assert_same(layer, snapshot):
+    data, properties, size, face_color = snapshot
+    np.testing.assert_array_equal(layer.data, data)
+    for k, v in properties.items():
+        np.testing.assert_array_equal(layer.properties[k], v)
+    np.testing.assert_array_equal(layer.size, size)
+    np.testing.assert_array_equal(layer.face_color, face_color)
+
+
+@pytest.fixture()
+def layer(config):
+    return _make_layer(config)
+
+
+def test_undo_redo(layer):
+    # Sizes differ from point to point, to tell them apart
+    layer.size = np.arange(len(layer.data))[:, None] + 1
+    snapshots = [_snapshot(layer)]
+    layer.selected_data = {1, 4, 8}
+    layer.remove_selected()
+    snapshots.append(_snapshot(layer))
+    assert len(layer.data) == len(snapshots[0][0]) - 3
+    layer._move({0, 2}, [0, 5, 5])
+    snapshots.append(_snapshot(layer))
+    layer._drag_start = None
+    layer._slice_dims([5, 0, 0])
+    layer.add([5, 1, 1])
+    snapshots.append(_snapshot(layer))
+    assert layer.data[-1, 0] == 5
+
+    # Removed points are put back with their own sizes and colors
+    for snapshot in snapshots[-2::-1]:
+        layer.undo()
+        _assert_same(layer, snapshot)
+    for snapshot in snapshots[1:]:
+        layer.redo()
+        _assert_same(layer, snapshot)
+
+
+def test_paste_to_frames(layer):
+    layer.size = np.arange(len(layer.data))[:, None] + 1
+    n_points = len(layer.data)
+    copied = np.flatnonzero(layer.data[:, 0] == 0)
+    layer.selected_data = set(copied.tolist())
+    layer._copy_data()
+    # Two keypoints are left unlabeled in frame 1, and frame 4 has none
+    layer.selected_data = set(copied[[1, 3]] + len(copied))
+    layer.remove_selected()
+    before = _snapshot(layer)
+
+    layer.paste_to_frames([1, 4, 4])
+    new = slice(n_points - 2, None)
+    np.testing.assert_array_equal(layer.data[new, 0], [1, 1] + [4] * len(copied))
+    np.testing.assert_array_equal(
+        layer.data[new, 1:], layer.data[copied[[1, 3]].tolist() + copied.tolist(), 1:]
+    )
+    for k, v in layer.properties.items():
+        np.testing.assert_array_equal(v[new], v[np.r_[copied[[1, 3]], copied]])
+    # Pasted points keep the sizes they were copied with
+    np.testing.assert_array_equal(layer.size[new, 1], np.r_[copied[[1, 3]], copied] + 1)
+    after = _snapshot(layer)
+
+    # Keypoints are not pasted twice
+    layer.paste_to_frames([1, 4])
+    _assert_same(layer, after)
+
+    # The paste is a single edit
+    layer.undo()
+    _assert_same(layer, before)
+    layer.redo()
+    _assert_same(layer, after)
+
+
+def _check_filled(layer, n_points, rows, source):
+    filled = slice(n_points, None)
+    for k in "label", "id":
+        np.testing.assert_array_equal(
+            layer.properties[k][filled], layer.properties[k][source]
+        )
+    np.testing.assert_array_equal(
+        layer.properties["likelihood"][filled], tracks.FILLED_LIKELIHOOD
+    )
+    assert not layer.properties["valid"][filled].any()
+    np.testing.assert_allclose(layer.data[filled], rows)
+
+
+def test_interpolate(layer):
+    n_keypoints = len(layer.all_keypoints)
+    # The second keypoint is left unlabeled in frame 1
+    layer.selected_data = {n_keypoints + 1}
+    layer.remove_selected()
+    n_points = len(layer.data)
+    before = _snapshot(layer)
+    first, last = layer.data[1], layer.data[2 * n_keypoints]
+    layer.interpolate()
+    assert len(layer.data) == n_points + 1
+    _check_filled(layer, n_points, [(first + last) / 2], [1])
+    layer.undo()
+    _assert_same(layer, before)
+
+
+def _make_windowed_layer(tmp_path, config):
+    """Return a layer over the first 10 of 30 frames of machine labels."""
+    header = misc.DLCHeader.from_config(dict(config, multianimalproject=True))
+    columns = header.columns.to_frame(index=False)
+    columns = columns[columns["coords"] == "x"].assign(coords="likelihood")
+    columns = pd.MultiIndex.from_frame(
+        pd.concat([header.columns.to_frame(index=False), columns])
+    )
+    values = np.arange(30)[:, None] * np.ones(len(columns))
+    paths = [("labeled-data", "video", f"img{i:02d}.png") for i in range(30)]
+    df = pd.DataFrame(values, index=pd.MultiIndex.from_tuples(paths), columns=columns)
+    filename = str(tmp_path / "machinelabels-iter0.h5")
+    df.to_hdf(filename, key="df_with_missing")
+    window = io.WindowedHDF(filename, window_size=10)
+    data, metadata, _ = io._read_hdf_windowed(window)
+    metadata.pop("name")
+    return KeyPoints(data, **metadata)
+
+
+def test_interpolate_windowed(tmp_path, config):
+    layer = _make_windowed_layer(tmp_path, config)
+    window = layer.metadata["window"]
+    assert np.unique(layer.data[:, 0]).tolist() == list(range(10))
+
+    # The first keypoint is left unlabeled in frames 3 to 5
+    key = layer._keypoint_keys(layer.properties["label"], layer.properties["id"])
+    rows = np.flatnonzero((key == key[0]) & np.isin(layer.data[:, 0], [3, 4, 5]))
+    layer.selected_data = set(rows.tolist())
+    layer.remove_selected()
+    n_points = len(layer.data)
+    layer.interpolate()
+    # Points are only filled within the window
+    assert len(layer.data) == n_points + 3
+    _check_filled(layer, n_points, [[3, 3, 3], [4, 4, 4], [5, 5, 5]], [0] * 3)
+    # Filled points are saved along with the window
+    data, properties = window.edited_points(layer.data, layer.properties)
+    assert len(data) == n_points + 3
+    np.testing.assert_array_equal(properties["likelihood"][-3:], 0)
+    window.close()
+
+
+def test_add_tracked(layer):
+    rows = np.flatnonzero(layer.data[:, 0] == 0)
+    properties = layer._take_properties(rows)
+    # The third keypoint is left unlabeled in frame 1
+    layer.selected_data = {rows[2] + len(rows)}
+    layer.remove_selected()
+    n_points = len(layer.data)
+    before = _snapshot(layer)
+    positions = np.random.default_rng(0).random((2, len(rows), 2)) * 100
+    confidences = np.linspace(0, 1, 2 * len(rows)).reshape(2, -1)
+    layer.add_tracked(properties, np.array([1, 3]), positions, confidences)
+
+    # Keypoints already labeled are left alone
+    new = slice(n_points, None)
+    np.testing.assert_array_equal(layer.data[new, 0], [1] + [3] * len(rows))
+    np.testing.assert_allclose(layer.data[new, 1:], [positions[0, 2], *positions[1]])
+    for k in "label", "id":
+        np.testing.assert_array_equal(
+            layer.properties[k][new], properties[k][[2, *range(len(rows))]]
+        )
+    # Tracking confidences are stored as likelihoods
+    likelihood = np.r_[confidences[0, 2], confidences[1]]
+    np.testing.assert_allclose(layer.properties["likelihood"][new], likelihood)
+    np.testing.assert_array_equal(layer.properties["valid"][new], likelihood > 0.6)
+    layer.undo()
+    _assert_same(layer, before)
+
+
+def test_text_shows_names(layer):
+    names = layer._decode("label", layer.properties["label"])
+    np.testing.assert_array_equal(layer.text.values, names)
+    layer.selected_data = {1}
+    layer.remove_selected()
+    layer.current_keypoint = layer.all_keypoints[1]
+    layer.add([0, 1, 1])
+    assert layer.text.values[-1] == layer.all_keypoints[1].label
+    layer.undo()
+    layer.undo()
+    np.testing.assert_array_equal(layer.text.values, names)
+    # Unknown codes are left blank rather than wrapping to the last name
+    np.testing.assert_array_equal(layer._decode("label", [-1, 0]), ["", names[0]])
+
+
+def test_message_names_keypoint(layer):
+    layer._value = 4
+    keypoint = layer.all_keypoints[4]
+    assert layer.get_message().endswith(f" ({keypoint.id} {keypoint.label})")
@@ -1,4 +1,6 @@
 import os
+import numpy as np
+import pandas as pd
 import pytest
 from dlclabel import misc
 
@@ -22,6 +24,12 @@ def test_encode_categories():
     assert map_ == {"b": 0, "c": 1, "a": 2}
 
 
+def test_encode_with_categories():
+    codes = misc.encode_with_categories(["c", "a", "a", "d"], ["a", "b", "c"])
+    assert codes.dtype == misc.CODE_DTYPE
+    assert list(codes) == [2, 0, 0, -1]
+
+
 @pytest.mark.parametrize("is_multi", [False, True])
 def test_dlc_header(is_multi, config):
     cfg = config.copy()
@@ -40,6 +48,37 @@ def test_dlc_header(is_multi, config):
         assert header.bodyparts == config["bodyparts"]
 
 
+@pytest.mark.parametrize("is_multi", [False, True])
+def test_dlc_header_lookup_tables(is_multi, config):
+    cfg = config.copy()
+    cfg["multianimalproject"] = is_multi
+    header = misc.DLCHeader.from_config(cfg)
+    assert list(header.bodypart_codes) == header.bodyparts
+    assert list(header.individual_codes) == header.individuals
+    positions = header.column_positions
+    for pos, col in enumerate(header.columns):
+        *_, bodypart, coord = col
+        id_ = col[1] if is_multi else ""
+        ind = (
+            header.individual_codes[id_],
+            header.bodypart_codes[bodypart],
+            header.coords.index(coord),
+        )
+        assert positions[ind] == pos
+    assert (positions >= 0).sum() == len(header.columns)
+    with pytest.raises(ValueError):
+        positions[0, 0, 0] = 0
+
+
+def test_dlc_header_set_scorer(config):
+    header = misc.DLCHeader.from_config(config)
+    pairs = header.form_individual_bodypart_pairs()
+    header.scorer = "other"
+    assert header.scorer == "other"
+    assert header.columns.get_level_values("scorer").unique().to_list() == ["other"]
+    assert header.form_individual_bodypart_pairs() == pairs
+
+
 def test_cycle_enum():
     cycle_enum = misc.CycleEnum("Item", ["ITEM1", "ITEM2", "ITEM3"])
     assert cycle_enum("item1") is cycle_enum.ITEM1
@@ -60,3 +99,55 @@ def test_to_os_dir_sep():
     expected = r'labeled-data\img folder1' \
         if os.path.sep == '\\' else path
     assert misc.to_os_dir_sep(path) == expected
+
+
+def test_path_table():
+    index = pd.Index(
+        [
+            r"labeled-data\video\img1.png",
+            "labeled-data/video/img0.png",
+            "labeled-data/video/img1.png",
+        ]
+    )
+    table, codes = misc.PathTable.from_index(index)
+    assert len(table) == 2
+    np.testing.assert_array_equal(codes, [0, 1, 0])
+    assert table[1] == os.path.join("labeled-data", "video", "img0.png")
+    multi = table.to_index(codes)
+    assert multi[0] == ("labeled-data", "video", "img1.png")
+    table2, codes2 = misc.PathTable.from_index(multi)
+    assert table2.parts == table.parts
+    np.testing.assert_array_equal(codes2, codes)
+
+    images = misc.PathTable.from_paths(
+        [f"labeled-data/video/img{i}.png" for i in range(3)]
+    )
+    np.testing.assert_array_equal(images.lookup(table), [1, 0])
+    assert misc.as_path_table(images) is images
+    assert list(misc.as_path_table(None)) == []
+
+    table, codes = misc.PathTable.from_index(pd.Index([4, 2]))
+    assert not table
+    np.testing.assert_array_equal(codes, [4, 2])
+
+
+def test_edit_history():
+    history = misc.EditHistory(maxlen=2)
+    assert history.undo() is None
+    edits = [
+        misc.Edit("move", np.array([i]), np.zeros((1, 3)), np.ones((1, 3)), None)
+        for i in range(3)
+    ]
+    for edit in edits:
+        history.push(edit)
+    # The oldest edit is forgotten
+    assert len(history) == 2
+    assert history.undo() is edits[2]
+    assert history.undo() is edits[1]
+    assert not history.can_undo
+    assert history.redo() is edits[1]
+    assert history.can_redo
+    history.push(edits[0])
+    assert not history.can_redo
+    history.amend(new=np.full((1, 3), 2))
+    assert history.undo().new[0, 0] == 2
@@ -0,0 +1,50 @@
+import dask.array as da
+import numpy as np
+from dlclabel import preprocessing
+
+
+def test_preprocess_frame():
+    rng = np.random.default_rng(0)
+    image = (rng.random((40, 50, 3)) * 60).astype(np.uint8)
+    processed = preprocessing.preprocess_frame(
+        image, clahe=True, grayscale=True, crop=(5, 35, 10, None)
+    )
+    assert processed.shape == (30, 40, 3)
+    assert processed.dtype == np.uint8
+    assert (processed[..., 0] == processed[..., 2]).all()
+    # Contrast is stretched
+    assert processed.max() - processed.min() > image.max() - image.min()
+
+
+def test_preprocessor_cache():
+    rng = np.random.default_rng(0)
+    frames = (rng.random((10, 20, 30)) * 60).astype(np.uint8)
+    reads = []
+
+    def read(block, block_info=None):
+        reads.append(block_info[0]["array-location"][0][0])
+        return block
+
+    stack = da.from_array(frames, chunks=(1, 20, 30)).map_blocks(read, dtype=np.uint8)
+    preprocessor = preprocessing.Preprocessor(
+        cache_size=2, gamma=0.5, crop=(2, 12, 0, 30)
+    )
+    processed = preprocessor.apply(stack)
+    assert processed.shape == (10, 10, 30)
+    assert preprocessor.offset == (2, 0)
+    assert not reads  # Nothing is computed until frames are read
+    first = np.asarray(processed[3])
+    np.testing.assert_array_equal(np.asarray(processed[3]), first)
+    assert reads == [3]
+    np.asarray(processed[4:6])
+    np.asarray(processed[3])  # Evicted from the cache
+    assert sorted(reads[1:3]) == [4, 5] and reads[3:] == [3]
+
+
+def test_preprocessor_negative_crop():
+    stack = da.zeros((2, 20, 30), dtype=np.uint8, chunks=(1, 20, 30))
+    preprocessor = preprocessing.Preprocessor(crop=(-15, None, 5, -5))
+    processed = preprocessor.apply(stack)
+    assert processed.shape == (2, 15, 20)
+    assert preprocessor.offset == (5, 5)
+    assert np.asarray(processed[0]).shape == (15, 20)
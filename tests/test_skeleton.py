@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from dlclabel import misc, skeleton
+
+
+@pytest.mark.parametrize("is_multi", [False, True])
+def test_bone_table(is_multi, config):
+    cfg = config.copy()
+    cfg["multianimalproject"] = is_multi
+    header = misc.DLCHeader.from_config(cfg)
+    bones = skeleton.bone_table(header, [["a", "b"], ["b", "c"], ["a", "z"]])
+    n_ids = len(header.individuals)
+    pairs = {
+        (
+            (header.bodyparts[k1 // n_ids], header.individuals[k1 % n_ids]),
+            (header.bodyparts[k2 // n_ids], header.individuals[k2 % n_ids]),
+        )
+        for k1, k2 in bones
+    }
+    # "c" only exists for the unique individual of multi-animal projects,
+    # and "z" does not exist at all.
+    ids = ("ind1", "ind2") if is_multi else ("",)
+    expected = {(("a", ind), ("b", ind)) for ind in ids}
+    assert pairs == expected
+
+
+def test_gather_bones():
+    bones = np.array([[0, 1], [1, 2], [2, 3]])
+    coords = np.array([[0.0, 0.0], [1.0, 1.0], [3.0, 3.0]])
+    segments, found = skeleton.gather_bones(coords, np.array([2, 0, 1]), bones, 4)
+    np.testing.assert_array_equal(found, [True, True, False])
+    np.testing.assert_array_equal(segments[:, :, 0], [[1, 3], [3, 0]])
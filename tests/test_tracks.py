@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from dlclabel import tracks
+
+
+def test_interpolate_keyframes_linear():
+    data = np.array([[0, 0, 0], [4, 4, 8], [2, 1, 1], [5, 2, 2], [3, 3, 3]], float)
+    keys = np.array([0, 0, 1, 1, 2])
+    new_data, source = tracks.interpolate_keyframes(data, keys)
+    np.testing.assert_array_equal(new_data[:, 0], [1, 2, 3, 3, 4])
+    np.testing.assert_allclose(new_data[:3, 1:], [[1, 2], [2, 4], [3, 6]])
+    np.testing.assert_allclose(new_data[3:, 1:], [[4 / 3, 4 / 3], [5 / 3, 5 / 3]])
+    np.testing.assert_array_equal(source, [0, 0, 0, 2, 2])
+
+
+def test_interpolate_keyframes_spline():
+    frames = np.array([0, 3, 5, 9], float)
+    data = np.c_[frames, frames**2, frames**3]
+    new_data, _ = tracks.interpolate_keyframes(data, np.zeros(4, int), "spline")
+    np.testing.assert_array_equal(new_data[:, 0], [1, 2, 4, 6, 7, 8])
+    np.testing.assert_allclose(new_data[:, 1], new_data[:, 0] ** 2)
+    np.testing.assert_allclose(new_data[:, 2], new_data[:, 0] ** 3)
+
+
+def test_interpolate_keyframes_invalid_method():
+    with pytest.raises(ValueError):
+        tracks.interpolate_keyframes(np.zeros((2, 3)), np.zeros(2), "nearest")
+
+
+def _segments(data, keys, frame, radius):
+    """Brute-force reference for Trajectories.segments."""
+    segments = []
+    for key in np.unique(keys):
+        mask = (keys == key) & (np.abs(data[:, 0] - frame) <= radius)
+        points = data[mask][np.argsort(data[mask, 0])]
+        for start, end in zip(points[:-1], points[1:]):
+            segments.append((key, *start[1:], *end[1:]))
+    return sorted(segments)
+
+
+def _as_list(trajectories, frame, radius):
+    segments, keys = trajectories.segments(frame, radius)
+    return sorted((key, *seg.ravel()) for key, seg in zip(keys, segments))
+
+
+def test_trajectories_edits():
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 50, 200)
+    keys = rng.integers(0, 5, 200)
+    _, unique = np.unique(keys * 100 + frames, return_index=True)
+    data = np.c_[frames[unique], rng.random((len(unique), 2))]
+    keys = keys[unique]
+    trajectories = tracks.Trajectories(data, keys)
+    assert _as_list(trajectories, 20, 5) == _segments(data, keys, 20, 5)
+
+    rows = np.array([3, 7])
+    data[rows, 1:] = rng.random((2, 2))
+    trajectories.move(rows, data[rows, 1:])
+    assert _as_list(trajectories, 20, 50) == _segments(data, keys, 20, 50)
+
+    rows = np.array([2, 5, len(data) + 2])
+    new_data = np.c_[[62, 61, 60], rng.random((3, 2))]
+    new_keys = np.array([1, 1, 9])
+    data = np.insert(data, rows - np.arange(3), new_data, axis=0)
+    keys = np.insert(keys, rows - np.arange(3), new_keys)
+    trajectories.insert(rows, new_data, new_keys)
+    assert _as_list(trajectories, 55, 10) == _segments(data, keys, 55, 10)
+
+    rows = np.array([0, 10, len(data) - 1])
+    data = np.delete(data, rows, axis=0)
+    keys = np.delete(keys, rows)
+    trajectories.delete(rows)
+    data[0, 1:] = 9
+    trajectories.move(np.array([0]), data[:1, 1:])
+    assert len(trajectories) == len(data)
+    assert _as_list(trajectories, 25, 40) == _segments(data, keys, 25, 40)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import yaml
+from dlclabel import misc, validate
+from skimage.io import imsave
+
+
+def _make_project(root, config):
+    with open(root / "config.yaml", "w") as file:
+        yaml.safe_dump(config, file)
+    folder = root / "labeled-data" / "video"
+    folder.mkdir(parents=True)
+    for i in range(2):
+        image = np.zeros((40, 50), dtype=np.uint8)
+        imsave(str(folder / f"img{i}.png"), image, check_contrast=False)
+    header = misc.DLCHeader.from_config(config)
+    index = pd.MultiIndex.from_tuples(
+        [("labeled-data", "video", f"img{i}.png") for i in range(3)]
+    )
+    df = pd.DataFrame(10.0, index=index, columns=header.columns)
+    df.iloc[1, 0] = 60  # x beyond the image width
+    df.to_hdf(folder / "CollectedData_user.h5", key="df_with_missing")
+
+
+def test_validate_project(tmp_path, config):
+    cfg = dict(config, multianimalproject=True)
+    _make_project(tmp_path, cfg)
+    report = validate.validate_project(str(tmp_path / "config.yaml"))
+    assert list(report.columns) == validate.REPORT_COLUMNS
+    assert sorted(report["check"]) == ["missing_image", "out_of_bounds"]
+    issue = report.set_index("check").loc["out_of_bounds"]
+    assert issue["image"] == "labeled-data/video/img1.png"
+    assert (issue["individual"], issue["bodypart"]) == ("ind1", "a")
+
+    # Bodyparts renamed in the config
+    cfg["multianimalbodyparts"] = ["a", "d"]
+    with open(tmp_path / "config.yaml", "w") as file:
+        yaml.safe_dump(cfg, file)
+    report = validate.validate_project(str(tmp_path / "config.yaml"))
+    unknown = report[report["check"] == "unknown_keypoint"]
+    assert set(unknown["bodypart"]) == {"b"}
+    assert (report["check"] == "missing_keypoint").sum() == 2
+
+
+def test_check_paths():
+    folder = "/root/labeled-data/video"
+    images = [f"{folder}/img0.png", f"{folder}/img1.png"]
+    paths = [
+        "labeled-data/video/img1.png",
+        "labeled-data\\video\\img0.png",
+        "labeled-data/other/img0.png",
+        "labeled-data/video\\img0.png",
+        "other/video/img0.png",
+    ]
+    issues, inds = validate.check_paths(paths, folder, images)
+    # Images of the same name elsewhere are not matched
+    np.testing.assert_array_equal(inds, [1, 0, -1, -1, -1])
+    issues = pd.concat(issues)
+    checks = issues["check"].tolist()
+    assert checks == [
+        "invalid_path",
+        "mixed_separators",
+        "wrong_folder",
+        "missing_image",
+    ]
+    assert issues["image"].iloc[-1] == "other/video/img0.png"
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from dlclabel import analysis
+from napari.components import Dims
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+from dlclabel.widgets import KeypointsDropdownMenu, LabelingProgress
+from test_layers import _make_layer, _make_windowed_layer
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    return QApplication.instance() or QApplication([])
+
+
+def _check_states(menu):
+    labels = [
+        model.item(i).data(Qt.CheckStateRole)
+        for model in menu._label_models.values()
+        for i in range(model.rowCount())
+    ]
+    ids = [
+        menu._id_model.item(i).data(Qt.CheckStateRole)
+        for i in range(menu._id_model.rowCount())
+    ]
+    return labels, ids
+
+
+def test_dropdown_annotation_state(qapp, config, monkeypatch):
+    layer = _make_layer(config)
+    menu = KeypointsDropdownMenu(layer)
+    checked, partial, unchecked = Qt.Checked, Qt.PartiallyChecked, Qt.Unchecked
+    assert _check_states(menu) == ([checked] * 5, [checked] * 3)
+    layer._slice_dims([1, 0, 0])
+    n_refreshes = 0
+    refresh = menu.refresh_annotation_state
+
+    def count_refreshes(*args):
+        nonlocal n_refreshes
+        n_refreshes += 1
+        refresh(*args)
+
+    monkeypatch.setattr(menu, "refresh_annotation_state", count_refreshes)
+
+    # The second and third keypoints of frame 1 are removed
+    layer.selected_data = {6, 7}
+    layer.remove_selected()
+    expected = [checked, unchecked, unchecked, checked, checked]
+    assert _check_states(menu) == (expected, [partial, partial, checked])
+    layer.undo()
+    assert _check_states(menu) == ([checked] * 5, [checked] * 3)
+    layer.redo()
+    layer.current_keypoint = layer.all_keypoints[1]
+    layer.add([1, 3, 3])
+    expected = [checked, checked, unchecked, checked, checked]
+    assert _check_states(menu) == (expected, [checked, partial, checked])
+    # Edits only update the states of the keypoints they affected
+    assert n_refreshes == 0
+
+    # Edits in other frames leave the states alone
+    layer.selected_data = {0}
+    layer.remove_selected()
+    assert _check_states(menu) == (expected, [checked, partial, checked])
+    layer._slice_dims([0, 0, 0])
+    assert n_refreshes == 1
+    expected = [unchecked, checked, checked, checked, checked]
+    assert _check_states(menu) == (expected, [partial, checked, checked])
+
+
+def _make_progress(layer, n_frames):
+    dims = Dims(ndim=3)
+    dims.set_range(0, (0, n_frames, 1))
+    return LabelingProgress(SimpleNamespace(dims=dims), layer, n_frames)
+
+
+def _states(progress):
+    model = progress.model()
+    states = {color.rgb(): state for state, color in model.colors.items()}
+    brushes = [
+        model.index(frame).data(Qt.BackgroundRole) for frame in range(len(model.states))
+    ]
+    return [
+        analysis.UNLABELED if brush is None else states[brush.color().rgb()]
+        for brush in brushes
+    ]
+
+
+def test_labeling_progress(qapp, config):
+    layer = _make_layer(config)
+    progress = _make_progress(layer, 5)
+    # Frames are rows of the model, not widget items
+    assert progress.model().rowCount() == 5
+    labeled, unlabeled = analysis.LABELED, analysis.UNLABELED
+    assert _states(progress) == [labeled] * 3 + [unlabeled] * 2
+    layer.selected_data = set(np.flatnonzero(layer.data[:, 0] == 1).tolist())
+    layer.remove_selected()
+    assert _states(progress) == [labeled, unlabeled, labeled, unlabeled, unlabeled]
+    tooltip = progress.model().index(1).data(Qt.ToolTipRole)
+    assert tooltip == "Frame 1: unlabeled"
+    progress.viewer.dims.set_current_step(0, 2)
+    assert progress.currentIndex().row() == 2
+
+
+def test_labeling_progress_windowed(qapp, tmp_path, config):
+    layer = _make_windowed_layer(tmp_path, config)
+    window = layer.metadata["window"]
+    progress = _make_progress(layer, 30)
+    # States of the frames outside of the window are read from the file;
+    # likelihoods of frame 0 are below pcutoff.
+    expected = [analysis.LOW_CONFIDENCE] + [analysis.LABELED] * 29
+    assert _states(progress) == expected
+
+    layer.selected_data = set(np.flatnonzero(layer.data[:, 0] == 3).tolist())
+    layer.remove_selected()
+    expected[3] = analysis.UNLABELED
+    assert _states(progress) == expected
+    # Paging in another window keeps the edits of the former one
+    layer._slice_dims([25, 0, 0])
+    layer.load_window()
+    assert window.current == 2
+    assert _states(progress) == expected
+    assert _states(_make_progress(layer, 30)) == expected
+    window.close()